@@ -0,0 +1,219 @@
+"""Pre-aggregated API usage: request counts per endpoint, user and status in time buckets.
+
+Each worker counts requests in memory and every ANALYTICS_FLUSH_INTERVAL
+seconds adds them to Redis with HINCRBY, in one pipeline. Each bucket is one
+hash (`analytics:<bucket seconds>:<bucket start>`). Every request is counted at
+each resolution (per minute, hour and day by default). Each resolution's hashes
+expire after its own retention, so older data is only kept in coarser buckets.
+/analytics then reads one hash per bucket in the range, never the raw logs.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+import redis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANALYTICS_PREFIX = "analytics"
+
+# (bucket seconds, retention seconds), finest first
+DEFAULT_RESOLUTIONS = "60:86400,3600:2592000,86400:31536000"
+RESOLUTION_NAMES = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Hash fields per bucket are "total" and "<dimension>:<value>"; dimension -> response group
+DIMENSIONS = {"endpoint": "endpoints", "user": "users", "status": "statuses"}
+
+def parse_resolutions(spec):
+    """Parses "60:86400,3600:2592000" into [(60, 86400), (3600, 2592000)], finest first."""
+    resolutions = []
+    for item in spec.split(","):
+        seconds, _, retention = item.strip().partition(":")
+        resolutions.append((int(seconds), int(retention)))
+    return sorted(resolutions)
+
+class UsageAnalytics:
+    """Counts requests per bucket in memory and flushes them to Redis in the background."""
+
+    def __init__(self, client, resolutions=None, flush_interval=1.0, max_buckets=1440):
+        self.client = client
+        self.resolutions = resolutions or parse_resolutions(DEFAULT_RESOLUTIONS)
+        self.flush_interval = flush_interval
+        self.max_buckets = max_buckets
+        self._counts = Counter()  # (bucket seconds, bucket start, field) -> requests
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._flusher_pid = None
+        self.recorded = 0
+        self.flushes = 0
+        self.fields_written = 0
+        self.flush_errors = 0
+
+    @staticmethod
+    def bucket_key(seconds, bucket):
+        return f"{ANALYTICS_PREFIX}:{seconds}:{bucket}"
+
+    # ===================== RECORDING =====================
+
+    def record(self, endpoint, user_id, status, now=None):
+        """Counts one request; never touches Redis."""
+        now = time.time() if now is None else now
+        user_id = user_id or "-"
+        fields = ("total", f"endpoint:{endpoint}", f"user:{user_id}", f"status:{status}",
+                  f"user_endpoint:{user_id} {endpoint}")
+        with self._lock:
+            for seconds, _ in self.resolutions:
+                bucket = int(now // seconds * seconds)
+                for field in fields:
+                    self._counts[(seconds, bucket, field)] += 1
+            self.recorded += 1
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        """Starts the background flusher once per worker process."""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="analytics-flusher", daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Adds the counts gathered since the last flush to Redis in one pipeline; returns fields written."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+            if not counts:
+                return 0
+            retention = dict(self.resolutions)
+            expires = {}
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for (seconds, bucket, field), requests in counts.items():
+                    key = self.bucket_key(seconds, bucket)
+                    pipe.hincrby(key, field, requests)
+                    expires[key] = (bucket + seconds + retention[seconds]) * 1000
+                for key, expire_at in expires.items():
+                    pipe.pexpireat(key, expire_at)
+                pipe.execute()
+            except redis.exceptions.RedisError as e:
+                # Keep the counts for the next flush rather than losing them
+                self.flush_errors += 1
+                with self._lock:
+                    self._counts.update(counts)
+                logger.error(f"Failed to flush usage analytics ({len(counts)} counters): {str(e)}")
+                return 0
+            self.flushes += 1
+            self.fields_written += len(counts)
+            return len(counts)
+
+    # ===================== QUERIES =====================
+
+    def plan(self, start, end, resolution=None):
+        """Returns (bucket seconds, bucket starts) for a range; raises ValueError if it cannot be served.
+
+        Without a resolution, picks the finest one that still retains `start`
+        and needs at most max_buckets buckets.
+        """
+        if end < start:
+            raise ValueError("end must not be before start")
+        now = time.time()
+        if resolution is not None and resolution not in dict(self.resolutions):
+            raise ValueError(f"resolution must be one of {', '.join(str(s) for s, _ in self.resolutions)} seconds")
+        for seconds, retention in self.resolutions:
+            if resolution is not None and seconds != resolution:
+                continue
+            first = int(start // seconds * seconds)
+            buckets = list(range(first, int(end) + 1, seconds))
+            if resolution is None and (start < now - retention or len(buckets) > self.max_buckets):
+                continue  # Too old or too many buckets here; downsample to the next resolution
+            if len(buckets) > self.max_buckets:
+                raise ValueError(f"Range spans more than {self.max_buckets} buckets of {seconds} seconds")
+            return seconds, buckets
+        raise ValueError(f"Range spans more than {self.max_buckets} buckets at every resolution")
+
+    def query(self, start, end, resolution=None, user=None):
+        """Per-bucket counts for [start, end]: one HGETALL per bucket, in one pipeline."""
+        seconds, buckets = self.plan(start, end, resolution)
+        pipe = self.client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(self.bucket_key(seconds, bucket))
+        return format_buckets(seconds, buckets, pipe.execute(), user)
+
+    async def query_async(self, client, start, end, resolution=None, user=None):
+        """Async counterpart of query using the redis.asyncio client."""
+        seconds, buckets = self.plan(start, end, resolution)
+        async with client.pipeline(transaction=False) as pipe:
+            for bucket in buckets:
+                pipe.hgetall(self.bucket_key(seconds, bucket))
+            replies = await pipe.execute()
+        return format_buckets(seconds, buckets, replies, user)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._counts)
+        return {
+            'retention_seconds': {str(seconds): retention for seconds, retention in self.resolutions},
+            'flush_interval': self.flush_interval,
+            'recorded': self.recorded,
+            'pending_counters': pending,
+            'flushes': self.flushes,
+            'fields_written': self.fields_written,
+            'flush_errors': self.flush_errors
+        }
+
+def _empty_counts():
+    return {'total': 0, 'endpoints': {}, 'users': {}, 'statuses': {}, 'user_endpoints': {}}
+
+def _add_field(counts, field, requests, user):
+    kind, _, name = field.partition(":")
+    if kind == "total":
+        counts['total'] += requests
+    elif kind == "user_endpoint":
+        user_id, _, endpoint = name.rpartition(" ")
+        if user is None or user_id == user:
+            per_user = counts['user_endpoints'].setdefault(user_id, {})
+            per_user[endpoint] = per_user.get(endpoint, 0) + requests
+    elif kind in DIMENSIONS and (kind != "user" or user is None or name == user):
+        group = counts[DIMENSIONS[kind]]
+        group[name] = group.get(name, 0) + requests
+
+def format_buckets(seconds, buckets, replies, user=None):
+    """Shapes HGETALL replies into the /analytics response, with totals over the range.
+
+    With `user`, per-user counts are limited to that user (totals and per-endpoint
+    counts stay global; a user's endpoints are under `user_endpoints`).
+    """
+    totals = _empty_counts()
+    rows = []
+    for bucket, fields in zip(buckets, replies):
+        counts = _empty_counts()
+        for field, requests in (fields or {}).items():
+            _add_field(counts, field, int(requests), user)
+            _add_field(totals, field, int(requests), user)
+        rows.append({'start': bucket, **counts})
+    return {'resolution': seconds, 'start': buckets[0], 'end': buckets[-1] + seconds, 'buckets': rows, 'totals': totals}
+
+def create_usage_analytics(client):
+    """Builds the analytics recorder from ANALYTICS_* environment variables; None if disabled."""
+    if os.environ.get('ANALYTICS_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return None
+    analytics = UsageAnalytics(
+        client,
+        resolutions=parse_resolutions(os.environ.get('ANALYTICS_RESOLUTIONS', DEFAULT_RESOLUTIONS)),
+        flush_interval=float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 1.0)),
+        max_buckets=int(os.environ.get('ANALYTICS_MAX_BUCKETS', 1440))
+    )
+    atexit.register(analytics.flush)
+    return analytics
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = "always"
+FSYNC_EVERYSEC = "everysec"
+FSYNC_NO = "no"
+
+class AppendOnlyFile:
+    """JSON-lines append-only log of write commands for the embedded store.
+
+    fsync policy mirrors Redis' appendfsync: `always` fsyncs on every write,
+    `everysec` fsyncs from a background thread once a second and `no` leaves it
+    to the OS. When the file has grown by `rewrite_percentage` since the last
+    rewrite (and is at least `rewrite_min_size` bytes) it is compacted in a
+    background thread; writes arriving meanwhile are buffered and appended to
+    the new file before it replaces the old one.
+
+    The rewrite thread walks the dataset in chunks through
+    `snapshot_fn(cursor, skip)`, which is called with the store lock held and
+    returns `(commands, next_cursor)` (0 when done) for the keys it passes that
+    are not in `skip`, so no single step holds the lock for the whole keyspace.
+    To keep the result a point-in-time image, the store hands a key's pre-write
+    state to `add_snapshot()` before changing a key the walk has not reached.
+    """
+
+    def __init__(self, path, lock, snapshot_fn, fsync=FSYNC_EVERYSEC,
+                 rewrite_min_size=64 * 1024 * 1024, rewrite_percentage=100):
+        self.path = path
+        self.fsync = fsync
+        self.rewrite_min_size = rewrite_min_size
+        self.rewrite_percentage = rewrite_percentage
+        self._lock = lock  # The store's lock; held by callers of append()
+        self._snapshot_fn = snapshot_fn
+        self._file = open(path, "a", encoding="utf-8")
+        self._base_size = self._file.tell()
+        self._rewrite_buffer = None
+        self._rewrite_snapshot = None  # Pre-write key images handed over by the store mid-rewrite
+        self.rewrite_cursor = None     # First position the rewrite walk has not reached (None once done)
+        self.rewrite_seen = set()      # Keys already handed over through add_snapshot
+        self._dirty = False
+        self.rewrites = 0
+        self.last_rewrite_seconds = None
+        if fsync == FSYNC_EVERYSEC:
+            threading.Thread(target=self._fsync_loop, name="aof-fsync", daemon=True).start()
+
+    def load(self, apply_fn):
+        """Replays every logged command through apply_fn; a torn final line is ignored."""
+        replayed = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    command = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring truncated AOF entry at line {line_number}")
+                    break
+                apply_fn(command)
+                replayed += 1
+        logger.info(f"Loaded {replayed} commands from {self.path}")
+        return replayed
+
+    def append(self, command):
+        """Logs one write command. Must be called with the store lock held."""
+        line = json.dumps(command, separators=(",", ":")) + "\n"
+        self._file.write(line)
+        if self._rewrite_buffer is not None:
+            self._rewrite_buffer.append(line)
+        if self.fsync == FSYNC_ALWAYS:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        elif self.fsync == FSYNC_NO:
+            self._file.flush()
+        else:
+            self._dirty = True
+        self._maybe_rewrite()
+
+    def _fsync_loop(self):
+        while True:
+            time.sleep(1)
+            with self._lock:
+                if not self._dirty or self._file.closed:
+                    continue
+                self._file.flush()
+                self._dirty = False
+                fileno = self._file.fileno()
+            # fsync outside the lock so writers are not held up by disk latency
+            try:
+                os.fsync(fileno)
+            except OSError as e:
+                logger.error(f"AOF fsync failed: {str(e)}")
+
+    def _maybe_rewrite(self):
+        if self._rewrite_buffer is not None:
+            return
+        size = self._file.tell()
+        if size < self.rewrite_min_size:
+            return
+        if size < self._base_size * (1 + self.rewrite_percentage / 100):
+            return
+        self.start_rewrite()
+
+    @property
+    def rewriting(self):
+        return self._rewrite_buffer is not None
+
+    def start_rewrite(self):
+        """Begins a background rewrite. Must be called with the store lock held."""
+        if self._rewrite_buffer is not None:
+            return False
+        self._rewrite_buffer = []
+        self._rewrite_snapshot = []
+        self.rewrite_cursor = 0
+        self.rewrite_seen = set()
+        threading.Thread(target=self._rewrite, name="aof-rewrite", daemon=True).start()
+        return True
+
+    def add_snapshot(self, key, commands):
+        """Adds commands rebuilding a key's pre-write state ([] if absent) to the rewrite. Call with the store lock held."""
+        self.rewrite_seen.add(key)
+        self._rewrite_snapshot.extend(commands)
+
+    def _next_snapshot_chunk(self, cursor):
+        """One step of the walk under the store lock: (commands, next_cursor)."""
+        with self._lock:
+            commands, next_cursor = self._snapshot_fn(cursor, self.rewrite_seen)
+            commands.extend(self._rewrite_snapshot)
+            self._rewrite_snapshot = []
+            self.rewrite_cursor = next_cursor or None
+            return commands, next_cursor
+
+    def _rewrite(self):
+        started = time.monotonic()
+        temp_path = f"{self.path}.rewrite"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                cursor = 0
+                while True:
+                    commands, cursor = self._next_snapshot_chunk(cursor)
+                    # Serialized and written without the lock, so writers only wait for the chunk copy
+                    f.writelines(json.dumps(command, separators=(",", ":")) + "\n" for command in commands)
+                    if cursor == 0:
+                        break
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self._lock:
+                with open(temp_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(command, separators=(",", ":")) + "\n"
+                                 for command in self._rewrite_snapshot)
+                    f.writelines(self._rewrite_buffer)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._file.close()
+                os.replace(temp_path, self.path)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._base_size = self._file.tell()
+                self._rewrite_buffer = None
+                self._rewrite_snapshot = None
+                self.rewrite_seen = set()
+                self._dirty = False
+            self.rewrites += 1
+            self.last_rewrite_seconds = round(time.monotonic() - started, 3)
+            logger.info(f"AOF rewrite finished in {self.last_rewrite_seconds}s ({self._base_size} bytes)")
+        except OSError as e:
+            logger.error(f"AOF rewrite failed: {str(e)}")
+            with self._lock:
+                self._rewrite_buffer = None
+                self._rewrite_snapshot = None
+                self.rewrite_seen = set()
+
+    def close(self):
+        """Flushes and fsyncs the log."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'fsync': self.fsync,
+            'size': self._file.tell() if not self._file.closed else None,
+            'rewrite_in_progress': self._rewrite_buffer is not None,
+            'rewrites': self.rewrites,
+            'last_rewrite_seconds': self.last_rewrite_seconds
+        }
@@ -1,12 +1,22 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 import redis
 import json
-import time
 import logging
-import os
-from config import redis_client
-from auth import validate_api_key, generate_api_key, get_api_role, log_api_request
+import threading
+import time
+from config import redis_client, near_cache, queue_service, event_hub, value_compressor, memory_analyzer, usage_analytics, keyspace_transfer, readiness
+from auth import authenticate_request, generate_api_key, revoke_api_key, get_api_role, read_api_logs
 from health import health_bp
+from events import parse_event_args
+from serialization import NegotiatingJSONProvider, NegotiatingRequest
+from sharding import CrossShardError
+from replicas import bind_caller
+from transfer import FORMATS, IMPORT_CHUNK_BYTES, ImportInterrupted
+from metrics import metrics_bp, observe_request, observe_auth_check, update_pool_metrics
+from commands import (
+    CommandError, build_command, format_result, parse_scan_args, parse_log_args, parse_dequeue_args,
+    parse_memory_report_args, parse_analytics_args, parse_export_args, parse_import_args, run_batch, validate_values, written_keys, WRITE_KEY_ARGS, BATCH_MAX_COMMANDS, BATCH_MAX_BYTES
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -14,49 +24,118 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_url_path='', static_folder='static')
 
+# JSON through orjson, or msgpack when the client asks for it (Accept / Content-Type)
+app.json = NegotiatingJSONProvider(app)
+app.request_class = NegotiatingRequest
+
 # Register blueprints
 app.register_blueprint(health_bp)
+app.register_blueprint(metrics_bp)
+
+def _unavailable_response():
+    """503 with a Retry-After hint from the startup check or the circuit breaker."""
+    retry_after = max(1, int(readiness.retry_after() + 0.5))
+    return {"error": "Database connection error. Please try again later."}, 503, {"Retry-After": str(retry_after)}
 
 # Redis operation wrapper for error handling
-def redis_operation(operation_func, max_retries=3, retry_delay=1):
-    """Wrapper to handle Redis operations with error handling and retry logic"""
-    # For Railway deployment, we might need more retries
-    if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_SERVICE_ID'):
-        max_retries = 5  # More retries for Railway environment
-        retry_delay = 2  # Longer delay between retries
-    
-    for attempt in range(max_retries):
-        try:
-            return operation_func()
-        except redis.exceptions.ConnectionError as e:
-            logger.error(f"Redis connection error (attempt {attempt+1}/{max_retries}): {str(e)}")
-            # Check if we're in Railway environment for better error messages
-            if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_SERVICE_ID'):
-                logger.error("Railway deployment detected. Ensure Redis plugin is properly configured.")
-            
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying operation in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                return {"error": "Database connection error. Please try again later."}, 503
-        except redis.exceptions.RedisError as e:
-            logger.error(f"Redis error: {str(e)}")
-            return {"error": "Database operation failed. Please try again later."}, 500
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            return {"error": "An unexpected error occurred. Please try again later."}, 500
+def redis_operation(operation_func):
+    """Wrapper to handle Redis operations with error handling.
+
+    Never sleeps: failures are counted by the circuit breaker in config's client,
+    and while it is open calls fail fast with a 503 instead of pinning the worker.
+    """
+    try:
+        return operation_func()
+    except redis.exceptions.ConnectionError as e:
+        logger.error(f"Redis connection error: {str(e)}")
+        return _unavailable_response()
+    except CrossShardError as e:
+        # Keys (or a transaction) spanning shards; the caller has to split the request
+        return {"error": str(e)}, 400
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Redis error: {str(e)}")
+        return {"error": "Database operation failed. Please try again later."}, 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return {"error": "An unexpected error occurred. Please try again later."}, 500
+
+# Routes and hooks that talk to Redis outside redis_operation still answer 503, not 500
+@app.errorhandler(redis.exceptions.ConnectionError)
+def handle_redis_unavailable(e):
+    logger.error(f"Redis connection error: {str(e)}")
+    return _unavailable_response()
+
+# 🔹 Middleware: Request timing for /metrics (registered first so it also covers auth)
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is not None:
+        observe_request(request.endpoint, request.method, response.status_code, time.perf_counter() - started)
+        update_pool_metrics(redis_client)
+    readiness.mark_request()
+    return response
+
+# Endpoints served before Redis has answered (they do not need it, or report on it)
+UNGATED_ENDPOINTS = ["serve_ui", "static", "health.health_check", "health.liveness", "health.readiness_check", "metrics.metrics"]
+
+# 🔹 Middleware: Fast 503s until the background startup check has reached Redis
+@app.before_request
+def require_redis_ready():
+    readiness.start()  # No-op unless this process was forked after import
+    if not readiness.ready and request.endpoint not in UNGATED_ENDPOINTS:
+        return _unavailable_response()
+
+# 🔹 Middleware: Usage analytics (counted in memory, flushed to Redis in the background)
+@app.after_request
+def record_usage(response):
+    if usage_analytics is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "(unmatched)"
+        usage_analytics.record(endpoint, g.get("api_user"), response.status_code)
+    return response
 
 # 🔹 Middleware: Require API Key for Protected Routes
 @app.before_request
 def require_api_key():
-    """Validates API key before processing any request (except key generation & UI access)."""
-    if request.endpoint not in ["generate_key", "serve_ui", "static"]:
+    """Validates API key before processing any request (except key generation, UI access, health & metrics)."""
+    # Attributes this request's writes to its key for read-your-writes routing (replicas.py)
+    bind_caller(request.headers.get("X-API-Key"))
+    if request.endpoint not in ["generate_key", *UNGATED_ENDPOINTS]:
         api_key = request.headers.get("X-API-Key")
-        if not api_key or not validate_api_key(api_key):
+        started = time.perf_counter()
+        try:
+            # Validates the key and logs the request (one script call on a cache miss, none on a hit)
+            metadata = authenticate_request(api_key, request.path) if api_key else None
+        finally:
+            observe_auth_check(time.perf_counter() - started)
+        if not metadata:
             return jsonify({"error": "Unauthorized. Invalid API Key"}), 401
+        g.api_user = metadata.get("user_id")
 
-        # Log API Request
-        log_api_request(api_key, request.path)
+def execute_command(name, args):
+    """Validates and runs one command from the shared table, shaping the reply like the HTTP API."""
+    args = args or {}
+    try:
+        call = build_command({**args, "command": name}, get_api_role(request.headers.get("X-API-Key")))
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    def operation():
+        method, *params = value_compressor.pack_call(call)
+        if near_cache is not None and name in ("get", "hget"):
+            result = getattr(near_cache, name)(*params)
+        else:
+            result = getattr(redis_client, method)(*params)
+            if near_cache is not None and name in WRITE_KEY_ARGS:
+                near_cache.invalidate_written(args[WRITE_KEY_ARGS[name]])
+        result = value_compressor.unpack_reply(method, result)
+        body, status = format_result(name, args, result)
+        return jsonify(body), status
+
+    return redis_operation(operation)
 
 # 🔹 Web UI Route (Serves `index.html`)
 @app.route("/")
@@ -81,98 +160,212 @@ def generate_key():
         
     return redis_operation(operation)
 
+# 🔹 API Key Revocation Route
+@app.route("/revoke_key", methods=["POST"])
+def revoke_key():
+    """Revokes an API key and evicts it from every worker's cache (Admin only)."""
+    api_key = request.headers.get("X-API-Key")
+    if get_api_role(api_key) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
+
+    data = request.get_json()
+    target_key = data.get("api_key")
+    if not target_key:
+        return jsonify({"error": "api_key is required"}), 400
+
+    def operation():
+        if revoke_api_key(target_key):
+            return jsonify({"message": "API key revoked"}), 200
+        return jsonify({"error": "API key not found"}), 404
+
+    return redis_operation(operation)
+
 # ===================== API LOGGING & ADMIN FEATURES =====================
 
 @app.route("/logs", methods=["GET"])
 def get_api_logs():
-    """Retrieve the last 50 API request logs (Admin only)."""
+    """Retrieve API request logs newest first, paged by time range (Admin only).
+
+    Query params: `start`/`end` (unix seconds), `count` (default 50, max 1000)
+    and `cursor` (the `next_cursor` from the previous page).
+    """
     api_key = request.headers.get("X-API-Key")
     
     # 🔹 Ensure the API Key belongs to an Admin
     if get_api_role(api_key) != "admin":
         return jsonify({"error": "Forbidden. Admin access required"}), 403
 
-    # 🔹 Fetch last 50 API logs from Redis
-    logs = redis_client.lrange("api_logs", -50, -1)
-    logs = [json.loads(log) for log in logs] if logs else []
+    try:
+        start, end, count, cursor = parse_log_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
 
-    return jsonify({"logs": logs}), 200
+    def operation():
+        # 🔹 Fetch a page of API logs from the capped stream
+        logs, next_cursor = read_api_logs(start=start, end=end, count=count, before=cursor)
+        return jsonify({"logs": logs, "next_cursor": next_cursor}), 200
 
-# ===================== BASIC REDIS OPERATIONS =====================
+    return redis_operation(operation)
 
-@app.route("/set", methods=["POST"])
-def set_key():
-    """Sets a key-value pair in Redis with optional TTL."""
-    data = request.get_json()
-    key = data.get("key")
-    value = data.get("value")
-    ttl = data.get("ttl")
+@app.route("/memory_report", methods=["GET", "POST", "DELETE"])
+def memory_report():
+    """Keyspace memory by prefix and type, the biggest keys and TTLs (Admin only).
 
-    if not key or not value:
-        return jsonify({"error": "Key and value are required"}), 400
+    POST starts a background walk (body: optional `match` glob and `top`),
+    GET returns the latest report with its progress and DELETE cancels a walk.
+    """
+    if get_api_role(request.headers.get("X-API-Key")) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
 
-    if ttl is not None:
-        redis_client.setex(key, ttl, value)
+    if request.method == "POST":
+        try:
+            match, top = parse_memory_report_args(request.get_json(silent=True) or {}, memory_analyzer.top)
+        except CommandError as e:
+            return jsonify({"error": e.message}), e.status
+
+        def operation():
+            report = memory_analyzer.start(match=match, top=top)
+            if report is None:
+                return jsonify({"error": "A memory analysis is already running"}), 409
+            return jsonify(report.to_dict()), 202
+    elif request.method == "DELETE":
+        def operation():
+            if memory_analyzer.cancel():
+                return jsonify({"message": "Memory analysis cancelled"}), 200
+            return jsonify({"error": "No memory analysis is running"}), 404
     else:
-        redis_client.set(key, value)
+        def operation():
+            report = memory_analyzer.report()
+            if report is None:
+                return jsonify({"error": "No memory analysis has run yet"}), 404
+            return jsonify(report), 200
+
+    return redis_operation(operation)
+
+@app.route("/analytics", methods=["GET"])
+def analytics():
+    """Request counts per endpoint, user and status in time buckets (Admin only).
 
-    return jsonify({"message": f"Stored '{key}' successfully!"}), 200
+    Query params: `start`/`end` (unix seconds, default the last hour),
+    `resolution` (minute, hour, day; default the finest one covering the range)
+    and `user` to narrow per-user counts to one user.
+    """
+    if get_api_role(request.headers.get("X-API-Key")) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
+    if usage_analytics is None:
+        return jsonify({"error": "Usage analytics are disabled"}), 404
+
+    try:
+        start, end, resolution, user = parse_analytics_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    def operation():
+        try:
+            return jsonify(usage_analytics.query(start, end, resolution, user)), 200
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    return redis_operation(operation)
+
+@app.route("/export", methods=["GET"])
+def export_keyspace():
+    """Streams the keyspace as DUMP payloads with their expiry, one SCAN page at a time (Admin only).
+
+    Query params: `format` (ndjson or binary), `match` (glob) and `cursor` (the
+    last checkpoint of an interrupted export, to resume from). See transfer.py.
+    """
+    if get_api_role(request.headers.get("X-API-Key")) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
+
+    try:
+        fmt, cursor, match = parse_export_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    stream = keyspace_transfer.export(redis_client, fmt, cursor, match)
+    return Response(stream_with_context(stream), mimetype=FORMATS[fmt].mimetype)
+
+@app.route("/import", methods=["POST"])
+def import_keyspace():
+    """Restores an /export stream (or an RDB file converted by rdb.py) while it uploads (Admin only).
+
+    Query params: `replace=1` to overwrite existing keys (by default they are
+    kept) and `after` (a checkpoint) to skip what an interrupted import applied.
+    """
+    if get_api_role(request.headers.get("X-API-Key")) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
+
+    replace, after = parse_import_args(request.args)
+    chunks = iter(lambda: request.stream.read(IMPORT_CHUNK_BYTES), b"")
+
+    def operation():
+        try:
+            # Restored keys may be cached by any worker's near-cache (including misses for new keys)
+            written = near_cache.invalidate_written if near_cache is not None else None
+            progress = keyspace_transfer.import_stream(redis_client, chunks, replace, after, written)
+        except ImportInterrupted as e:
+            return jsonify({**e.progress, "error": e.message}), e.status
+        if not progress['complete']:
+            return jsonify({**progress, "error": "Stream ended before its end marker; resend it with ?after=<checkpoint>"}), 400
+        return jsonify(progress), 200
+
+    return redis_operation(operation)
+
+# ===================== BASIC REDIS OPERATIONS =====================
+
+@app.route("/set", methods=["POST"])
+def set_key():
+    """Sets a key-value pair in Redis with optional TTL."""
+    return execute_command("set", request.get_json())
 
 @app.route("/get", methods=["GET"])
 def get_key():
     """Retrieves a key's value from Redis."""
-    key = request.args.get("key")
-
-    if not key:
-        return jsonify({"error": "Key is required"}), 400
-
-    value = redis_client.get(key)
-    return json.dumps({"key": key, "value": value}), 200, {"Content-Type": "application/json"} if value else jsonify({"error": "Key not found"}), 404
+    return execute_command("get", request.args)
 
 @app.route("/list_keys", methods=["GET"])
 def list_keys():
-    """Lists all keys stored in Redis."""
-    keys = redis_client.keys("*")
-    return jsonify({"keys": keys}), 200
+    """Lists keys with cursor-based SCAN instead of blocking KEYS.
+
+    Query params: `cursor` (default 0), `count` (SCAN hint, default 100, max 1000),
+    `match` (glob pattern), `type` (string/hash/list/...) and `stream=1` to receive
+    the whole keyspace as NDJSON, one key per line, without buffering it.
+    """
+    try:
+        cursor, count, match, key_type = parse_scan_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    if request.args.get("stream") in ("1", "true"):
+        def generate():
+            for key in redis_client.scan_iter(match=match, count=count, _type=key_type):
+                yield json.dumps({"key": key}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    def operation():
+        next_cursor, keys = redis_client.scan(cursor=cursor, match=match, count=count, _type=key_type)
+        return jsonify({"keys": keys, "cursor": int(next_cursor), "complete": int(next_cursor) == 0}), 200
+
+    return redis_operation(operation)
 
 @app.route("/delete", methods=["DELETE"])
 def delete_key():
     """Deletes a key from Redis (Admin only)."""
-    api_key = request.headers.get("X-API-Key")
-    if get_api_role(api_key) != "admin":
-        return jsonify({"error": "Forbidden. Admin access required"}), 403
-
-    data = request.get_json()
-    key = data.get("key")
-
-    if redis_client.exists(key):
-        redis_client.delete(key)
-        return jsonify({"message": f"Deleted '{key}' successfully!"}), 200
-    else:
-        return jsonify({"error": "Key not found"}), 404
+    return execute_command("delete", request.get_json())
 
 # ===================== TTL (Expiration) Management =====================
 
 @app.route("/expire", methods=["POST"])
 def set_expiration():
     """Sets an expiration time (TTL) for a key in Redis."""
-    data = request.get_json()
-    key = data.get("key")
-    ttl = data.get("ttl")
-
-    if redis_client.exists(key):
-        redis_client.expire(key, ttl)
-        return jsonify({"message": f"TTL set for '{key}' to {ttl} seconds"}), 200
-    else:
-        return jsonify({"error": "Key not found"}), 404
+    return execute_command("expire", request.get_json())
 
 @app.route("/ttl", methods=["GET"])
 def get_ttl():
     """Gets the remaining TTL of a key in Redis."""
-    key = request.args.get("key")
-    ttl = redis_client.ttl(key)
-
-    return jsonify({"key": key, "ttl": ttl}) if ttl >= 0 else jsonify({"error": "No TTL set or key not found"}), 404
+    return execute_command("ttl", request.args)
 
 # ===================== ADVANCED REDIS FEATURES =====================
 
@@ -180,60 +373,258 @@ def get_ttl():
 @app.route("/incr", methods=["POST"])
 def increment_key():
     """Increments a numeric value by 1."""
-    data = request.get_json()
-    key = data.get("key")
-
-    new_value = redis_client.incr(key)
-    return jsonify({"key": key, "value": new_value}), 200
+    return execute_command("incr", request.get_json())
 
 @app.route("/decr", methods=["POST"])
 def decrement_key():
     """Decrements a numeric value by 1."""
-    data = request.get_json()
-    key = data.get("key")
-
-    new_value = redis_client.decr(key)
-    return jsonify({"key": key, "value": new_value}), 200
+    return execute_command("decr", request.get_json())
 
 # 🔹 Hash Storage (HSET & HGET)
 @app.route("/hset", methods=["POST"])
 def hset():
     """Sets a field in a Redis Hash."""
-    data = request.get_json()
-    hash_name = data.get("hash")
-    field = data.get("field")
-    value = data.get("value")
-
-    redis_client.hset(hash_name, field, value)
-    return jsonify({"message": f"Stored field '{field}' in hash '{hash_name}'"}), 200
+    return execute_command("hset", request.get_json())
 
 @app.route("/hget", methods=["GET"])
 def hget():
     """Retrieves a field from a Redis Hash."""
-    hash_name = request.args.get("hash")
-    field = request.args.get("field")
-
-    value = redis_client.hget(hash_name, field)
-    return jsonify({"hash": hash_name, "field": field, "value": value}) if value else jsonify({"error": "Field not found"}), 404
+    return execute_command("hget", request.args)
 
 # 🔹 Queue System Using Redis Lists
 @app.route("/enqueue", methods=["POST"])
 def enqueue():
-    """Adds an item to a queue (Redis List)."""
-    data = request.get_json()
-    queue_name = data.get("queue")
-    value = data.get("value")
+    """Adds an item to a queue (Redis List). Body: {"queue", "value"} or {"queue", "values": [...]}"""
+    data = request.get_json() or {}
+    queue = data.get("queue")
+    if "values" in data:
+        values = data.get("values")
+        if not queue or not isinstance(values, list) or not values:
+            return jsonify({"error": "Queue and a non-empty 'values' list are required"}), 400
+        if len(values) > BATCH_MAX_COMMANDS:
+            return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} items"}), 413
+    else:
+        try:
+            _, queue, value = build_command({**data, "command": "enqueue"}, get_api_role(request.headers.get("X-API-Key")))
+        except CommandError as e:
+            return jsonify({"error": e.message}), e.status
+        values = [value]
 
-    redis_client.rpush(queue_name, value)
-    return jsonify({"message": f"Enqueued '{value}' to queue '{queue_name}'"}), 200
+    def operation():
+        length = queue_service.enqueue(queue, values)
+        if "values" not in data:
+            body, status = format_result("enqueue", data, length)
+            return jsonify(body), status
+        return jsonify({"message": f"Enqueued {len(values)} items to queue '{queue}'", "length": length}), 200
+
+    return redis_operation(operation)
 
 @app.route("/dequeue", methods=["GET"])
 def dequeue():
-    """Removes and returns the first item from a queue (Redis List)."""
-    queue_name = request.args.get("queue")
+    """Removes and returns the first item from a queue (Redis List).
+
+    Optional query params: count (batch pop), wait (long-poll seconds),
+    consumer and visibility (reliable mode: items stay in flight until /ack).
+    """
+    if not any(name in request.args for name in ("count", "wait", "consumer", "visibility")):
+        return execute_command("dequeue", request.args)
+
+    queue = request.args.get("queue")
+    if not queue:
+        return jsonify({"error": "Queue is required"}), 400
+    try:
+        count, wait, consumer, visibility = parse_dequeue_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    def operation():
+        items = queue_service.dequeue(queue, count, wait, consumer, visibility)
+        if not items:
+            return jsonify({"error": "Queue is empty"}), 404
+        body = {"queue": queue}
+        if "count" in request.args:
+            body["values"] = items
+        else:
+            body["value"] = items[0]
+        if consumer:
+            body["consumer"] = consumer
+        return jsonify(body), 200
+
+    return redis_operation(operation)
+
+@app.route("/ack", methods=["POST"])
+def ack():
+    """Acknowledges items taken in reliable mode. Body: {"queue", "consumer", "value"} or "values": [...]"""
+    data = request.get_json() or {}
+    queue, consumer = data.get("queue"), data.get("consumer")
+    values = data.get("values") if "values" in data else [data.get("value")]
+    if not queue or not consumer or not isinstance(values, list) or not values or None in values:
+        return jsonify({"error": "Queue, consumer and value (or values) are required"}), 400
+    if len(values) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} items"}), 413
+
+    def operation():
+        acked = queue_service.ack(queue, consumer, values)
+        if not acked:
+            return jsonify({"error": "No matching in-flight item"}), 404
+        return jsonify({"queue": queue, "consumer": consumer, "acked": acked}), 200
+
+    return redis_operation(operation)
+
+@app.route("/queue_stats", methods=["GET"])
+def queue_stats():
+    """Depth, in-flight items and consumer state for a queue."""
+    queue = request.args.get("queue")
+    if not queue:
+        return jsonify({"error": "Queue is required"}), 400
+
+    def operation():
+        return jsonify(queue_service.queue_stats(queue)), 200
+
+    return redis_operation(operation)
+
+# 🔹 Live Updates (Server-Sent Events)
+@app.route("/events", methods=["GET"])
+def events():
+    """Streams keyspace changes and queue pushes as SSE.
+
+    Query: pattern (repeatable glob, default *), types (key,queue) and
+    policy (coalesce or drop) for when the client reads slower than events arrive.
+    """
+    try:
+        patterns, types, policy = parse_event_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ready = threading.Event()
+    subscriber = event_hub.subscribe(patterns, types, policy, ready.set)
+    if subscriber is None:
+        return jsonify({"error": "Too many event subscribers on this worker"}), 503, {"Retry-After": "5"}
+
+    def wait(timeout):
+        notified = ready.wait(timeout)
+        ready.clear()
+        return notified
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(event_hub.stream(subscriber, wait)), mimetype="text/event-stream", headers=headers)
+
+# ===================== BATCH OPERATIONS =====================
+
+def _batch_payload():
+    """Returns the JSON body of a batch request, or an error response if it is too large."""
+    if request.content_length and request.content_length > BATCH_MAX_BYTES:
+        return None, (jsonify({"error": f"Request body exceeds {BATCH_MAX_BYTES} bytes"}), 413)
+    return request.get_json() or {}, None
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    """Runs an array of commands in one pipeline, optionally as a MULTI/EXEC transaction.
+
+    Body: {"commands": [{"command": "set", "key": "a", "value": "1"}, ...], "transaction": false}
+    """
+    data, error = _batch_payload()
+    if error:
+        return error
+    role = get_api_role(request.headers.get("X-API-Key"))
+
+    def operation():
+        try:
+            results = run_batch(redis_client, data.get("commands"), role, transaction=bool(data.get("transaction")),
+                                compressor=value_compressor)
+        except CommandError as e:
+            return jsonify({"error": e.message}), e.status
+        if near_cache is not None:
+            near_cache.invalidate_written(*written_keys(data.get("commands")))
+        return jsonify({"results": results}), 200
+
+    return redis_operation(operation)
+
+@app.route("/mset", methods=["POST"])
+def mset():
+    """Sets several keys at once. Body: {"items": {"key": "value", ...}}"""
+    data, error = _batch_payload()
+    if error:
+        return error
+    items = data.get("items")
+
+    if not isinstance(items, dict) or not items:
+        return jsonify({"error": "'items' must be a non-empty object"}), 400
+    if len(items) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} keys"}), 413
+    try:
+        validate_values(items)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    def operation():
+        redis_client.mset(value_compressor.pack_mapping(items))
+        if near_cache is not None:
+            near_cache.invalidate_written(*items)
+        return jsonify({"message": f"Stored {len(items)} keys successfully!"}), 200
+
+    return redis_operation(operation)
+
+@app.route("/mget", methods=["GET"])
+def mget():
+    """Retrieves several keys at once. Query: ?key=a&key=b"""
+    keys = request.args.getlist("key")
+
+    if not keys:
+        return jsonify({"error": "At least one key is required"}), 400
+    if len(keys) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} keys"}), 413
+
+    def operation():
+        values = value_compressor.unpack_reply("mget", redis_client.mget(keys))
+        return jsonify({"values": dict(zip(keys, values))}), 200
+
+    return redis_operation(operation)
+
+@app.route("/hmset", methods=["POST"])
+def hmset():
+    """Sets several fields in a Redis Hash. Body: {"hash": "h", "fields": {"f": "v", ...}}"""
+    data, error = _batch_payload()
+    if error:
+        return error
+    hash_name = data.get("hash")
+    fields = data.get("fields")
+
+    if not isinstance(hash_name, str) or not hash_name or not isinstance(fields, dict) or not fields:
+        return jsonify({"error": "'hash' and a non-empty 'fields' object are required"}), 400
+    if len(fields) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} fields"}), 413
+    try:
+        validate_values(fields)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    def operation():
+        redis_client.hset(hash_name, mapping=value_compressor.pack_mapping(fields))
+        if near_cache is not None:
+            near_cache.invalidate_written(hash_name)
+        return jsonify({"message": f"Stored {len(fields)} fields in hash '{hash_name}'"}), 200
+
+    return redis_operation(operation)
+
+@app.route("/hmget", methods=["GET"])
+def hmget():
+    """Retrieves several fields from a Redis Hash. Query: ?hash=h&field=a&field=b"""
+    hash_name = request.args.get("hash")
+    fields = request.args.getlist("field")
+
+    if not hash_name or not fields:
+        return jsonify({"error": "'hash' and at least one 'field' are required"}), 400
+    if len(fields) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} fields"}), 413
+
+    def operation():
+        values = value_compressor.unpack_reply("hmget", redis_client.hmget(hash_name, fields))
+        return jsonify({"hash": hash_name, "values": dict(zip(fields, values))}), 200
+
+    return redis_operation(operation)
 
-    value = redis_client.lpop(queue_name)
-    return jsonify({"queue": queue_name, "value": value}) if value else jsonify({"error": "Queue is empty"}), 404
+readiness.mark_imported()
 
 if __name__ == "__main__":
     app.run(debug=True)
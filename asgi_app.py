@@ -0,0 +1,556 @@
+"""Async ASGI entry point serving the same routes as app.py on redis.asyncio.
+
+Run with: uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+"""
+from quart import Quart, Response, Request, g, request, jsonify, send_from_directory, has_request_context
+import asyncio
+import redis
+import json
+import logging
+import os
+from config import create_async_redis_client, event_hub, value_compressor, usage_analytics, keyspace_transfer, readiness, near_cache
+from circuit_breaker import redis_breaker
+from scripts import scripts
+from sharding import CrossShardError
+from replicas import bind_caller
+from transfer import FORMATS, ImportInterrupted
+from near_cache import publish_invalidations_async
+from memory_analyzer import AsyncMemoryAnalyzer, create_memory_analyzer
+from auth import (
+    authenticate_request_async, get_api_role_async, generate_api_key_async,
+    revoke_api_key_async, read_api_logs_async, get_api_key_cache_stats, get_api_log_stats
+)
+from events import parse_event_args
+from serialization import NegotiatingJSONProvider, MSGPACK_MIMETYPES, JSON_MIMETYPE, preferred_mimetype, decode_msgpack
+from commands import (
+    ROUTES, CommandError, build_command, format_result, parse_scan_args, parse_log_args,
+    parse_memory_report_args, parse_analytics_args, parse_export_args, parse_import_args, prepare_batch, queue_calls, collect_results, validate_values, BATCH_MAX_COMMANDS, BATCH_MAX_BYTES
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AsgiJSONProvider(NegotiatingJSONProvider):
+    """NegotiatingJSONProvider reading the Accept header from Quart's request context."""
+
+    def response_mimetype(self):
+        if not has_request_context():
+            return JSON_MIMETYPE
+        return preferred_mimetype(request.accept_mimetypes)
+
+class AsgiRequest(Request):
+    """Quart request whose get_json() also accepts msgpack bodies."""
+
+    def __init__(self, method, scheme, path, *args, max_content_length=None, **kwargs):
+        super().__init__(method, scheme, path, *args, max_content_length=max_content_length, **kwargs)
+        if path == "/import":
+            # Streamed, so no size limit. Quart has no backpressure: whatever Redis has not
+            # restored yet stays buffered here (under gunicorn, app.py reads from the socket instead)
+            self.body = self.body_class(None, None)
+
+    async def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype not in MSGPACK_MIMETYPES:
+            return await super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return decode_msgpack(await self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            return self.on_json_loading_failed(e)
+
+app = Quart(__name__, static_url_path='', static_folder='static')
+
+# JSON through orjson, or msgpack when the client asks for it (Accept / Content-Type)
+app.json = AsgiJSONProvider(app)
+app.request_class = AsgiRequest
+
+# One pooled redis.asyncio client per process, shared by every in-flight request
+redis_client = create_async_redis_client()
+
+# Admin-triggered keyspace memory walks, run as tasks on this process' loop (see memory_analyzer.py)
+memory_analyzer = create_memory_analyzer(redis_client, AsyncMemoryAnalyzer)
+
+def _unavailable_response():
+    """503 with a Retry-After hint from the startup check or the circuit breaker."""
+    retry_after = max(1, int(readiness.retry_after() + 0.5))
+    return jsonify({"error": "Database connection error. Please try again later."}), 503, {"Retry-After": str(retry_after)}
+
+async def redis_operation(operation_func):
+    """Async counterpart of app.redis_operation: maps Redis failures to JSON errors without blocking."""
+    try:
+        return await operation_func()
+    except redis.exceptions.ConnectionError as e:
+        logger.error(f"Redis connection error: {str(e)}")
+        return _unavailable_response()
+    except CrossShardError as e:
+        # Keys (or a transaction) spanning shards; the caller has to split the request
+        return jsonify({"error": str(e)}), 400
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Redis error: {str(e)}")
+        return jsonify({"error": "Database operation failed. Please try again later."}), 500
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": "An unexpected error occurred. Please try again later."}), 500
+
+@app.errorhandler(redis.exceptions.ConnectionError)
+async def handle_redis_unavailable(e):
+    logger.error(f"Redis connection error: {str(e)}")
+    return _unavailable_response()
+
+async def admin_required():
+    """Returns a 403 response unless the caller's API key has the admin role."""
+    if await get_api_role_async(redis_client, request.headers.get("X-API-Key")) != "admin":
+        return jsonify({"error": "Forbidden. Admin access required"}), 403
+    return None
+
+# Endpoints served before Redis has answered (they do not need it, or report on it)
+UNGATED_ENDPOINTS = ["serve_ui", "static", "health_check", "liveness", "readiness_check"]
+
+# 🔹 Middleware: Fast 503s until the background startup check has reached Redis
+@app.before_request
+async def require_redis_ready():
+    readiness.start()  # No-op unless this process was forked after import
+    if not readiness.ready and request.endpoint not in UNGATED_ENDPOINTS:
+        return _unavailable_response()
+
+# 🔹 Middleware: Require API Key for Protected Routes
+@app.before_request
+async def require_api_key():
+    """Validates API key before processing any request (except key generation, UI and health)."""
+    # Attributes this request's writes to its key for read-your-writes routing (replicas.py)
+    bind_caller(request.headers.get("X-API-Key"))
+    if request.endpoint not in ["generate_key", *UNGATED_ENDPOINTS]:
+        api_key = request.headers.get("X-API-Key")
+        metadata = await authenticate_request_async(redis_client, api_key, request.path) if api_key else None
+        if not metadata:
+            return jsonify({"error": "Unauthorized. Invalid API Key"}), 401
+        g.api_user = metadata.get("user_id")
+
+# 🔹 Middleware: Usage analytics (counted in memory, flushed to Redis by a background thread)
+@app.after_request
+async def record_usage(response):
+    if usage_analytics is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "(unmatched)"
+        usage_analytics.record(endpoint, g.get("api_user"), response.status_code)
+    return response
+
+# 🔹 Middleware: Startup timing (first request served, first one after Redis was ready)
+@app.after_request
+async def record_startup_timing(response):
+    readiness.mark_request()
+    return response
+
+@app.route("/")
+async def serve_ui():
+    """Serves the Web UI"""
+    return await send_from_directory("static", "index.html")
+
+@app.route("/health/live", methods=["GET"])
+async def liveness():
+    """Liveness: the worker is up and serving; never touches Redis."""
+    return jsonify({'status': 'alive'})
+
+@app.route("/health/ready", methods=["GET"])
+async def readiness_check():
+    """Readiness: 200 once Redis has answered and while the circuit breaker is closed, else 503."""
+    stats = readiness.stats()
+    if not stats['ready']:
+        retry_after = max(1, int(readiness.retry_after() + 0.5))
+        return jsonify(stats), 503, {'Retry-After': str(retry_after)}
+    return jsonify(stats)
+
+@app.route("/health", methods=["GET"])
+async def health_check():
+    """Health check endpoint to verify application and Redis status"""
+    status = {'status': 'ok', 'redis_connected': False, 'version': '1.0.0', 'mode': 'asgi'}
+    status['api_key_cache'] = get_api_key_cache_stats()
+    status['api_log_buffer'] = get_api_log_stats()
+    status['circuit_breaker'] = redis_breaker.stats()
+    status['scripts'] = scripts.stats()
+    status['value_compression'] = value_compressor.stats()
+    status['events'] = event_hub.stats()
+    if resp_server is not None:
+        status['resp'] = resp_server.stats()
+    if hasattr(redis_client, 'shard_stats'):
+        status['shards'] = redis_client.shard_stats()
+    if hasattr(redis_client, 'replica_stats'):
+        status['replicas'] = redis_client.replica_stats()
+    if usage_analytics is not None:
+        status['analytics'] = usage_analytics.stats()
+    status['transfer'] = keyspace_transfer.stats()
+    pool = getattr(redis_client, 'connection_pool', None)
+    if pool is not None:  # None for the embedded store and sharded backends
+        status['connection_pool'] = {
+            'max_connections': pool.max_connections,
+            'in_use': len(getattr(pool, '_in_use_connections', ()))
+        }
+    status['startup'] = readiness.stats()
+    if not readiness.ready:
+        status['status'] = 'starting'
+        status['redis_error'] = readiness.last_error
+        return jsonify(status)
+    try:
+        redis_info = await redis_client.info()
+        status['redis_connected'] = True
+        status['redis_version'] = redis_info.get('redis_version', 'unknown')
+    except redis.exceptions.RedisError as e:
+        status['status'] = 'degraded'
+        status['redis_error'] = str(e)
+    return jsonify(status)
+
+@app.route("/generate_key", methods=["POST"])
+async def generate_key():
+    """Generates an API key for a user."""
+    data = await request.get_json() or {}
+    user_id = data.get("user_id")
+    role = data.get("role", "user")
+
+    if not user_id or role not in ["admin", "user"]:
+        return jsonify({"error": "User ID is required and role must be 'admin' or 'user'"}), 400
+
+    async def operation():
+        api_key = await generate_api_key_async(redis_client, user_id, role)
+        return jsonify({"api_key": api_key, "role": role}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/revoke_key", methods=["POST"])
+async def revoke_key():
+    """Revokes an API key and evicts it from every worker's cache (Admin only)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+
+    data = await request.get_json() or {}
+    target_key = data.get("api_key")
+    if not target_key:
+        return jsonify({"error": "api_key is required"}), 400
+
+    async def operation():
+        if await revoke_api_key_async(redis_client, target_key):
+            return jsonify({"message": "API key revoked"}), 200
+        return jsonify({"error": "API key not found"}), 404
+
+    return await redis_operation(operation)
+
+@app.route("/logs", methods=["GET"])
+async def get_api_logs():
+    """Retrieve API request logs newest first, paged by time range (Admin only)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+
+    try:
+        start, end, count, cursor = parse_log_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    async def operation():
+        logs, next_cursor = await read_api_logs_async(redis_client, start=start, end=end, count=count, before=cursor)
+        return jsonify({"logs": logs, "next_cursor": next_cursor}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/analytics", methods=["GET"])
+async def analytics():
+    """Request counts per endpoint, user and status in time buckets (Admin only; see app.analytics)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+    if usage_analytics is None:
+        return jsonify({"error": "Usage analytics are disabled"}), 404
+
+    try:
+        start, end, resolution, user = parse_analytics_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    async def operation():
+        try:
+            return jsonify(await usage_analytics.query_async(redis_client, start, end, resolution, user)), 200
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    return await redis_operation(operation)
+
+@app.route("/memory_report", methods=["GET", "POST", "DELETE"])
+async def memory_report():
+    """Keyspace memory by prefix and type, the biggest keys and TTLs (Admin only; see app.memory_report)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+
+    if request.method == "POST":
+        try:
+            match, top = parse_memory_report_args(await request.get_json(silent=True) or {}, memory_analyzer.top)
+        except CommandError as e:
+            return jsonify({"error": e.message}), e.status
+
+        async def operation():
+            report = await memory_analyzer.start(match=match, top=top)
+            if report is None:
+                return jsonify({"error": "A memory analysis is already running"}), 409
+            return jsonify(report.to_dict()), 202
+    elif request.method == "DELETE":
+        async def operation():
+            if await memory_analyzer.cancel():
+                return jsonify({"message": "Memory analysis cancelled"}), 200
+            return jsonify({"error": "No memory analysis is running"}), 404
+    else:
+        async def operation():
+            report = await memory_analyzer.report()
+            if report is None:
+                return jsonify({"error": "No memory analysis has run yet"}), 404
+            return jsonify(report), 200
+
+    return await redis_operation(operation)
+
+@app.route("/export", methods=["GET"])
+async def export_keyspace():
+    """Streams the keyspace as DUMP payloads with their expiry (Admin only; see app.export_keyspace)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+
+    try:
+        fmt, cursor, match = parse_export_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    return Response(keyspace_transfer.export_async(redis_client, fmt, cursor, match), mimetype=FORMATS[fmt].mimetype)
+
+@app.route("/import", methods=["POST"])
+async def import_keyspace():
+    """Restores an /export stream while it uploads (Admin only; see app.import_keyspace)."""
+    forbidden = await admin_required()
+    if forbidden:
+        return forbidden
+
+    replace, after = parse_import_args(request.args)
+
+    async def operation():
+        try:
+            # Near-caches live in the sync workers (NEAR_CACHE_ENABLED); tell them which keys were restored
+            written = (lambda *keys: publish_invalidations_async(redis_client, keys)) if near_cache is not None else None
+            progress = await keyspace_transfer.import_stream_async(redis_client, request.body, replace, after, written)
+        except ImportInterrupted as e:
+            return jsonify({**e.progress, "error": e.message}), e.status
+        if not progress['complete']:
+            return jsonify({**progress, "error": "Stream ended before its end marker; resend it with ?after=<checkpoint>"}), 400
+        return jsonify(progress), 200
+
+    return await redis_operation(operation)
+
+@app.route("/list_keys", methods=["GET"])
+async def list_keys():
+    """Lists keys with cursor-based SCAN; `stream=1` streams NDJSON."""
+    try:
+        cursor, count, match, key_type = parse_scan_args(request.args)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    if request.args.get("stream") in ("1", "true"):
+        async def generate():
+            async for key in redis_client.scan_iter(match=match, count=count, _type=key_type):
+                yield json.dumps({"key": key}) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    async def operation():
+        next_cursor, keys = await redis_client.scan(cursor=cursor, match=match, count=count, _type=key_type)
+        return jsonify({"keys": keys, "cursor": int(next_cursor), "complete": int(next_cursor) == 0}), 200
+
+    return await redis_operation(operation)
+
+# 🔹 Live Updates (Server-Sent Events)
+@app.route("/events", methods=["GET"])
+async def events():
+    """Streams keyspace changes and queue pushes as SSE; idle subscribers cost no thread here."""
+    try:
+        patterns, types, policy = parse_event_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    subscriber = event_hub.subscribe(patterns, types, policy, lambda: loop.call_soon_threadsafe(ready.set))
+    if subscriber is None:
+        return jsonify({"error": "Too many event subscribers on this worker"}), 503, {"Retry-After": "5"}
+
+    async def generate():
+        try:
+            yield ": connected\n\n"
+            while True:
+                frames = event_hub.frames(subscriber)
+                for frame in frames:
+                    yield frame
+                if not frames:
+                    try:
+                        await asyncio.wait_for(ready.wait(), event_hub.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": ping\n\n"
+                    ready.clear()
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    response = Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    response.timeout = None  # Streams outlive Quart's default response timeout
+    return response
+
+# ===================== SINGLE-COMMAND ROUTES =====================
+
+def _make_command_view(name, from_query):
+    """Builds an async view for one entry of commands.ROUTES."""
+    async def view():
+        args = dict(request.args) if from_query else (await request.get_json() or {})
+        try:
+            role = await get_api_role_async(redis_client, request.headers.get("X-API-Key"))
+            method, *params = value_compressor.pack_call(build_command({**args, "command": name}, role))
+        except CommandError as e:
+            return jsonify({"error": e.message}), e.status
+
+        async def operation():
+            result = value_compressor.unpack_reply(method, await getattr(redis_client, method)(*params))
+            body, status = format_result(name, args, result)
+            return jsonify(body), status
+
+        return await redis_operation(operation)
+
+    view.__name__ = f"{name}_command"
+    return view
+
+for _path, (_method, _name) in ROUTES.items():
+    app.add_url_rule(_path, view_func=_make_command_view(_name, _method == "GET"), methods=[_method])
+
+# ===================== BATCH OPERATIONS =====================
+
+async def _batch_payload():
+    """Returns the JSON body of a batch request, or an error response if it is too large."""
+    if request.content_length and request.content_length > BATCH_MAX_BYTES:
+        return None, (jsonify({"error": f"Request body exceeds {BATCH_MAX_BYTES} bytes"}), 413)
+    return await request.get_json() or {}, None
+
+@app.route("/batch", methods=["POST"])
+async def batch():
+    """Runs an array of commands in one pipeline, optionally as a MULTI/EXEC transaction."""
+    data, error = await _batch_payload()
+    if error:
+        return error
+    role = await get_api_role_async(redis_client, request.headers.get("X-API-Key"))
+    transaction = bool(data.get("transaction"))
+
+    try:
+        calls = prepare_batch(data.get("commands"), role, transaction)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    async def operation():
+        async with redis_client.pipeline(transaction=transaction) as pipe:
+            queue_calls(pipe, calls, value_compressor)
+            replies = await pipe.execute(raise_on_error=False) if len(pipe) else []
+        return jsonify({"results": collect_results(calls, replies, value_compressor)}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/mset", methods=["POST"])
+async def mset():
+    """Sets several keys at once. Body: {"items": {"key": "value", ...}}"""
+    data, error = await _batch_payload()
+    if error:
+        return error
+    items = data.get("items")
+
+    if not isinstance(items, dict) or not items:
+        return jsonify({"error": "'items' must be a non-empty object"}), 400
+    if len(items) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} keys"}), 413
+    try:
+        validate_values(items)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    async def operation():
+        await redis_client.mset(value_compressor.pack_mapping(items))
+        return jsonify({"message": f"Stored {len(items)} keys successfully!"}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/mget", methods=["GET"])
+async def mget():
+    """Retrieves several keys at once. Query: ?key=a&key=b"""
+    keys = request.args.getlist("key")
+
+    if not keys:
+        return jsonify({"error": "At least one key is required"}), 400
+    if len(keys) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} keys"}), 413
+
+    async def operation():
+        values = value_compressor.unpack_reply("mget", await redis_client.mget(keys))
+        return jsonify({"values": dict(zip(keys, values))}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/hmset", methods=["POST"])
+async def hmset():
+    """Sets several fields in a Redis Hash. Body: {"hash": "h", "fields": {"f": "v", ...}}"""
+    data, error = await _batch_payload()
+    if error:
+        return error
+    hash_name = data.get("hash")
+    fields = data.get("fields")
+
+    if not isinstance(hash_name, str) or not hash_name or not isinstance(fields, dict) or not fields:
+        return jsonify({"error": "'hash' and a non-empty 'fields' object are required"}), 400
+    if len(fields) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} fields"}), 413
+    try:
+        validate_values(fields)
+    except CommandError as e:
+        return jsonify({"error": e.message}), e.status
+
+    async def operation():
+        await redis_client.hset(hash_name, mapping=value_compressor.pack_mapping(fields))
+        return jsonify({"message": f"Stored {len(fields)} fields in hash '{hash_name}'"}), 200
+
+    return await redis_operation(operation)
+
+@app.route("/hmget", methods=["GET"])
+async def hmget():
+    """Retrieves several fields from a Redis Hash. Query: ?hash=h&field=a&field=b"""
+    hash_name = request.args.get("hash")
+    fields = request.args.getlist("field")
+
+    if not hash_name or not fields:
+        return jsonify({"error": "'hash' and at least one 'field' are required"}), 400
+    if len(fields) > BATCH_MAX_COMMANDS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_COMMANDS} fields"}), 413
+
+    async def operation():
+        values = value_compressor.unpack_reply("hmget", await redis_client.hmget(hash_name, fields))
+        return jsonify({"hash": hash_name, "values": dict(zip(fields, values))}), 200
+
+    return await redis_operation(operation)
+
+# Optional RESP listener sharing this process's event loop and Redis pool
+resp_server = None
+
+@app.before_serving
+async def start_resp_listener():
+    """Starts the RESP listener when RESP_PORT is set."""
+    global resp_server
+    if os.environ.get('RESP_PORT'):
+        from resp_server import RespServer
+        resp_server = RespServer(redis_client)
+        await resp_server.start()
+
+@app.after_serving
+async def close_redis_pool():
+    """Releases pooled connections on shutdown."""
+    await redis_client.aclose()
+
+readiness.mark_imported()
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -1,16 +1,109 @@
 import secrets
-import json
 import time
 import logging
+import os
+import threading
 import redis
 from config import redis_client
+from cache import TTLCache, MISSING
+from request_log import create_request_log_buffer
+from keyspace import poll_messages
+from scripts import scripts
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 API_KEY_PREFIX = "apikey:"  # Prefix for storing API keys in Redis
-API_LOGS_KEY = "api_logs"   # Redis key for storing API logs
+API_LOGS_KEY = "api_logs:stream"  # Capped Redis stream for storing API logs
+API_KEY_INVALIDATION_CHANNEL = "apikey:invalidate"  # Pub/sub channel for cross-worker cache invalidation
+
+# Per-worker cache of API key metadata (user_id, role); unknown keys are cached as {}
+api_key_cache = TTLCache(
+    max_entries=int(os.environ.get('API_KEY_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('API_KEY_CACHE_TTL', 60))
+)
+
+# Per-worker buffer; entries are written to API_LOGS_KEY in pipelined batches
+request_log_buffer = create_request_log_buffer(redis_client, API_LOGS_KEY)
+
+_listener_lock = threading.Lock()
+_listener_pid = None
+
+def _invalidation_listener():
+    """Drops cached API keys announced on the invalidation channel (runs in a daemon thread)."""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(API_KEY_INVALIDATION_CHANNEL)
+            # Anything published while we were disconnected was missed; force re-validation
+            api_key_cache.expire_all()
+            for message in poll_messages(pubsub):
+                if message.get("type") != "message":
+                    continue
+                if message["data"] == "*":
+                    api_key_cache.clear()
+                else:
+                    api_key_cache.invalidate(message["data"])
+        except Exception as e:
+            logger.warning(f"API key invalidation listener error: {str(e)}")
+            # Keep entries as stale fallbacks for while Redis is unreachable
+            api_key_cache.expire_all()
+            time.sleep(1)
+
+def _ensure_invalidation_listener():
+    """Starts the invalidation listener once per worker process."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        threading.Thread(target=_invalidation_listener, name="apikey-invalidation", daemon=True).start()
+        _listener_pid = os.getpid()
+
+def get_api_key_metadata(api_key):
+    """Returns the stored hash for an API key ({} if unknown), served from the per-worker cache."""
+    _ensure_invalidation_listener()
+    metadata = api_key_cache.get(api_key)
+    if metadata is MISSING:
+        generation = api_key_cache.generation
+        try:
+            metadata = _lookup_api_key(api_key)
+        except redis.exceptions.ConnectionError as e:
+            return _stale_metadata(api_key, e)
+        # Skipped if a revocation arrived while the lookup was in flight
+        api_key_cache.set(api_key, metadata, generation=generation)
+    return metadata
+
+def _lookup_api_key(api_key):
+    """The key's stored hash ({} if unknown).
+
+    With read replicas (replicas.py) the lookup is a replica read, and an
+    unknown key is checked again on the primary before it is negatively
+    cached: a key created a moment ago may not have replicated yet.
+    """
+    redis_key = f"{API_KEY_PREFIX}{api_key}"
+    metadata = redis_client.hgetall(redis_key)
+    if not metadata and hasattr(redis_client, 'primary'):
+        metadata = redis_client.primary.hgetall(redis_key)
+    return metadata or {}
+
+def _stale_metadata(api_key, error):
+    """Falls back to the last known (expired) cache entry while Redis is unreachable.
+
+    Revoked keys were invalidated, not expired, so they never come back this way.
+    Re-raises the ConnectionError if the key was never seen by this worker.
+    """
+    metadata = api_key_cache.get_stale(api_key)
+    if metadata is MISSING:
+        raise error
+    logger.warning("Redis unavailable; using cached credentials for API key lookup")
+    return metadata
+
+def get_api_key_cache_stats():
+    """Returns hit/miss counters for the API key cache."""
+    return api_key_cache.stats()
 
 def generate_api_key(user_id, role="user"):
     """Generates and stores an API key for a user with a specified role (admin/user)."""
@@ -18,10 +111,12 @@ def generate_api_key(user_id, role="user"):
     redis_key = f"{API_KEY_PREFIX}{api_key}"
 
     try:
-        # 🔹 Store user ID and role separately in Redis
-        redis_client.hset(redis_key, "user_id", user_id)
-        redis_client.hset(redis_key, "role", role)
-        
+        # 🔹 Store user ID and role and announce the key in one atomic call;
+        # workers may hold a negative cache entry for it
+        scripts.call(redis_client, "create_api_key", [redis_key],
+                     [user_id, role, API_KEY_INVALIDATION_CHANNEL, api_key])
+        api_key_cache.invalidate(api_key)
+
         logger.info(f"Generated API Key for user {user_id} with role {role}")
         return api_key
     except redis.exceptions.ConnectionError as e:
@@ -33,24 +128,73 @@ def generate_api_key(user_id, role="user"):
         logger.error(f"Error generating API key: {str(e)}")
         return api_key
 
-def validate_api_key(api_key):
-    """Checks if the API key is valid."""
+def revoke_api_key(api_key):
+    """Deletes an API key and evicts it from every worker's cache. Returns True if it existed."""
     try:
-        exists = redis_client.exists(f"{API_KEY_PREFIX}{api_key}")
-        return exists
+        deleted = scripts.call(redis_client, "revoke_api_key", [f"{API_KEY_PREFIX}{api_key}"],
+                               [API_KEY_INVALIDATION_CHANNEL, api_key])
+        api_key_cache.invalidate(api_key)
+        logger.info(f"Revoked API Key {api_key[:4]}...")
+        return bool(deleted)
+    except Exception as e:
+        logger.error(f"Error revoking API key: {str(e)}")
+        raise
+
+def _authenticate_call(api_key, endpoint):
+    """KEYS and ARGV for the authenticate script."""
+    return ([f"{API_KEY_PREFIX}{api_key}", API_LOGS_KEY],
+            [request_log_buffer.maxlen, api_key, endpoint, int(time.time())])
+
+def _fields_to_dict(reply):
+    """Turns a flat [field, value, ...] script reply into a dict."""
+    return dict(zip(reply[0::2], reply[1::2]))
+
+def _buffer_log(api_key, endpoint, metadata):
+    request_log_buffer.enqueue({
+        "user_id": metadata.get("user_id"),
+        "api_key": api_key,
+        "endpoint": endpoint,
+        "timestamp": int(time.time())
+    })
+
+def authenticate_request(api_key, endpoint):
+    """Validates an API key and logs the request; returns the key's metadata ({} if invalid).
+
+    A cached key costs no round trip and its log entry is buffered. On a cache
+    miss one script call checks the key and appends the log entry atomically;
+    with read replicas the key is looked up on a replica and the entry buffered.
+    Raises ConnectionError when Redis is down and the key was never seen here.
+    """
+    _ensure_invalidation_listener()
+    metadata = api_key_cache.get(api_key)
+    if metadata is not MISSING:
+        if metadata:
+            _buffer_log(api_key, endpoint, metadata)
+        return metadata
+    generation = api_key_cache.generation
+    try:
+        if hasattr(redis_client, 'primary'):
+            metadata = _lookup_api_key(api_key)
+            if metadata:
+                _buffer_log(api_key, endpoint, metadata)
+        else:
+            metadata = _fields_to_dict(scripts.call(redis_client, "authenticate",
+                                                    *_authenticate_call(api_key, endpoint)))
     except redis.exceptions.ConnectionError as e:
-        logger.error(f"Redis connection error during API key validation: {str(e)}")
-        # Default to allowing the request if Redis is down
-        # This is a security trade-off to maintain availability
-        return True
+        metadata = _stale_metadata(api_key, e)
+        if metadata:
+            _buffer_log(api_key, endpoint, metadata)
+        return metadata
     except Exception as e:
-        logger.error(f"Error validating API key: {str(e)}")
-        return False
+        logger.error(f"Error authenticating API key: {str(e)}")
+        return {}
+    api_key_cache.set(api_key, metadata, generation=generation)
+    return metadata
 
 def get_api_role(api_key):
     """Retrieves the role associated with an API key (admin/user)."""
     try:
-        return redis_client.hget(f"{API_KEY_PREFIX}{api_key}", "role")
+        return get_api_key_metadata(api_key).get("role")
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Redis connection error during role retrieval: {str(e)}")
         # Default to user role if Redis is down
@@ -60,18 +204,9 @@ def get_api_role(api_key):
         return "user"
 
 def log_api_request(api_key, endpoint):
-    """Logs API requests in Redis with a timestamp."""
+    """Queues an API request log entry; a background flusher writes it to Redis."""
     try:
-        timestamp = int(time.time())  # Get current timestamp
-        user_id = redis_client.hget(f"{API_KEY_PREFIX}{api_key}", "user_id")
-
-        log_entry = {
-            "user_id": user_id,
-            "api_key": api_key,
-            "endpoint": endpoint,
-            "timestamp": timestamp
-        }
-        redis_client.rpush(API_LOGS_KEY, json.dumps(log_entry))  # Store log in Redis list
+        _buffer_log(api_key, endpoint, get_api_key_metadata(api_key))
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Redis connection error during API request logging: {str(e)}")
         # Silently fail - logging is non-critical
@@ -80,3 +215,126 @@ def log_api_request(api_key, endpoint):
         logger.error(f"Error logging API request: {str(e)}")
         # Silently fail - logging is non-critical
         pass
+
+def get_api_log_stats():
+    """Returns queue-depth and dropped-entry counters for the request log buffer."""
+    return request_log_buffer.stats()
+
+def read_api_logs(start=None, end=None, count=50, before=None):
+    """Returns (logs, next_cursor) newest first, limited to [start, end] unix seconds.
+
+    Pass the returned cursor as `before` to fetch the next (older) page.
+    """
+    max_id, min_id = _log_range(start, end, before)
+    entries = redis_client.xrevrange(API_LOGS_KEY, max=max_id, min=min_id, count=count)
+    return _format_log_page(entries, count)
+
+def _log_range(start, end, before):
+    """Converts unix-second bounds and a paging cursor into XREVRANGE max/min IDs."""
+    max_id = f"({before}" if before else (f"{int(end) * 1000 + 999}" if end is not None else "+")
+    min_id = f"{int(start) * 1000}" if start is not None else "-"
+    return max_id, min_id
+
+def _format_log_page(entries, count):
+    """Decodes stream entries into log dicts plus the cursor for the next page."""
+    logs = []
+    for entry_id, fields in entries:
+        log = dict(fields)
+        log["id"] = entry_id
+        log["timestamp"] = int(log.get("timestamp") or 0)
+        log["user_id"] = log.get("user_id") or None
+        logs.append(log)
+
+    next_cursor = entries[-1][0] if len(entries) == count else None
+    return logs, next_cursor
+
+# ===================== ASYNC VARIANTS (used by asgi_app.py) =====================
+# These share the key cache and log buffer above but take a redis.asyncio client.
+
+async def get_api_key_metadata_async(client, api_key):
+    """Async counterpart of get_api_key_metadata."""
+    _ensure_invalidation_listener()
+    metadata = api_key_cache.get(api_key)
+    if metadata is MISSING:
+        generation = api_key_cache.generation
+        try:
+            metadata = await _lookup_api_key_async(client, api_key)
+        except redis.exceptions.ConnectionError as e:
+            return _stale_metadata(api_key, e)
+        # Skipped if a revocation arrived while the lookup was in flight
+        api_key_cache.set(api_key, metadata, generation=generation)
+    return metadata
+
+async def _lookup_api_key_async(client, api_key):
+    """Async counterpart of _lookup_api_key."""
+    redis_key = f"{API_KEY_PREFIX}{api_key}"
+    metadata = await client.hgetall(redis_key)
+    if not metadata and hasattr(client, 'primary'):
+        metadata = await client.primary.hgetall(redis_key)
+    return metadata or {}
+
+async def authenticate_request_async(client, api_key, endpoint):
+    """Async counterpart of authenticate_request."""
+    _ensure_invalidation_listener()
+    metadata = api_key_cache.get(api_key)
+    if metadata is not MISSING:
+        if metadata:
+            _buffer_log(api_key, endpoint, metadata)
+        return metadata
+    generation = api_key_cache.generation
+    try:
+        if hasattr(client, 'primary'):
+            metadata = await _lookup_api_key_async(client, api_key)
+            if metadata:
+                _buffer_log(api_key, endpoint, metadata)
+        else:
+            metadata = _fields_to_dict(await scripts.call_async(client, "authenticate",
+                                                                *_authenticate_call(api_key, endpoint)))
+    except redis.exceptions.ConnectionError as e:
+        metadata = _stale_metadata(api_key, e)
+        if metadata:
+            _buffer_log(api_key, endpoint, metadata)
+        return metadata
+    except Exception as e:
+        logger.error(f"Error authenticating API key: {str(e)}")
+        return {}
+    api_key_cache.set(api_key, metadata, generation=generation)
+    return metadata
+
+async def get_api_role_async(client, api_key):
+    """Async counterpart of get_api_role."""
+    try:
+        return (await get_api_key_metadata_async(client, api_key)).get("role")
+    except Exception as e:
+        logger.error(f"Error getting API role: {str(e)}")
+        return "user"
+
+async def log_api_request_async(client, api_key, endpoint):
+    """Async counterpart of log_api_request; only the metadata lookup can touch Redis."""
+    try:
+        _buffer_log(api_key, endpoint, await get_api_key_metadata_async(client, api_key))
+    except Exception as e:
+        logger.error(f"Error logging API request: {str(e)}")
+
+async def generate_api_key_async(client, user_id, role="user"):
+    """Async counterpart of generate_api_key."""
+    api_key = secrets.token_hex(16)
+    await scripts.call_async(client, "create_api_key", [f"{API_KEY_PREFIX}{api_key}"],
+                             [user_id, role, API_KEY_INVALIDATION_CHANNEL, api_key])
+    api_key_cache.invalidate(api_key)
+    logger.info(f"Generated API Key for user {user_id} with role {role}")
+    return api_key
+
+async def revoke_api_key_async(client, api_key):
+    """Async counterpart of revoke_api_key."""
+    deleted = await scripts.call_async(client, "revoke_api_key", [f"{API_KEY_PREFIX}{api_key}"],
+                                       [API_KEY_INVALIDATION_CHANNEL, api_key])
+    api_key_cache.invalidate(api_key)
+    logger.info(f"Revoked API Key {api_key[:4]}...")
+    return bool(deleted)
+
+async def read_api_logs_async(client, start=None, end=None, count=50, before=None):
+    """Async counterpart of read_api_logs."""
+    max_id, min_id = _log_range(start, end, before)
+    entries = await client.xrevrange(API_LOGS_KEY, max=max_id, min=min_id, count=count)
+    return _format_log_page(entries, count)
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean in milliseconds for a list of durations in seconds."""
+    values = sorted(seconds)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    return {
+        'p50': round(percentile(values, 50) * 1000, 3),
+        'p95': round(percentile(values, 95) * 1000, 3),
+        'p99': round(percentile(values, 99) * 1000, 3),
+        'max': round(values[-1] * 1000, 3),
+        'mean': round(sum(values) / len(values) * 1000, 3)
+    }
+
+def run_metadata(**extra):
+    """Where and on what a run happened, so result files are comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': int(time.time()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        **extra
+    }
+
+def write_results(path, meta, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    logger.info(f"Wrote {len(results)} results to {path}")
+
+def compare_to_baseline(results, baseline_path, threshold, key_fields, checks):
+    """Returns a list of regression messages (empty when nothing slowed down beyond threshold).
+
+    `checks` maps a result field to "lower" (latency-like, must not grow) or
+    "higher" (throughput-like, must not shrink). Results are matched on key_fields.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {tuple(r.get(k) for k in key_fields): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        key = tuple(result.get(k) for k in key_fields)
+        old = previous.get(key)
+        if old is None:
+            continue
+        for field, better in checks.items():
+            new_value, old_value = _lookup(result, field), _lookup(old, field)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (better == "lower" and change > threshold) or (better == "higher" and -change > threshold):
+                regressions.append(f"{'/'.join(map(str, key))}: {field} {old_value} -> {new_value} ({change:+.1%})")
+    return regressions
+
+def _lookup(result, dotted):
+    value = result
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
@@ -0,0 +1,304 @@
+"""HTTP load test: runs the app under gunicorn and drives scenario mixes at fixed concurrency.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest                         # in-process Redis stand-in (fakeredis)
+    python -m benchmarks.loadtest --redis-url redis://localhost:6379/15
+    python -m benchmarks.loadtest --baseline old.json     # regression mode: exit 1 when slower
+    python -m benchmarks.loadtest --app asgi_app:app --worker-class uvicorn.workers.UvicornWorker --workers 1
+
+See benchmarks/README.md for the scenario format and the result file layout.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+from benchmarks.common import REPO_ROOT, latency_summary, run_metadata, write_results, compare_to_baseline
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "bench:"
+# Statuses that are a normal answer for the operation (missing key, empty queue)
+EXPECTED_STATUSES = {200, 404}
+
+# ===================== OPERATIONS =====================
+
+def _value(rng, size):
+    return "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=size))
+
+# op name -> builder(rng, scenario) returning (method, path, json body or None)
+OPERATIONS = {
+    "set": lambda rng, s: ("POST", "/set", {"key": f"{KEY_PREFIX}{rng.randrange(s['keyspace'])}",
+                                           "value": _value(rng, s['value_size'])}),
+    "get": lambda rng, s: ("GET", "/get?" + urlencode({"key": f"{KEY_PREFIX}{rng.randrange(s['keyspace'])}"}), None),
+    "hset": lambda rng, s: ("POST", "/hset", {"hash": f"{KEY_PREFIX}hash", "field": f"f{rng.randrange(s['keyspace'])}",
+                                             "value": _value(rng, s['value_size'])}),
+    "hget": lambda rng, s: ("GET", "/hget?" + urlencode({"hash": f"{KEY_PREFIX}hash",
+                                                        "field": f"f{rng.randrange(s['keyspace'])}"}), None),
+    "incr": lambda rng, s: ("POST", "/incr", {"key": f"{KEY_PREFIX}counter:{rng.randrange(s['keyspace'])}"}),
+    "enqueue": lambda rng, s: ("POST", "/enqueue", {"queue": f"{KEY_PREFIX}queue:{rng.randrange(s['keyspace'])}",
+                                                   "value": _value(rng, s['value_size'])}),
+    "dequeue": lambda rng, s: ("GET", "/dequeue?" + urlencode({"queue": f"{KEY_PREFIX}queue:{rng.randrange(s['keyspace'])}"}), None),
+    "list_keys": lambda rng, s: ("GET", "/list_keys?" + urlencode({"count": 100, "match": f"{KEY_PREFIX}*"}), None),
+}
+
+class Client:
+    """One keep-alive HTTP connection (reopened automatically when the server closes it)."""
+
+    def __init__(self, host, port, api_key=None):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["X-API-Key"] = api_key
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.conn.request(method, path, body=payload, headers=self.headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                self.conn.close()
+            return response.status, data
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+
+# ===================== SERVER =====================
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_standin(port=None):
+    """Starts fakeredis' TCP server in a thread (on port, or a free one); returns its redis:// URL."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("The in-process stand-in needs fakeredis>=2.24 (pip install fakeredis), or pass --redis-url")
+    port = port or _free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, name="redis-standin", daemon=True).start()
+    logger.info(f"Started in-process Redis stand-in on port {port}")
+    return f"redis://127.0.0.1:{port}/0"
+
+def launch_gunicorn(redis_url, workers, worker_class, threads, env_overrides, app="app:app"):
+    """Starts `gunicorn <app>` from the repo root without waiting. Returns (process, port, metrics dir)."""
+    port = _free_port()
+    metrics_dir = tempfile.mkdtemp(prefix="bench-metrics-")
+    # Worker class and threads go through the environment so gunicorn.conf.py sizes QUEUE_MAX_BLOCKING from them
+    env = dict(os.environ, REDIS_URL=redis_url, PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+               GUNICORN_WORKER_CLASS=worker_class, GUNICORN_THREADS=str(threads), **env_overrides)
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+        "-b", f"127.0.0.1:{port}", "--log-level", "warning", app
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env), port, metrics_dir
+
+def start_gunicorn(redis_url, workers, worker_class, threads, env_overrides, app="app:app"):
+    """Starts gunicorn and waits until /health/ready answers 200. Returns (process, port, metrics dir)."""
+    process, port, metrics_dir = launch_gunicorn(redis_url, workers, worker_class, threads, env_overrides, app)
+    client = Client("127.0.0.1", port)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn exited with status {process.returncode}")
+        try:
+            if client.request("GET", "/health/ready")[0] == 200:
+                logger.info(f"gunicorn ready on port {port} ({workers} x {worker_class}, {threads} threads)")
+                return process, port, metrics_dir
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not become ready within 60s")
+
+def stop_gunicorn(process, metrics_dir):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def redis_commands_total(host, port):
+    """Sums redis_commands_total over every command and worker from /metrics."""
+    status, body = Client(host, port).request("GET", "/metrics")
+    if status != 200:
+        return None
+    total = 0.0
+    for line in body.decode().splitlines():
+        if line.startswith("redis_commands_total{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+# ===================== SCENARIOS =====================
+
+def seed(client, scenario):
+    """Pre-populates the keys, hash fields and queues the mix reads from."""
+    keyspace, size = scenario['keyspace'], scenario['value_size']
+    rng = random.Random(0)
+    for start in range(0, keyspace, 1000):
+        chunk = range(start, min(start + 1000, keyspace))
+        client.request("POST", "/mset", {"items": {f"{KEY_PREFIX}{i}": _value(rng, size) for i in chunk}})
+        client.request("POST", "/hmset", {"hash": f"{KEY_PREFIX}hash", "fields": {f"f{i}": _value(rng, size) for i in chunk}})
+
+def run_level(host, port, api_key, scenario, concurrency, seed_value):
+    """Runs one scenario at one concurrency level for its duration; returns the result dict."""
+    names = sorted(scenario['mix'])
+    weights = [scenario['mix'][name] for name in names]
+    stop_at = time.monotonic() + scenario.get('warmup', 1) + scenario['duration']
+    record_from = time.monotonic() + scenario.get('warmup', 1)
+    samples = [[] for _ in range(concurrency)]  # per thread: (op, seconds, ok)
+
+    def worker(index):
+        rng = random.Random(seed_value * 1000 + index)
+        client = Client(host, port, api_key)
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            op = rng.choices(names, weights)[0]
+            method, path, body = OPERATIONS[op](rng, scenario)
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body)
+                ok = status in EXPECTED_STATUSES
+            except (OSError, http.client.HTTPException):
+                ok = False
+            elapsed = time.perf_counter() - started
+            if now >= record_from:
+                samples[index].append((op, elapsed, ok))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(max(record_from - time.monotonic(), 0))
+    commands_before = redis_commands_total(host, port)
+    for thread in threads:
+        thread.join()
+    commands_after = redis_commands_total(host, port)
+
+    flat = [sample for thread_samples in samples for sample in thread_samples]
+    by_op = {}
+    for op in names:
+        durations = [seconds for name, seconds, _ in flat if name == op]
+        by_op[op] = {'requests': len(durations), 'latency_ms': latency_summary(durations)}
+    requests = len(flat)
+    commands_per_request = None
+    if requests and commands_before is not None and commands_after is not None:
+        commands_per_request = round((commands_after - commands_before) / requests, 3)
+    return {
+        'scenario': scenario['name'],
+        'concurrency': concurrency,
+        'duration_s': scenario['duration'],
+        'requests': requests,
+        'errors': sum(1 for _, _, ok in flat if not ok),
+        'throughput_rps': round(requests / scenario['duration'], 1),
+        'latency_ms': latency_summary([seconds for _, seconds, _ in flat]),
+        'redis_commands_per_request': commands_per_request,
+        'operations': by_op
+    }
+
+def load_scenarios(path, only):
+    with open(path, "r", encoding="utf-8") as f:
+        scenarios = json.load(f)
+    for scenario in scenarios:
+        unknown = set(scenario['mix']) - set(OPERATIONS)
+        if unknown:
+            sys.exit(f"Scenario {scenario['name']}: unknown operations {sorted(unknown)}")
+        scenario.setdefault('keyspace', 1000)
+        scenario.setdefault('value_size', 64)
+    if only:
+        scenarios = [s for s in scenarios if s['name'] in only]
+    return scenarios
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=os.path.join(REPO_ROOT, "benchmarks", "scenarios.json"))
+    parser.add_argument("--scenario", action="append", help="Run only this scenario (repeatable)")
+    parser.add_argument("--concurrency", type=int, action="append", help="Override the scenario concurrency levels")
+    parser.add_argument("--duration", type=float, help="Override every scenario's duration in seconds")
+    parser.add_argument("--redis-url", help="Benchmark against this Redis (default: in-process stand-in)")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Shard over this many in-process stand-ins (REDIS_SHARD_URLS); "
+                             "for real servers pass --env REDIS_SHARD_URLS=... instead")
+    parser.add_argument("--app", default="app:app",
+                        help="WSGI/ASGI app to serve; asgi_app:app needs --worker-class uvicorn.workers.UvicornWorker")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the app, e.g. NEAR_CACHE_ENABLED=1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest-results.json")
+    parser.add_argument("--baseline", help="Previous result file; exit 1 if any scenario regressed")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs baseline (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios, args.scenario)
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    redis_url = args.redis_url or start_standin()
+    if args.shards:
+        env_overrides.setdefault("REDIS_SHARD_URLS", ",".join(
+            f"shard{i}={start_standin()}" for i in range(args.shards)))
+    process, port, metrics_dir = start_gunicorn(redis_url, args.workers, args.worker_class, args.threads,
+                                                env_overrides, args.app)
+    results = []
+    try:
+        admin = Client("127.0.0.1", port)
+        status, body = admin.request("POST", "/generate_key", {"user_id": "loadtest", "role": "admin"})
+        if status != 200:
+            sys.exit(f"Could not create an API key: {status} {body[:200]!r}")
+        api_key = json.loads(body)["api_key"]
+        seeder = Client("127.0.0.1", port, api_key)
+        for scenario in scenarios:
+            if args.duration:
+                scenario['duration'] = args.duration
+            seed(seeder, scenario)
+            for concurrency in args.concurrency or scenario['concurrency']:
+                result = run_level("127.0.0.1", port, api_key, scenario, concurrency, args.seed)
+                results.append(result)
+                latency = result['latency_ms']
+                logger.info(f"{scenario['name']} x{concurrency}: {result['throughput_rps']} req/s, "
+                            f"p50 {latency['p50']}ms p95 {latency['p95']}ms p99 {latency['p99']}ms, "
+                            f"{result['redis_commands_per_request']} Redis cmds/req, {result['errors']} errors")
+    finally:
+        stop_gunicorn(process, metrics_dir)
+
+    meta = run_metadata(
+        backend="redis" if args.redis_url else "standin",
+        shards=len(env_overrides["REDIS_SHARD_URLS"].split(",")) if "REDIS_SHARD_URLS" in env_overrides else 0,
+        app=args.app, workers=args.workers, worker_class=args.worker_class, threads=args.threads,
+        seed=args.seed, env=env_overrides
+    )
+    write_results(args.output, meta, results)
+
+    # 🔹 Regression mode
+    if args.baseline:
+        regressions = compare_to_baseline(
+            results, args.baseline, args.threshold, ("scenario", "concurrency"),
+            {"latency_ms.p95": "lower", "latency_ms.p99": "lower", "throughput_rps": "higher"}
+        )
+        for message in regressions:
+            logger.error(f"Regression: {message}")
+        if regressions:
+            return 1
+        logger.info(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
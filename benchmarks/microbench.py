@@ -0,0 +1,156 @@
+"""Microbenchmarks for the per-request hooks (require_api_key, log_api_request) and the codecs.
+
+Run from the repository root:
+
+    python -m benchmarks.microbench                       # in-process embedded engine, no network
+    python -m benchmarks.microbench --redis-url redis://localhost:6379/15
+    python -m benchmarks.microbench --baseline old.json   # regression mode: exit 1 when slower
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+
+# Set up logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def _configure(redis_url):
+    # Must run before the app modules are imported: config.py picks the backend at import time
+    if redis_url:
+        os.environ['REDIS_URL'] = redis_url
+        os.environ['STORAGE_BACKEND'] = 'redis'
+    else:
+        os.environ['STORAGE_BACKEND'] = 'embedded'
+        os.environ['EMBEDDED_AOF_PATH'] = ''
+
+def _bench(name, func, number, repeat):
+    """Best-of-repeat time per call, in microseconds."""
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    per_call = min(timings) / number
+    return {
+        'name': name,
+        'calls': number,
+        'us_per_call': round(per_call * 1e6, 3),
+        'calls_per_second': round(1 / per_call) if per_call else None
+    }
+
+def run(number, repeat):
+    from app import app, require_api_key
+    from auth import generate_api_key, log_api_request, request_log_buffer
+
+    valid_key = generate_api_key("microbench", "admin")
+    results = []
+
+    def auth_with(api_key, path="/get"):
+        context = app.test_request_context(path, headers={"X-API-Key": api_key} if api_key else {})
+
+        def call():
+            with context:
+                require_api_key()
+        return call
+
+    # Warm the per-worker key cache once, as a running worker would
+    auth_with(valid_key)()
+    request_log_buffer.drain()
+
+    # 🔹 Pushing and popping the request context alone, to subtract from the require_api_key numbers
+    context = app.test_request_context("/get", headers={"X-API-Key": valid_key})
+
+    def push_pop():
+        with context:
+            pass
+    results.append(_bench("request_context.overhead", push_pop, number, repeat))
+    # 🔹 require_api_key: cached valid key (the common case; includes enqueueing the log entry)
+    results.append(_bench("require_api_key.cached_key", auth_with(valid_key), number, repeat))
+    request_log_buffer.drain()
+    # 🔹 require_api_key: missing header (rejected before touching Redis)
+    results.append(_bench("require_api_key.missing_key", auth_with(None), number, repeat))
+    # 🔹 require_api_key: exempt endpoint
+    results.append(_bench("require_api_key.exempt", auth_with(None, "/health"), number, repeat))
+    # 🔹 log_api_request alone (buffered; flushed to Redis by the background thread)
+    results.append(_bench("log_api_request", lambda: log_api_request(valid_key, "/get"), number, repeat))
+    request_log_buffer.drain()
+    return results
+
+def _sample_payloads(seed=7):
+    """A /mget-style response body and one large stored value, both built from a seeded RNG."""
+    rng = random.Random(seed)
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+
+    def record(i):
+        return {"id": i, "name": " ".join(rng.choice(words) for _ in range(4)),
+                "score": rng.randint(0, 10000), "tags": rng.sample(words, 3)}
+
+    response = {"values": {f"key:{i}": json.dumps(record(i)) for i in range(100)}}
+    value = json.dumps([record(i) for i in range(200)])
+    return response, value
+
+def run_codecs(number, repeat):
+    """Encode/decode cost and size of each wire codec, and pack/unpack cost and stored size per compressor."""
+    from serialization import ValueCompressor, ALGORITHMS, orjson, msgpack, lz4_frame, encode_msgpack, decode_msgpack
+    response, value = _sample_payloads()
+    results = []
+
+    # 🔹 Wire codecs on a 100-key /mget response
+    codecs = {"json": (lambda obj: json.dumps(obj, separators=(",", ":")).encode(), json.loads)}
+    if orjson is not None:
+        codecs["orjson"] = (orjson.dumps, orjson.loads)
+    if msgpack is not None:
+        codecs["msgpack"] = (encode_msgpack, decode_msgpack)
+    for name, (encode, decode) in codecs.items():
+        encoded = encode(response)
+        for direction, func in (("encode", lambda: encode(response)), ("decode", lambda: decode(encoded))):
+            result = _bench(f"codec.{name}.{direction}", func, number, repeat)
+            result["bytes"] = len(encoded)
+            results.append(result)
+
+    # 🔹 Stored-value compression of one large value (fewer calls: each handles ~20 KB)
+    raw_size = len(value.encode())
+    for algorithm in ALGORITHMS:
+        if algorithm == "lz4" and lz4_frame is None:
+            continue
+        compressor = ValueCompressor(algorithm, min_size=1024)
+        stored = compressor.pack(value)
+        stored_size = len(stored.encode("utf-8", "surrogateescape"))
+        for direction, func in (("pack", lambda: compressor.pack(value)), ("unpack", lambda: compressor.unpack(stored))):
+            result = _bench(f"compress.{algorithm}.{direction}", func, max(number // 10, 1), repeat)
+            result["bytes"] = stored_size
+            result["ratio"] = round(stored_size / raw_size, 4)
+            results.append(result)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", help="Benchmark against this Redis (default: embedded engine)")
+    parser.add_argument("--number", type=int, default=5000, help="Calls per timing")
+    parser.add_argument("--repeat", type=int, default=5, help="Timings per benchmark; the best is kept")
+    parser.add_argument("--output", default="microbench-results.json")
+    parser.add_argument("--baseline", help="Previous result file; exit 1 if any benchmark regressed")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown vs baseline (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    _configure(args.redis_url)
+    from benchmarks.common import run_metadata, write_results, compare_to_baseline
+
+    results = run(args.number, args.repeat) + run_codecs(args.number, args.repeat)
+    for result in results:
+        size = f"  {result['bytes']:>8} bytes" if "bytes" in result else ""
+        print(f"{result['name']:<32} {result['us_per_call']:>10.3f} us/call  {result['calls_per_second']:>10} calls/s{size}")
+    meta = run_metadata(backend="redis" if args.redis_url else "embedded", number=args.number, repeat=args.repeat)
+    write_results(args.output, meta, results)
+
+    # 🔹 Regression mode
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.threshold, ("name",), {"us_per_call": "lower"})
+        for message in regressions:
+            logger.error(f"Regression: {message}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
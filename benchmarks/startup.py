@@ -0,0 +1,135 @@
+"""Startup benchmark: time from launching gunicorn to bound, Redis-ready and first served request.
+
+Run from the repository root:
+
+    python -m benchmarks.startup                          # in-process Redis stand-in, up from the start
+    python -m benchmarks.startup --redis-delay 5          # Redis comes up 5 s after gunicorn starts
+    python -m benchmarks.startup --redis-url redis://localhost:6379/15
+    python -m benchmarks.startup --baseline old.json      # regression mode: exit 1 when slower
+
+See benchmarks/README.md for the result fields.
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from benchmarks.common import latency_summary, run_metadata, write_results, compare_to_baseline
+from benchmarks.loadtest import Client, _free_port, launch_gunicorn, start_standin, stop_gunicorn
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.01
+
+def _poll(port, method, path, body=None):
+    """One request on a fresh connection; None if nothing is listening yet."""
+    try:
+        return Client("127.0.0.1", port).request(method, path, body)
+    except OSError:
+        return None
+
+def measure_run(redis_url, workers, worker_class, threads, env_overrides, timeout):
+    """Launches gunicorn once and times each startup milestone from the launch."""
+    launched = time.perf_counter()
+    process, port, metrics_dir = launch_gunicorn(redis_url, workers, worker_class, threads, env_overrides)
+    result = {'live_seconds': None, 'ready_seconds': None, 'first_request_seconds': None}
+    gated = []  # Latency of requests answered before Redis was ready
+    try:
+        deadline = launched + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                sys.exit(f"gunicorn exited with status {process.returncode}")
+            if result['live_seconds'] is None:
+                reply = _poll(port, "GET", "/health/live")
+                if reply and reply[0] == 200:
+                    result['live_seconds'] = round(time.perf_counter() - launched, 3)
+            elif result['ready_seconds'] is None:
+                started = time.perf_counter()
+                reply = _poll(port, "POST", "/generate_key", {"user_id": "startup", "role": "user"})
+                if reply and reply[0] == 503:
+                    gated.append(time.perf_counter() - started)
+                reply = _poll(port, "GET", "/health/ready")
+                if reply and reply[0] == 200:
+                    result['ready_seconds'] = round(time.perf_counter() - launched, 3)
+            else:
+                reply = _poll(port, "POST", "/generate_key", {"user_id": "startup", "role": "user"})
+                if reply and reply[0] == 200:
+                    result['first_request_seconds'] = round(time.perf_counter() - launched, 3)
+                    break
+            time.sleep(POLL_INTERVAL)
+        else:
+            sys.exit(f"gunicorn did not serve a request within {timeout}s")
+        # In-process view of the worker that answered: process start to import, ready and first request
+        reply = _poll(port, "GET", "/health")
+        result['worker'] = json.loads(reply[1]).get('startup') if reply and reply[0] == 200 else None
+        result['gated_requests'] = len(gated)
+        result['gated_latency_ms'] = latency_summary(gated)
+    finally:
+        stop_gunicorn(process, metrics_dir)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", help="Start against this Redis (default: in-process stand-in)")
+    parser.add_argument("--redis-delay", type=float, default=0.0,
+                        help="Start the stand-in this many seconds after gunicorn (a Redis that comes up late)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the app")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", default="startup-results.json")
+    parser.add_argument("--baseline", help="Previous result file; exit 1 if startup regressed")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs baseline (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    if args.redis_url and args.redis_delay:
+        parser.error("--redis-delay only applies to the in-process stand-in")
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    runs = []
+    for run in range(args.runs):
+        if args.redis_url:
+            redis_url = args.redis_url
+        else:
+            port = _free_port()
+            redis_url = f"redis://127.0.0.1:{port}/0"
+            if args.redis_delay:
+                threading.Timer(args.redis_delay, start_standin, args=(port,)).start()
+            else:
+                start_standin(port)
+        result = measure_run(redis_url, args.workers, args.worker_class, args.threads, env_overrides, args.timeout)
+        runs.append(result)
+        logger.info(f"Run {run + 1}: live {result['live_seconds']}s, ready {result['ready_seconds']}s, "
+                    f"first request {result['first_request_seconds']}s, "
+                    f"{result['gated_requests']} fast 503s (p99 {result['gated_latency_ms']['p99']}ms)")
+
+    summary = {'name': "startup", 'runs': runs}
+    for field in ('live_seconds', 'ready_seconds', 'first_request_seconds'):
+        summary[field] = round(statistics.median(run[field] for run in runs), 3)
+    meta = run_metadata(
+        backend="redis" if args.redis_url else "standin", redis_delay=args.redis_delay,
+        workers=args.workers, worker_class=args.worker_class, threads=args.threads, env=env_overrides
+    )
+    write_results(args.output, meta, [summary])
+
+    # 🔹 Regression mode
+    if args.baseline:
+        regressions = compare_to_baseline(
+            [summary], args.baseline, args.threshold, ("name",),
+            {"live_seconds": "lower", "first_request_seconds": "lower"}
+        )
+        for message in regressions:
+            logger.error(f"Regression: {message}")
+        if regressions:
+            return 1
+        logger.info(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
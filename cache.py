@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel returned on a cache miss so that falsy values (e.g. an empty hash) can be cached
+MISSING = object()
+
+class TTLCache:
+    """Thread-safe, bounded LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        # Bumped by invalidate/clear; lets a reader detect an invalidation that raced its lookup
+        self.generation = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                # Expired entries stay until evicted so get_stale can still serve them
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key):
+        """Returns the last cached value for key even if expired, or MISSING if never cached or invalidated."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            self.stale_hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, generation=None):
+        """Stores a value, evicting the least recently used entry when full.
+
+        If generation is given (a value read from self.generation before the
+        lookup) and an invalidation has happened since, the value is dropped.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drops a single entry."""
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def expire_all(self):
+        """Marks every entry expired without dropping it (still available to get_stale)."""
+        with self._lock:
+            for key, (_, value) in self._entries.items():
+                self._entries[key] = (0.0, value)
+
+    def clear(self):
+        """Drops every entry."""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Returns hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale_hits': self.stale_hits
+            }
@@ -0,0 +1,190 @@
+import logging
+import os
+import random
+import threading
+import time
+import redis
+import redis.asyncio as aioredis
+from redis.client import Pipeline
+from redis.asyncio.client import Pipeline as AsyncPipeline
+from redis.cluster import RedisCluster
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that mean Redis is unreachable, as opposed to a bad command (e.g. WRONGTYPE)
+BREAKER_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+class CircuitOpenError(redis.exceptions.ConnectionError):
+    """Raised without touching the network while the circuit is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Circuit breaker open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker with jittered exponential backoff between probes.
+
+    After `failure_threshold` consecutive failures the circuit opens and every call
+    fails fast. Once the backoff elapses a single probe call is let through
+    (half-open): success closes the circuit, failure reopens it with a longer backoff.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=1.0, max_recovery_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._consecutive_failures = 0
+        self._consecutive_trips = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not reach Redis."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._open_until:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(max(self._open_until - now, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit breaker closed; Redis reachable again")
+            self.state = CLOSED
+            self._consecutive_failures = 0
+            self._consecutive_trips = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            if self.state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        # Jitter keeps workers from probing a recovering Redis in lockstep
+        backoff = min(self.max_recovery_timeout, self.recovery_timeout * (2 ** self._consecutive_trips))
+        backoff *= random.uniform(0.5, 1.0)
+        self.state = OPEN
+        self._open_until = time.monotonic() + backoff
+        self._probe_in_flight = False
+        self._consecutive_trips += 1
+        self.trips += 1
+        logger.error(f"Circuit breaker opened for {backoff:.2f}s after {self._consecutive_failures} failures")
+
+    def call(self, func, *args, **kwargs):
+        """Runs func under the breaker."""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except BREAKER_ERRORS:
+            self.record_failure()
+            raise
+        except Exception:
+            # Redis answered (e.g. WRONGTYPE), so it is reachable
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        """Awaits func under the breaker."""
+        self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except BREAKER_ERRORS:
+            self.record_failure()
+            raise
+        except Exception:
+            # Redis answered (e.g. WRONGTYPE), so it is reachable
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def retry_after(self):
+        """Seconds until the next probe is allowed (0 when closed)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(self._open_until - time.monotonic(), 0.0)
+
+    def stats(self):
+        """Returns the current state and trip counters."""
+        with self._lock:
+            return {
+                'state': self.state,
+                'trips': self.trips,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'consecutive_failures': self._consecutive_failures,
+                'retry_after': round(max(self._open_until - time.monotonic(), 0.0), 2) if self.state != CLOSED else 0.0
+            }
+
+# One breaker per process, shared by the sync and async clients
+redis_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5)),
+    recovery_timeout=float(os.environ.get('CIRCUIT_RECOVERY_TIMEOUT', 1.0)),
+    max_recovery_timeout=float(os.environ.get('CIRCUIT_MAX_RECOVERY_TIMEOUT', 30.0))
+)
+
+class GuardedPipeline(Pipeline):
+    """Pipeline whose round trip goes through the circuit breaker."""
+
+    def execute(self, raise_on_error=True):
+        return redis_breaker.call(super().execute, raise_on_error)
+
+class GuardedRedis(redis.Redis):
+    """redis.Redis whose every command and pipeline goes through the circuit breaker."""
+
+    def execute_command(self, *args, **options):
+        return redis_breaker.call(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class GuardedAsyncPipeline(AsyncPipeline):
+    """Async pipeline whose round trip goes through the circuit breaker."""
+
+    async def execute(self, raise_on_error=True):
+        return await redis_breaker.call_async(super().execute, raise_on_error)
+
+class GuardedAsyncRedis(aioredis.Redis):
+    """redis.asyncio.Redis whose every command and pipeline goes through the circuit breaker."""
+
+    async def execute_command(self, *args, **options):
+        return await redis_breaker.call_async(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return GuardedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class GuardedRedisCluster(RedisCluster):
+    """RedisCluster whose every command goes through the circuit breaker."""
+
+    def execute_command(self, *args, **kwargs):
+        return redis_breaker.call(super().execute_command, *args, **kwargs)
+
+class GuardedAsyncRedisCluster(aioredis.RedisCluster):
+    """redis.asyncio.RedisCluster whose every command goes through the circuit breaker."""
+
+    async def execute_command(self, *args, **kwargs):
+        return await redis_breaker.call_async(super().execute_command, *args, **kwargs)
@@ -0,0 +1,299 @@
+import os
+import re
+import time
+from analytics import RESOLUTION_NAMES
+from transfer import FORMATS
+
+# Limits that keep a single batch from monopolizing a worker
+BATCH_MAX_COMMANDS = int(os.environ.get('BATCH_MAX_COMMANDS', 1000))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', 1024 * 1024))
+
+# /logs paging cursors are stream entry IDs
+STREAM_ID_PATTERN = re.compile(r"\d+(-\d+)?")
+
+class CommandError(Exception):
+    """Raised when a command is malformed or not permitted for the caller's role."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def _is_scalar(value):
+    # Anything else makes redis-py raise DataError while packing, failing the whole pipeline
+    return not isinstance(value, bool) and isinstance(value, (str, int, float))
+
+def _require(args, *names):
+    """Returns the named arguments, raising CommandError if any is missing."""
+    values = []
+    for name in names:
+        value = args.get(name)
+        if value is None or value == "":
+            raise CommandError(f"{name.capitalize()} is required")
+        if not _is_scalar(value):
+            raise CommandError(f"{name.capitalize()} must be a string or number")
+        values.append(value)
+    return values
+
+def validate_values(mapping):
+    """Checks that every value of an /mset or /hmset mapping can be stored, raising CommandError if not."""
+    for key, value in mapping.items():
+        if not _is_scalar(value):
+            raise CommandError(f"Value of '{key}' must be a string or number")
+
+def _require_integer(args, name):
+    """Returns a required integer argument, raising CommandError if it is not one."""
+    value, = _require(args, name)
+    try:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    except ValueError:
+        raise CommandError(f"{name.capitalize()} must be an integer")
+
+def _build_set(args):
+    key, value = _require(args, "key", "value")
+    if args.get("ttl") is not None:
+        return ("setex", key, _require_integer(args, "ttl"), value)
+    return ("set", key, value)
+
+def _build_expire(args):
+    key, = _require(args, "key")
+    return ("expire", key, _require_integer(args, "ttl"))
+
+# command name -> (builds the redis-py call as (method, *args), admin only?)
+COMMANDS = {
+    "set": (_build_set, False),
+    "get": (lambda args: ("get", *_require(args, "key")), False),
+    "delete": (lambda args: ("delete", *_require(args, "key")), True),
+    "expire": (_build_expire, False),
+    "ttl": (lambda args: ("ttl", *_require(args, "key")), False),
+    "incr": (lambda args: ("incr", *_require(args, "key")), False),
+    "decr": (lambda args: ("decr", *_require(args, "key")), False),
+    "hset": (lambda args: ("hset", *_require(args, "hash", "field", "value")), False),
+    "hget": (lambda args: ("hget", *_require(args, "hash", "field")), False),
+    "enqueue": (lambda args: ("rpush", *_require(args, "queue", "value")), False),
+    "dequeue": (lambda args: ("lpop", *_require(args, "queue")), False),
+}
+
+# Argument holding the key each cacheable write modifies (see near_cache.py)
+WRITE_KEY_ARGS = {
+    "set": "key",
+    "delete": "key",
+    "expire": "key",
+    "incr": "key",
+    "decr": "key",
+    "hset": "hash",
+}
+
+def written_keys(specs):
+    """Returns the keys modified by write commands in a list of command specs."""
+    keys = []
+    for spec in specs:
+        if isinstance(spec, dict):
+            arg = WRITE_KEY_ARGS.get(str(spec.get("command", "")).lower())
+            if arg and spec.get(arg):
+                keys.append(spec[arg])
+    return keys
+
+def build_command(spec, role):
+    """Validates one batch entry ({"command": ..., <args>}) and returns its redis-py call."""
+    if not isinstance(spec, dict):
+        raise CommandError("Each command must be an object")
+    name = str(spec.get("command", "")).lower()
+    if name not in COMMANDS:
+        raise CommandError(f"Unknown command '{name}'")
+    builder, admin_only = COMMANDS[name]
+    if admin_only and role != "admin":
+        raise CommandError("Forbidden. Admin access required", status=403)
+    return builder(spec)
+
+def validate_batch(commands):
+    """Checks the shape and size of a batch payload."""
+    if not isinstance(commands, list) or not commands:
+        raise CommandError("'commands' must be a non-empty array")
+    if len(commands) > BATCH_MAX_COMMANDS:
+        raise CommandError(f"Batch exceeds {BATCH_MAX_COMMANDS} commands", status=413)
+
+def prepare_batch(commands, role, transaction=False):
+    """Validates a batch and returns its redis-py calls, with CommandErrors in place of invalid entries.
+
+    In transaction mode any invalid entry aborts the whole batch before MULTI is sent.
+    """
+    validate_batch(commands)
+
+    calls = []
+    for spec in commands:
+        try:
+            calls.append(build_command(spec, role))
+        except CommandError as e:
+            if transaction:
+                raise
+            calls.append(e)
+    return calls
+
+def queue_calls(pipe, calls, compressor=None):
+    """Queues every valid call on a pipeline, packing stored values with compressor if given."""
+    for call in calls:
+        if not isinstance(call, CommandError):
+            method, *params = compressor.pack_call(call) if compressor else call
+            getattr(pipe, method)(*params)
+
+def collect_results(calls, replies, compressor=None):
+    """Merges pipeline replies with validation errors into per-command results, in order."""
+    replies = iter(replies)
+    results = []
+    for call in calls:
+        if isinstance(call, CommandError):
+            results.append({"error": call.message})
+            continue
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            results.append({"error": str(reply)})
+        else:
+            results.append({"result": compressor.unpack_reply(call[0], reply) if compressor else reply})
+    return results
+
+def run_batch(client, commands, role, transaction=False, compressor=None):
+    """Runs a batch in one pipeline and returns per-command results in order."""
+    calls = prepare_batch(commands, role, transaction)
+    pipe = client.pipeline(transaction=transaction)
+    queue_calls(pipe, calls, compressor)
+    replies = pipe.execute(raise_on_error=False) if len(pipe) else []
+    return collect_results(calls, replies, compressor)
+
+# ===================== QUERY PARSING =====================
+
+def parse_scan_args(args):
+    """Parses /list_keys query params into (cursor, count, match, type)."""
+    try:
+        cursor = int(args.get("cursor", 0))
+        count = min(max(int(args.get("count", 100)), 1), 1000)
+    except ValueError:
+        raise CommandError("cursor and count must be integers")
+    return cursor, count, args.get("match") or None, args.get("type") or None
+
+def parse_log_args(args):
+    """Parses /logs query params into (start, end, count, cursor)."""
+    try:
+        start = int(args["start"]) if args.get("start") else None
+        end = int(args["end"]) if args.get("end") else None
+        count = min(max(int(args.get("count", 50)), 1), 1000)
+    except ValueError:
+        raise CommandError("start, end and count must be integers")
+    cursor = args.get("cursor") or None
+    if cursor is not None and not STREAM_ID_PATTERN.fullmatch(cursor):
+        raise CommandError("cursor must be a stream ID (as returned in next_cursor)")
+    return start, end, count, cursor
+
+def parse_dequeue_args(args):
+    """Parses /dequeue query params into (count, wait, consumer, visibility_timeout)."""
+    try:
+        count = int(args.get("count", 1))
+        wait = float(args.get("wait", 0))
+        visibility = int(args["visibility"]) if args.get("visibility") else None
+    except ValueError:
+        raise CommandError("count and visibility must be integers and wait a number")
+    if not 1 <= count <= BATCH_MAX_COMMANDS:
+        raise CommandError(f"count must be between 1 and {BATCH_MAX_COMMANDS}")
+    if wait < 0 or (visibility is not None and visibility < 1):
+        raise CommandError("wait must be >= 0 and visibility >= 1")
+    return count, wait, args.get("consumer") or None, visibility
+
+def parse_analytics_args(args):
+    """Parses /analytics query params into (start, end, resolution, user).
+
+    `start`/`end` are unix seconds (default: the last hour); `resolution` is
+    minute, hour, day or a bucket size in seconds (default: chosen by range).
+    """
+    try:
+        end = int(args["end"]) if args.get("end") else int(time.time())
+        start = int(args["start"]) if args.get("start") else end - 3600
+        resolution = args.get("resolution") or None
+        if resolution is not None:
+            resolution = RESOLUTION_NAMES.get(resolution) or int(resolution)
+    except ValueError:
+        raise CommandError("start and end must be integers and resolution minute, hour, day or seconds")
+    return start, end, resolution, args.get("user") or None
+
+def parse_memory_report_args(data, default_top):
+    """Parses a POST /memory_report body into (match, top)."""
+    match = data.get("match") or None
+    if match is not None and not isinstance(match, str):
+        raise CommandError("match must be a glob pattern")
+    try:
+        top = int(data.get("top", default_top))
+    except (TypeError, ValueError):
+        raise CommandError("top must be an integer")
+    if not 1 <= top <= 1000:
+        raise CommandError("top must be between 1 and 1000")
+    return match, top
+
+def parse_export_args(args):
+    """Parses /export query params into (format, cursor, match)."""
+    fmt = args.get("format") or "ndjson"
+    if fmt not in FORMATS:
+        raise CommandError(f"format must be one of {', '.join(FORMATS)}")
+    try:
+        cursor = int(args.get("cursor") or 0)
+    except ValueError:
+        raise CommandError("cursor must be an integer")
+    return fmt, cursor, args.get("match") or None
+
+def parse_import_args(args):
+    """Parses /import query params into (replace, after)."""
+    return args.get("replace") in ("1", "true"), args.get("after") or None
+
+# ===================== SINGLE-COMMAND ROUTES =====================
+
+# Routes shared by the Flask (app.py) and ASGI (asgi_app.py) servers: path -> (HTTP method, command)
+# GET routes read their arguments from the query string, the rest from the JSON body.
+ROUTES = {
+    "/set": ("POST", "set"),
+    "/get": ("GET", "get"),
+    "/delete": ("DELETE", "delete"),
+    "/expire": ("POST", "expire"),
+    "/ttl": ("GET", "ttl"),
+    "/incr": ("POST", "incr"),
+    "/decr": ("POST", "decr"),
+    "/hset": ("POST", "hset"),
+    "/hget": ("GET", "hget"),
+    "/enqueue": ("POST", "enqueue"),
+    "/dequeue": ("GET", "dequeue"),
+}
+
+def format_result(name, args, result):
+    """Turns a single command's reply into the (body, status) returned by the HTTP API."""
+    if name == "set":
+        return {"message": f"Stored '{args['key']}' successfully!"}, 200
+    if name == "get":
+        if result is None:
+            return {"error": "Key not found"}, 404
+        return {"key": args["key"], "value": result}, 200
+    if name == "delete":
+        if not result:
+            return {"error": "Key not found"}, 404
+        return {"message": f"Deleted '{args['key']}' successfully!"}, 200
+    if name == "expire":
+        if not result:
+            return {"error": "Key not found"}, 404
+        return {"message": f"TTL set for '{args['key']}' to {args['ttl']} seconds"}, 200
+    if name == "ttl":
+        if result < 0:
+            return {"error": "No TTL set or key not found"}, 404
+        return {"key": args["key"], "ttl": result}, 200
+    if name in ("incr", "decr"):
+        return {"key": args["key"], "value": result}, 200
+    if name == "hset":
+        return {"message": f"Stored field '{args['field']}' in hash '{args['hash']}'"}, 200
+    if name == "hget":
+        if result is None:
+            return {"error": "Field not found"}, 404
+        return {"hash": args["hash"], "field": args["field"], "value": result}, 200
+    if name == "enqueue":
+        return {"message": f"Enqueued '{args['value']}' to queue '{args['queue']}'"}, 200
+    if name == "dequeue":
+        if result is None:
+            return {"error": "Queue is empty"}, 404
+        return {"queue": args["queue"], "value": result}, 200
+    return {"result": result}, 200
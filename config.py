@@ -1,8 +1,19 @@
-import redis
+import redis.asyncio as aioredis
 import os
-import time
 import logging
 from urllib.parse import urlparse
+from circuit_breaker import GuardedAsyncRedis, redis_breaker
+from metrics import InstrumentedRedis, InstrumentedReplicaRedis
+from near_cache import create_near_cache
+from queues import create_queue_service
+from events import create_event_hub
+from serialization import create_value_compressor
+from sharding import AsyncShardedRedis, ClusterRedis, LazyClusterRedis, AsyncClusterRedis, create_sharded_client
+from replicas import AsyncReplicatedRedis, create_replicated_client
+from memory_analyzer import create_memory_analyzer
+from analytics import create_usage_analytics
+from transfer import create_keyspace_transfer
+from readiness import create_startup_readiness
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -63,89 +74,203 @@ else:
     redis_password = os.environ.get('REDIS_PASSWORD', None)
     logger.info(f"Using Redis connection: {redis_host}:{redis_port}")
 
-# Function to create Redis client with retry logic
-def create_redis_client(max_retries=5, retry_delay=2):
-    # For Railway deployment, we might need more retries as services start up
+# Replies are decoded to str, but binary values (such as compressed ones, see serialization.py)
+# must survive the round trip byte-for-byte
+ENCODING_ERRORS = 'surrogateescape'
+
+# Clients are InstrumentedRedis instances, so every command goes through the circuit breaker
+# and is counted and timed for /metrics
+def create_redis_client():
+    """Creates the Redis client without connecting.
+
+    redis-py's pool opens connections on first use; readiness.py validates the
+    server in the background, so importing the app never waits for Redis.
+    """
+    global redis_url
+    # If we have a full Redis URL, use it directly
+    if redis_url:
+        # Ensure URL has proper protocol prefix
+        if not redis_url.startswith('redis://') and not redis_url.startswith('rediss://'):
+            redis_url = 'redis://' + redis_url
+            logger.info("Added redis:// protocol prefix to Redis URL")
+        return InstrumentedRedis.from_url(
+            redis_url,
+            decode_responses=True,
+            encoding_errors=ENCODING_ERRORS,
+            socket_timeout=5,
+            socket_connect_timeout=5
+        )
+    # Otherwise use individual connection parameters
+    return InstrumentedRedis(
+        host=redis_host,
+        port=redis_port,
+        password=redis_password,
+        decode_responses=True,
+        encoding_errors=ENCODING_ERRORS,
+        socket_timeout=5,
+        socket_connect_timeout=5
+    )
+
+def mask_url(url):
+    """Returns url with its password replaced by ***, so it can be logged or shown on /health."""
+    if not url or url == 'Not set':
+        return url
+    scheme_less = '://' not in url
+    parsed = urlparse('redis://' + url if scheme_less else url)
+    if parsed.password is None:
+        return url
+    masked = parsed._replace(netloc=parsed.netloc.replace(f":{parsed.password}@", ":***@")).geturl()
+    return masked[len('redis://'):] if scheme_less else masked
+
+def log_connection_help():
+    """Logs where the connection settings came from, once Redis has stayed unreachable for a while."""
+    # For Railway deployment, log additional information to help troubleshoot
     if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_SERVICE_ID'):
-        max_retries = 20  # Increase retries for Railway environment
-        retry_delay = 5   # Longer delay between retries for Railway
-    
-    for attempt in range(max_retries):
-        try:
-            # If we have a full Redis URL, use it directly
-            if redis_url:
-                # Ensure URL has proper protocol prefix
-                if not redis_url.startswith('redis://') and not redis_url.startswith('rediss://'):
-                    redis_url = 'redis://' + redis_url
-                    logger.info("Added redis:// protocol prefix to Redis URL")
-                
-                client = redis.from_url(
-                    redis_url,
-                    decode_responses=True,
-                    socket_timeout=5,
-                    socket_connect_timeout=5
-                )
-            # Otherwise use individual connection parameters
-            elif redis_password:
-                client = redis.StrictRedis(
-                    host=redis_host,
-                    port=redis_port,
-                    password=redis_password,
-                    decode_responses=True,
-                    socket_timeout=5,
-                    socket_connect_timeout=5
-                )
-            else:
-                client = redis.StrictRedis(
-                    host=redis_host,
-                    port=redis_port,
-                    decode_responses=True,
-                    socket_timeout=5,
-                    socket_connect_timeout=5
-                )
-            
-            # Test the connection
-            client.ping()
-            logger.info("Successfully connected to Redis")
-            return client
-        except redis.exceptions.ConnectionError as e:
-            logger.warning(f"Redis connection attempt {attempt+1}/{max_retries} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                logger.info(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                logger.error("Failed to connect to Redis after multiple attempts")
-                # For Railway deployment, log additional information to help troubleshoot
-                if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_SERVICE_ID'):
-                    logger.error(f"Railway deployment detected. Check if Redis plugin is properly configured.")
-                    logger.error(f"Redis connection parameters: host={redis_host}, port={redis_port}")
-                    # Log all environment variables that might contain Redis connection info
-                    logger.error(f"Environment variables:")
-                    logger.error(f"  REDIS_URL={os.environ.get('REDIS_URL', 'Not set')}")
-                    logger.error(f"  DATABASE_URL={os.environ.get('DATABASE_URL', 'Not set')}")
-                    logger.error(f"  REDISHOST={os.environ.get('REDISHOST', 'Not set')}")
-                    logger.error(f"  REDIS_URI={os.environ.get('REDIS_URI', 'Not set')}")
-                    logger.error(f"  REDIS_HOST={os.environ.get('REDIS_HOST', 'Not set')}")
-                    logger.error(f"  REDIS_PORT={os.environ.get('REDIS_PORT', 'Not set')}")
-                    logger.error(f"  REDIS_PASSWORD={os.environ.get('REDIS_PASSWORD', 'Not set') != 'Not set' and '***' or 'Not set'}")
-                
-                # Return a client anyway, so the application can start and retry later
-                # This allows the app to start and serve at least the health endpoint
-                if redis_url:
-                    return redis.from_url(redis_url, decode_responses=True)
-                elif redis_password:
-                    return redis.StrictRedis(
-                        host=redis_host,
-                        port=redis_port,
-                        password=redis_password,
-                        decode_responses=True
-                    )
-                else:
-                    return redis.StrictRedis(
-                        host=redis_host,
-                        port=redis_port,
-                        decode_responses=True
-                    )
-
-# Create Redis client with retry logic
-redis_client = create_redis_client()
+        logger.error("Railway deployment detected. Check if Redis plugin is properly configured.")
+    logger.error(f"Redis connection parameters: host={redis_host}, port={redis_port}")
+    # Log all environment variables that might contain Redis connection info
+    logger.error("Environment variables:")
+    logger.error(f"  REDIS_URL={mask_url(os.environ.get('REDIS_URL', 'Not set'))}")
+    logger.error(f"  DATABASE_URL={mask_url(os.environ.get('DATABASE_URL', 'Not set'))}")
+    logger.error(f"  REDISHOST={mask_url(os.environ.get('REDISHOST', 'Not set'))}")
+    logger.error(f"  REDIS_URI={mask_url(os.environ.get('REDIS_URI', 'Not set'))}")
+    logger.error(f"  REDIS_HOST={os.environ.get('REDIS_HOST', 'Not set')}")
+    logger.error(f"  REDIS_PORT={os.environ.get('REDIS_PORT', 'Not set')}")
+    logger.error(f"  REDIS_PASSWORD={os.environ.get('REDIS_PASSWORD', 'Not set') != 'Not set' and '***' or 'Not set'}")
+
+# ===================== SHARDING =====================
+
+# Several independent servers on a consistent hash ring ("name=url,..." or "url,...", see sharding.py)
+SHARD_URLS = os.environ.get('REDIS_SHARD_URLS')
+# Or a Redis Cluster, reached through any one of its nodes
+CLUSTER_URL = os.environ.get('REDIS_CLUSTER_URL')
+
+def create_shard_node(url):
+    """Client for one ring node; same options as the single-server client."""
+    return InstrumentedRedis.from_url(
+        url,
+        decode_responses=True,
+        encoding_errors=ENCODING_ERRORS,
+        socket_timeout=5,
+        socket_connect_timeout=5
+    )
+
+def create_cluster_client():
+    """ClusterRedis for REDIS_CLUSTER_URL, built on first use (the readiness check retries it in the background)."""
+    def connect():
+        client = ClusterRedis.from_url(
+            CLUSTER_URL,
+            decode_responses=True,
+            encoding_errors=ENCODING_ERRORS,
+            socket_timeout=5,
+            socket_connect_timeout=5
+        )
+        logger.info(f"Connected to Redis Cluster with {len(client.get_primaries())} primaries")
+        return client
+    return LazyClusterRedis(connect)
+
+# ===================== READ REPLICAS =====================
+
+# Replicas of the primary above; reads are spread over them (see replicas.py)
+REPLICA_URLS = os.environ.get('REDIS_REPLICA_URLS')
+if REPLICA_URLS and (SHARD_URLS or CLUSTER_URL):
+    logger.warning("REDIS_REPLICA_URLS only applies to a single primary; ignored with sharding")
+
+def create_replica_node(url):
+    """Client for one replica: instrumented, but failures eject the replica instead of tripping the breaker."""
+    return InstrumentedReplicaRedis.from_url(
+        url,
+        decode_responses=True,
+        encoding_errors=ENCODING_ERRORS,
+        socket_timeout=5,
+        socket_connect_timeout=5
+    )
+
+# Storage backend: "redis" (external server, default) or "embedded" (in-process engine)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'redis').lower()
+
+# Upper bound on pooled connections per process for the async client
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 100))
+
+def create_async_redis_client(max_connections=REDIS_MAX_CONNECTIONS):
+    """Creates a redis.asyncio client on a shared, bounded connection pool (used by asgi_app).
+
+    Requests wait for a free connection instead of opening unbounded sockets,
+    so one process can hold thousands of in-flight requests on a fixed pool.
+    """
+    pool_options = {
+        'decode_responses': True,
+        'encoding_errors': ENCODING_ERRORS,
+        'socket_timeout': 5,
+        'socket_connect_timeout': 5,
+        'max_connections': max_connections,
+        'timeout': 5  # Seconds to wait for a free pooled connection
+    }
+    if STORAGE_BACKEND == 'embedded':
+        # The async app shares the same in-process dataset
+        return AsyncEmbeddedStore(redis_client)
+    if SHARD_URLS:
+        # One bounded pool per node
+        return create_sharded_client(
+            lambda url: GuardedAsyncRedis(connection_pool=aioredis.BlockingConnectionPool.from_url(url, **pool_options)),
+            AsyncShardedRedis
+        )
+    if CLUSTER_URL:
+        return AsyncClusterRedis.from_url(CLUSTER_URL, decode_responses=True, encoding_errors=ENCODING_ERRORS,
+                                          socket_timeout=5, socket_connect_timeout=5,
+                                          max_connections=max_connections)
+    if redis_url:
+        url = redis_url if redis_url.startswith(('redis://', 'rediss://')) else 'redis://' + redis_url
+        pool = aioredis.BlockingConnectionPool.from_url(url, **pool_options)
+    else:
+        pool = aioredis.BlockingConnectionPool(
+            host=redis_host,
+            port=redis_port,
+            password=redis_password,
+            **pool_options
+        )
+    if REPLICA_URLS:
+        return create_replicated_client(
+            GuardedAsyncRedis(connection_pool=pool),
+            lambda url: aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool.from_url(url, **pool_options)),
+            AsyncReplicatedRedis
+        )
+    return GuardedAsyncRedis(connection_pool=pool)
+
+if STORAGE_BACKEND == 'embedded':
+    from embedded_store import create_embedded_store, AsyncEmbeddedStore
+    redis_client = create_embedded_store()
+elif SHARD_URLS:
+    redis_client = create_sharded_client(create_shard_node)
+elif CLUSTER_URL:
+    # Lazy too: RedisCluster would fetch the slot map, and block, as soon as it is built
+    redis_client = create_cluster_client()
+else:
+    # Lazy client: nothing connects until the readiness check or the first request
+    redis_client = create_redis_client()
+    if REPLICA_URLS:
+        redis_client = create_replicated_client(redis_client, create_replica_node)
+
+# Pings Redis in the background until it answers; apps answer 503 until then (see readiness.py)
+readiness = create_startup_readiness(redis_client, redis_breaker, log_connection_help)
+
+# Optional per-worker cache for hot /get and /hget reads (NEAR_CACHE_ENABLED=1)
+near_cache = create_near_cache(redis_client)
+
+# Transparent compression of large stored values (VALUE_COMPRESSION=zlib|lz4, off by default)
+value_compressor = create_value_compressor()
+
+# Batch, long-poll and reliable queue consumption (see queues.py)
+queue_service = create_queue_service(redis_client, value_compressor)
+
+# One pub/sub connection per worker feeding every /events subscriber (see events.py)
+event_hub = create_event_hub(redis_client)
+
+# Admin-triggered, throttled keyspace memory walks (see memory_analyzer.py)
+memory_analyzer = create_memory_analyzer(redis_client)
+
+# Request counts per endpoint, user and status in time buckets (ANALYTICS_ENABLED=0 turns it off)
+usage_analytics = create_usage_analytics(redis_client)
+
+# Streaming /export and /import with DUMP/RESTORE (see transfer.py)
+keyspace_transfer = create_keyspace_transfer()
@@ -0,0 +1,1081 @@
+"""In-process, pure-Python storage engine that stands in for an external Redis.
+
+`EmbeddedStore` implements the slice of the redis-py client API the service
+uses (strings with INCR/DECR, hashes, lists as queues with blocking pops and
+LMOVE, sets of queue consumers, streams for request logs, EXPIRE/TTL, SCAN,
+pipelines, pub/sub and keyspace notifications for /events) with the same
+return types as a `decode_responses=True` client, so config.redis_client can
+be either one. Select it with STORAGE_BACKEND=embedded; run a single worker
+process (e.g. `gunicorn -w 1 --threads 8`) since the dataset lives in that
+process.
+"""
+import asyncio
+import fnmatch
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left, bisect_right
+import redis
+import rdb
+from aof import AppendOnlyFile, FSYNC_EVERYSEC
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+# SCAN cursors are (generation << 40) | slot so cursors from before a compaction restart safely
+_CURSOR_BITS = 40
+_CURSOR_MASK = (1 << _CURSOR_BITS) - 1
+
+# Slots copied per locked step of an AOF rewrite
+_SNAPSHOT_CHUNK = 1000
+
+class Entry:
+    """One key's value; `expires_at` is an absolute unix time in milliseconds or None."""
+    __slots__ = ('type', 'value', 'expires_at')
+
+    def __init__(self, type, value, expires_at=None):
+        self.type = type
+        self.value = value
+        self.expires_at = expires_at
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+def _encode(value):
+    """Coerces a value the way redis-py does before sending it to the server."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "surrogateescape")
+    if isinstance(value, bool) or value is None:
+        raise redis.exceptions.DataError(f"Invalid input of type: '{type(value).__name__}'")
+    if isinstance(value, (int, float)):
+        return repr(value) if isinstance(value, float) else str(value)
+    raise redis.exceptions.DataError(f"Invalid input of type: '{type(value).__name__}'")
+
+def _integer(value, message="value is not an integer or out of range"):
+    """Parses an integer argument, failing with the ResponseError Redis would send."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise redis.exceptions.ResponseError(message)
+
+def _convert_value(value_type, value, convert):
+    """Applies convert to every string in a string, list, set or hash value."""
+    if value_type == "string":
+        return convert(value)
+    if value_type == "list":
+        return [convert(item) for item in value]
+    if value_type == "set":
+        return {convert(item) for item in value}
+    return {convert(field): convert(item) for field, item in value.items()}
+
+def _stream_id(entry_id):
+    """Parses "ms-seq" (or bare "ms") into a comparable tuple."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq) if seq else 0
+
+class EmbeddedStore:
+    """Thread-safe in-memory keyspace with active expiry and an optional append-only file."""
+
+    def __init__(self, aof_path=None, aof_fsync=FSYNC_EVERYSEC, aof_rewrite_min_size=64 * 1024 * 1024,
+                 aof_rewrite_percentage=100, expiry_interval=0.1):
+        self._lock = threading.RLock()
+        self._list_pushed = threading.Condition(self._lock)  # Wakes BLPOP/BLMOVE waiters
+        self._data = {}            # key -> Entry, O(1) lookups
+        self._slots = []           # insertion-ordered keys (None = deleted) for stable SCAN cursors
+        self._slot_of = {}         # key -> index into _slots
+        self._generation = 0
+        self._expiry_heap = []     # (expires_at, key); stale items are skipped when popped
+        self._channels = {}        # channel -> set of subscriber queues
+        self._patterns = {}        # PSUBSCRIBE pattern -> set of subscriber queues
+        self._notify_flags = ""    # notify-keyspace-events, as set by CONFIG SET
+        self._stream_seq = (0, 0)  # last stream id handed out, across all streams
+        self.expired_keys = 0
+        self._aof = None
+        if aof_path:
+            aof_exists = os.path.exists(aof_path)
+            self._aof = AppendOnlyFile(aof_path, self._lock, self._snapshot, fsync=aof_fsync,
+                                       rewrite_min_size=aof_rewrite_min_size,
+                                       rewrite_percentage=aof_rewrite_percentage)
+            if aof_exists:
+                aof, self._aof = self._aof, None  # Don't re-log while replaying
+                aof.load(self._replay)
+                self._aof = aof
+        self._expiry_interval = expiry_interval
+        threading.Thread(target=self._active_expire_loop, name="embedded-expiry", daemon=True).start()
+
+    # ===================== KEYSPACE INTERNALS =====================
+
+    def _lookup(self, key, expected_type=None):
+        """Returns the live Entry for key (expiring it lazily), checking its type."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= _now_ms():
+            self._remove(key)
+            self.expired_keys += 1
+            self._notify("x", "expired", key)
+            return None
+        if expected_type and entry.type != expected_type:
+            raise redis.exceptions.ResponseError(WRONGTYPE)
+        return entry
+
+    def _store(self, key, entry):
+        if key not in self._data:
+            self._slot_of[key] = len(self._slots)
+            self._slots.append(key)
+        self._data[key] = entry
+        if entry.expires_at is not None:
+            heapq.heappush(self._expiry_heap, (entry.expires_at, key))
+
+    def _remove(self, key):
+        if self._data.pop(key, None) is None:
+            return False
+        self._slots[self._slot_of.pop(key)] = None
+        return True
+
+    def _maybe_compact(self):
+        """Drops SCAN tombstones once they dominate; outstanding cursors restart (SCAN allows duplicates)."""
+        if self._aof is not None and self._aof.rewriting:
+            return  # The rewrite walk is positioned by slot
+        if len(self._slots) > 1024 and len(self._slot_of) * 2 < len(self._slots):
+            self._slots = [k for k in self._slots if k is not None]
+            self._slot_of = {k: i for i, k in enumerate(self._slots)}
+            self._generation += 1
+
+    def _set_expiry(self, entry, key, expires_at):
+        entry.expires_at = expires_at
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+    def _active_expire_loop(self):
+        """Deletes keys as their deadline passes instead of waiting for the next access."""
+        while True:
+            time.sleep(self._expiry_interval)
+            with self._lock:
+                now = _now_ms()
+                # Bound the work per tick so a mass expiry cannot stall request threads
+                for _ in range(1000):
+                    if not self._expiry_heap or self._expiry_heap[0][0] > now:
+                        break
+                    expires_at, key = heapq.heappop(self._expiry_heap)
+                    entry = self._data.get(key)
+                    if entry is not None and entry.expires_at == expires_at:
+                        self._remove(key)
+                        self.expired_keys += 1
+                        self._notify("x", "expired", key)
+                self._maybe_compact()
+
+    def _log(self, *command):
+        if self._aof is not None:
+            self._aof.append(list(command))
+
+    def _notify(self, event_class, event, *keys):
+        """Publishes event on __keyspace@0__:<key> for each key, if notify-keyspace-events enables its class."""
+        flags = self._notify_flags
+        if not self._patterns or "K" not in flags or (event_class not in flags and "A" not in flags):
+            return
+        for key in keys:
+            self._deliver(f"__keyspace@0__:{key}", event)
+
+    def _snapshot(self, cursor, skip):
+        """One step of an AOF rewrite walk: (commands rebuilding the next chunk of slots, next cursor or 0)."""
+        end = min(cursor + _SNAPSHOT_CHUNK, len(self._slots))
+        commands = []
+        now = _now_ms()
+        for slot in range(cursor, end):
+            key = self._slots[slot]
+            if key is None or key in skip:
+                continue
+            entry = self._data[key]
+            if entry.expires_at is not None and entry.expires_at <= now:
+                continue
+            commands.extend(self._entry_commands(key, entry))
+        return commands, (end if end < len(self._slots) else 0)
+
+    def _preserve(self, *keys):
+        """Before a write: hands the rewrite the current state of keys its walk has not reached yet."""
+        aof = self._aof
+        if aof is None or not aof.rewriting or aof.rewrite_cursor is None:
+            return
+        for key in keys:
+            slot = self._slot_of.get(key)
+            if key in aof.rewrite_seen or (slot is not None and slot < aof.rewrite_cursor):
+                continue
+            entry = self._data.get(key)
+            live = entry is not None and (entry.expires_at is None or entry.expires_at > _now_ms())
+            aof.add_snapshot(key, self._entry_commands(key, entry) if live else [])
+
+    @staticmethod
+    def _entry_commands(key, entry):
+        """The AOF commands that recreate one key."""
+        if entry.type == "string":
+            return [["set", key, entry.value, entry.expires_at]]
+        commands = []
+        if entry.type == "hash":
+            commands.append(["hset", key, dict(entry.value)])
+        elif entry.type == "list":
+            commands.append(["rpush", key, *entry.value])
+        elif entry.type == "set":
+            commands.append(["sadd", key, *sorted(entry.value)])
+        elif entry.type == "stream":
+            ids, fields = entry.value
+            for entry_id, values in zip(ids, fields):
+                commands.append(["xadd", key, f"{entry_id[0]}-{entry_id[1]}", dict(values), None])
+        if entry.expires_at is not None:
+            commands.append(["pexpireat", key, entry.expires_at])
+        return commands
+
+    def _replay(self, command):
+        name, args = command[0], command[1:]
+        if name == "set":
+            key, value, expires_at = args
+            self._store(key, Entry("string", value, expires_at))
+        elif name == "mset":
+            for key, value in args[0].items():
+                self._store(key, Entry("string", value))
+        elif name == "delete":
+            for key in args:
+                self._remove(key)
+        elif name == "pexpireat":
+            self.pexpireat(*args)
+        elif name == "persist":
+            self.persist(*args)
+        elif name == "incrby":
+            self.incrby(*args)
+        elif name == "hset":
+            self.hset(args[0], mapping=args[1])
+        elif name == "hdel":
+            self.hdel(*args)
+        elif name == "hincrby":
+            self.hincrby(*args)
+        elif name == "rpush":
+            self.rpush(*args)
+        elif name == "lpush":
+            self.lpush(*args)
+        elif name == "lpop":
+            self.lpop(*args)
+        elif name == "rpop":
+            self.rpop(*args)
+        elif name == "lmove":
+            self.lmove(*args)
+        elif name == "lrem":
+            self.lrem(*args)
+        elif name == "sadd":
+            self.sadd(*args)
+        elif name == "srem":
+            self.srem(*args)
+        elif name == "xadd":
+            key, entry_id, fields, maxlen = args
+            self.xadd(key, fields, id=entry_id, maxlen=maxlen)
+        elif name == "flushdb":
+            self.flushdb()
+        else:
+            logger.warning(f"Unknown AOF command '{name}'")
+
+    # ===================== CONNECTION / SERVER =====================
+
+    def ping(self):
+        return True
+
+    def info(self, section=None):
+        with self._lock:
+            info = {
+                'redis_version': 'embedded-1.0',
+                'redis_mode': 'embedded',
+                'db0': {'keys': len(self._data), 'expires': sum(1 for e in self._data.values() if e.expires_at)},
+                'expired_keys': self.expired_keys
+            }
+            if self._aof is not None:
+                info['aof'] = self._aof.stats()
+            return info
+
+    def dbsize(self):
+        with self._lock:
+            return len(self._data)
+
+    def flushdb(self, asynchronous=False):
+        with self._lock:
+            self._data.clear()
+            self._slots = []
+            self._slot_of = {}
+            self._generation += 1
+            self._expiry_heap = []
+            self._log("flushdb")
+            return True
+
+    def config_get(self, pattern="*"):
+        """Only notify-keyspace-events is configurable (used by keyspace.enable_keyspace_events)."""
+        with self._lock:
+            config = {"notify-keyspace-events": self._notify_flags}
+            return {name: value for name, value in config.items() if fnmatch.fnmatchcase(name, pattern)}
+
+    def config_set(self, name, value):
+        if name != "notify-keyspace-events":
+            raise redis.exceptions.ResponseError(f"Unsupported CONFIG parameter: {name}")
+        with self._lock:
+            self._notify_flags = value
+            return True
+
+    def bgrewriteaof(self):
+        with self._lock:
+            if self._aof is None:
+                raise redis.exceptions.ResponseError("AOF is disabled")
+            return self._aof.start_rewrite()
+
+    def close(self):
+        if self._aof is not None:
+            self._aof.close()
+
+    def run_atomic(self, func, *args):
+        """Runs func(store, *args) under the keyspace lock; stands in for EVALSHA (see scripts.py)."""
+        with self._lock:
+            return func(self, *args)
+
+    # ===================== GENERIC KEY COMMANDS =====================
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._lookup(name) is not None)
+
+    def delete(self, *names):
+        with self._lock:
+            self._preserve(*names)
+            removed = [name for name in names if self._lookup(name) is not None and self._remove(name)]
+            if removed:
+                self._log("delete", *removed)
+                self._notify("g", "del", *removed)
+            return len(removed)
+
+    def type(self, name):
+        with self._lock:
+            entry = self._lookup(name)
+            return entry.type if entry else "none"
+
+    def expire(self, name, time):
+        return self.pexpireat(name, _now_ms() + _integer(time) * 1000)
+
+    def pexpire(self, name, time):
+        return self.pexpireat(name, _now_ms() + _integer(time))
+
+    def pexpireat(self, name, when):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name)
+            if entry is None:
+                return False
+            when = _integer(when)
+            if when <= _now_ms():
+                self._remove(name)
+                self._log("delete", name)
+                self._notify("g", "del", name)
+                return True
+            self._set_expiry(entry, name, when)
+            self._log("pexpireat", name, when)
+            self._notify("g", "expire", name)
+            return True
+
+    def persist(self, name):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name)
+            if entry is None or entry.expires_at is None:
+                return False
+            entry.expires_at = None
+            self._log("persist", name)
+            self._notify("g", "persist", name)
+            return True
+
+    def pttl(self, name):
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is None:
+                return -2
+            if entry.expires_at is None:
+                return -1
+            return max(entry.expires_at - _now_ms(), 0)
+
+    def ttl(self, name):
+        pttl = self.pttl(name)
+        return pttl if pttl < 0 else (pttl + 500) // 1000
+
+    def memory_usage(self, name, samples=None):
+        """Approximate bytes held by a key, in the spirit of MEMORY USAGE (samples is accepted and ignored)."""
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is None:
+                return None
+            if entry.type == "string":
+                items = [entry.value]
+            elif entry.type == "hash":
+                items = [item for pair in entry.value.items() for item in pair]
+            elif entry.type in ("list", "set"):
+                items = entry.value
+            else:  # stream: ids and field dicts
+                items = [item for fields in entry.value[1] for pair in fields.items() for item in pair]
+                items.extend("0" * 16 for _ in entry.value[0])
+            # Payload bytes plus a rough per-element and per-key overhead
+            return 56 + len(name) + sum(len(item) + 16 for item in items)
+
+    def dump(self, name):
+        """The value as a Redis DUMP payload (see rdb.py); streams cannot be dumped."""
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is None:
+                return None
+            if entry.type == "stream":
+                raise redis.exceptions.ResponseError("DUMP of stream keys is not supported by the embedded store")
+            raw = _convert_value(entry.type, entry.value, lambda item: item.encode("utf-8", "surrogateescape"))
+            return rdb.encode_payload(entry.type, raw)
+
+    def restore(self, name, ttl, value, replace=False, absttl=False, idletime=None, frequency=None):
+        """Recreates a key from a DUMP payload (strings, lists, hashes and sets, from Redis or the embedded store)."""
+        try:
+            value_type, raw = rdb.decode_payload(value)
+        except ValueError as e:
+            raise redis.exceptions.ResponseError(f"Bad data format: {str(e)}")
+        ttl = _integer(ttl)
+        expires_at = (ttl if absttl else _now_ms() + ttl) if ttl else None
+        with self._lock:
+            self._preserve(name)
+            if self._lookup(name) is not None:
+                if not replace:
+                    raise redis.exceptions.ResponseError("BUSYKEY Target key name already exists.")
+                self._remove(name)
+                self._log("delete", name)
+            if expires_at is not None and expires_at <= _now_ms():
+                return True  # Already expired: like Redis, nothing is created
+            value = _convert_value(value_type, raw, lambda item: item.decode("utf-8", "surrogateescape"))
+            entry = Entry(value_type, value, expires_at)
+            self._store(name, entry)
+            for command in self._entry_commands(name, entry):
+                self._log(*command)
+            self._notify("g", "restore", name)
+            if value_type == "list":
+                self._list_pushed.notify_all()
+            return True
+
+    def scan(self, cursor=0, match=None, count=None, _type=None):
+        """Cursor-based iteration; keys present for the whole scan are returned at least once.
+
+        Like Redis, a call may return fewer than count keys (even none) with a non-zero cursor.
+        """
+        count = _integer(count) if count else 10
+        with self._lock:
+            cursor = _integer(cursor, "invalid cursor")
+            generation, slot = cursor >> _CURSOR_BITS, cursor & _CURSOR_MASK
+            if generation != self._generation:
+                slot = 0
+            keys = []
+            # count bounds the slots examined, not the keys returned, so a selective MATCH
+            # or TYPE cannot hold the lock for a walk of the whole keyspace
+            stop = min(slot + count, len(self._slots))
+            while slot < stop:
+                key = self._slots[slot]
+                slot += 1
+                if key is None or self._lookup(key) is None:
+                    continue
+                if match and not fnmatch.fnmatchcase(key, match):
+                    continue
+                if _type and self._data[key].type != _type:
+                    continue
+                keys.append(key)
+            next_cursor = 0 if slot >= len(self._slots) else (self._generation << _CURSOR_BITS) | slot
+            return next_cursor, keys
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self.scan(cursor=cursor or 0, match=match, count=count, _type=_type)
+            yield from keys
+
+    # ===================== STRINGS =====================
+
+    def get(self, name):
+        with self._lock:
+            entry = self._lookup(name, "string")
+            return entry.value if entry else None
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+        with self._lock:
+            self._preserve(name)
+            existing = self._lookup(name)
+            if (nx and existing is not None) or (xx and existing is None):
+                return None
+            expires_at = None
+            if ex is not None:
+                expires_at = _now_ms() + _integer(ex) * 1000
+            elif px is not None:
+                expires_at = _now_ms() + _integer(px)
+            elif keepttl and existing is not None:
+                expires_at = existing.expires_at
+            self._store(name, Entry("string", _encode(value), expires_at))
+            self._log("set", name, self._data[name].value, expires_at)
+            self._notify("$", "set", name)
+            if expires_at is not None:
+                self._notify("g", "expire", name)
+            return True
+
+    def setex(self, name, time, value):
+        return self.set(name, value, ex=time)
+
+    def mset(self, mapping):
+        with self._lock:
+            encoded = {key: _encode(value) for key, value in mapping.items()}
+            self._preserve(*mapping)
+            for key, value in encoded.items():
+                self._store(key, Entry("string", value))
+            self._log("mset", encoded)
+            self._notify("$", "set", *encoded)
+            return True
+
+    def mget(self, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        with self._lock:
+            values = []
+            for key in keys + list(args):
+                entry = self._lookup(key)
+                values.append(entry.value if entry and entry.type == "string" else None)
+            return values
+
+    def incrby(self, name, amount=1):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "string")
+            try:
+                value = int(entry.value) if entry else 0
+            except ValueError:
+                raise redis.exceptions.ResponseError("value is not an integer or out of range")
+            value += _integer(amount)
+            if entry:
+                entry.value = str(value)
+            else:
+                self._store(name, Entry("string", str(value)))
+            self._log("incrby", name, int(amount))
+            self._notify("$", "incrby", name)
+            return value
+
+    def incr(self, name, amount=1):
+        return self.incrby(name, amount)
+
+    def decrby(self, name, amount=1):
+        return self.incrby(name, -amount)
+
+    def decr(self, name, amount=1):
+        return self.incrby(name, -amount)
+
+    def strlen(self, name):
+        with self._lock:
+            entry = self._lookup(name, "string")
+            return len(entry.value) if entry else 0
+
+    # ===================== HASHES =====================
+
+    def hset(self, name, key=None, value=None, mapping=None, items=None):
+        fields = {}
+        if key is not None:
+            fields[key] = value
+        if mapping:
+            fields.update(mapping)
+        if items:
+            fields.update(zip(items[::2], items[1::2]))
+        if not fields:
+            raise redis.exceptions.DataError("'hset' with no key value pairs")
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "hash")
+            if entry is None:
+                entry = Entry("hash", {})
+                self._store(name, entry)
+            encoded = {str(k): _encode(v) for k, v in fields.items()}
+            added = sum(1 for k in encoded if k not in entry.value)
+            entry.value.update(encoded)
+            self._log("hset", name, encoded)
+            self._notify("h", "hset", name)
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            entry = self._lookup(name, "hash")
+            return entry.value.get(key) if entry else None
+
+    def hmget(self, name, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        with self._lock:
+            entry = self._lookup(name, "hash")
+            values = entry.value if entry else {}
+            return [values.get(k) for k in keys + list(args)]
+
+    def hgetall(self, name):
+        with self._lock:
+            entry = self._lookup(name, "hash")
+            return dict(entry.value) if entry else {}
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "hash")
+            if entry is None:
+                return 0
+            removed = [k for k in keys if entry.value.pop(k, None) is not None]
+            if removed:
+                self._log("hdel", name, *removed)
+                self._notify("h", "hdel", name)
+            if not entry.value:
+                self._remove(name)
+                self._notify("g", "del", name)
+            return len(removed)
+
+    def hlen(self, name):
+        with self._lock:
+            entry = self._lookup(name, "hash")
+            return len(entry.value) if entry else 0
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            amount = _integer(amount)
+            self._preserve(name)
+            entry = self._lookup(name, "hash")
+            try:
+                value = int(entry.value.get(key, 0) if entry else 0) + amount
+            except ValueError:
+                raise redis.exceptions.ResponseError("hash value is not an integer")
+            if entry is None:
+                entry = Entry("hash", {})
+                self._store(name, entry)
+            entry.value[key] = str(value)
+            self._log("hincrby", name, key, amount)
+            self._notify("h", "hincrby", name)
+            return value
+
+    # ===================== LISTS =====================
+
+    def _push(self, name, values, left):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "list")
+            if entry is None:
+                entry = Entry("list", [])
+                self._store(name, entry)
+            encoded = [_encode(v) for v in values]
+            if left:
+                entry.value[0:0] = reversed(encoded)
+            else:
+                entry.value.extend(encoded)
+            self._log("lpush" if left else "rpush", name, *encoded)
+            self._notify("l", "lpush" if left else "rpush", name)
+            self._list_pushed.notify_all()
+            return len(entry.value)
+
+    def rpush(self, name, *values):
+        return self._push(name, values, left=False)
+
+    def lpush(self, name, *values):
+        return self._push(name, values, left=True)
+
+    def _pop(self, name, count, left):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "list")
+            if entry is None:
+                return None
+            n = 1 if count is None else _integer(count)
+            if left:
+                popped, entry.value[:n] = entry.value[:n], []
+            else:
+                popped = entry.value[-n:][::-1] if n else []
+                del entry.value[len(entry.value) - len(popped):]
+            if popped:
+                self._log("lpop" if left else "rpop", name, len(popped))
+                self._notify("l", "lpop" if left else "rpop", name)
+            if not entry.value:
+                self._remove(name)
+                self._notify("g", "del", name)
+            if count is None:
+                return popped[0] if popped else None
+            return popped
+
+    def lpop(self, name, count=None):
+        return self._pop(name, count, left=True)
+
+    def rpop(self, name, count=None):
+        return self._pop(name, count, left=False)
+
+    def llen(self, name):
+        with self._lock:
+            entry = self._lookup(name, "list")
+            return len(entry.value) if entry else 0
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            entry = self._lookup(name, "list")
+            if entry is None:
+                return []
+            end = None if end == -1 else end + 1
+            return entry.value[start:end]
+
+    def lmove(self, first_list, second_list, src="LEFT", dest="RIGHT"):
+        with self._lock:
+            self._preserve(first_list, second_list)
+            source = self._lookup(first_list, "list")
+            target = self._lookup(second_list, "list")
+            if source is None:
+                return None
+            item = source.value.pop(0 if src.upper() == "LEFT" else -1)
+            if target is None:
+                target = Entry("list", [])
+                self._store(second_list, target)
+            if dest.upper() == "LEFT":
+                target.value.insert(0, item)
+            else:
+                target.value.append(item)
+            self._log("lmove", first_list, second_list, src, dest)
+            self._notify("l", "lpop" if src.upper() == "LEFT" else "rpop", first_list)
+            self._notify("l", "lpush" if dest.upper() == "LEFT" else "rpush", second_list)
+            if not source.value:
+                self._remove(first_list)
+                self._notify("g", "del", first_list)
+            self._list_pushed.notify_all()
+            return item
+
+    def lrem(self, name, count, value):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "list")
+            if entry is None:
+                return 0
+            count, value = _integer(count), _encode(value)
+            matches = [i for i, item in enumerate(entry.value) if item == value]
+            # count > 0 removes from the head, count < 0 from the tail, 0 removes all
+            matches = matches[:count] if count > 0 else matches[count:] if count < 0 else matches
+            for i in reversed(matches):
+                del entry.value[i]
+            if matches:
+                self._log("lrem", name, count, value)
+                self._notify("l", "lrem", name)
+            if not entry.value:
+                self._remove(name)
+                self._notify("g", "del", name)
+            return len(matches)
+
+    def _wait_for_list(self, keys, timeout):
+        """Waits (lock held) until one of keys is a non-empty list; returns it, or None after timeout (0 = forever)."""
+        deadline = time.monotonic() + float(timeout) if timeout else None
+        while True:
+            for key in keys:
+                if self._lookup(key, "list") is not None:
+                    return key
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self._list_pushed.wait(remaining)
+
+    def blpop(self, keys, timeout=0):
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        with self._lock:
+            key = self._wait_for_list(keys, timeout)
+            return (key, self.lpop(key)) if key is not None else None
+
+    def blmove(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        with self._lock:
+            if self._wait_for_list([first_list], timeout) is None:
+                return None
+            return self.lmove(first_list, second_list, src, dest)
+
+    # ===================== SETS (queue consumers) =====================
+
+    def sadd(self, name, *values):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "set")
+            if entry is None:
+                entry = Entry("set", set())
+                self._store(name, entry)
+            added = [v for v in dict.fromkeys(_encode(v) for v in values) if v not in entry.value]
+            entry.value.update(added)
+            if added:
+                self._log("sadd", name, *added)
+                self._notify("s", "sadd", name)
+            return len(added)
+
+    def srem(self, name, *values):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "set")
+            if entry is None:
+                return 0
+            removed = [v for v in dict.fromkeys(_encode(v) for v in values) if v in entry.value]
+            entry.value.difference_update(removed)
+            if removed:
+                self._log("srem", name, *removed)
+                self._notify("s", "srem", name)
+            if not entry.value:
+                self._remove(name)
+                self._notify("g", "del", name)
+            return len(removed)
+
+    def smembers(self, name):
+        with self._lock:
+            entry = self._lookup(name, "set")
+            return set(entry.value) if entry else set()
+
+    def sismember(self, name, value):
+        with self._lock:
+            entry = self._lookup(name, "set")
+            return entry is not None and _encode(value) in entry.value
+
+    def scard(self, name):
+        with self._lock:
+            entry = self._lookup(name, "set")
+            return len(entry.value) if entry else 0
+
+    # ===================== STREAMS (request logs) =====================
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True, **kwargs):
+        with self._lock:
+            self._preserve(name)
+            entry = self._lookup(name, "stream")
+            if entry is None:
+                entry = Entry("stream", ([], []))  # parallel sorted id tuples and field dicts
+                self._store(name, entry)
+            ids, values = entry.value
+            if id == "*":
+                ms = _now_ms()
+                last = max(self._stream_seq, ids[-1] if ids else (0, 0))
+                new_id = (ms, 0) if ms > last[0] else (last[0], last[1] + 1)
+            else:
+                new_id = _stream_id(id)
+                if ids and new_id <= ids[-1]:
+                    raise redis.exceptions.ResponseError(
+                        "The ID specified in XADD is equal or smaller than the target stream top item")
+            self._stream_seq = max(self._stream_seq, new_id)
+            encoded = {str(k): _encode(v) for k, v in fields.items()}
+            ids.append(new_id)
+            values.append(encoded)
+            if maxlen is not None and len(ids) > maxlen:
+                del ids[:len(ids) - maxlen]
+                del values[:len(values) - maxlen]
+            entry_id = f"{new_id[0]}-{new_id[1]}"
+            self._log("xadd", name, entry_id, encoded, maxlen)
+            self._notify("t", "xadd", name)
+            return entry_id
+
+    def _stream_bound(self, bound, low):
+        """Converts an XRANGE bound ("-", "+", "ms", "ms-seq", "(id") to (id tuple, exclusive)."""
+        exclusive = bound.startswith("(")
+        bound = bound.lstrip("(")
+        if bound == "-":
+            return (0, 0), False
+        if bound == "+":
+            return (float("inf"), float("inf")), False
+        if "-" not in bound:
+            return ((int(bound), 0) if low else (int(bound), float("inf"))), exclusive
+        return _stream_id(bound), exclusive
+
+    def xrevrange(self, name, max="+", min="-", count=None):
+        with self._lock:
+            entry = self._lookup(name, "stream")
+            if entry is None:
+                return []
+            ids, values = entry.value
+            high, high_exclusive = self._stream_bound(max, low=False)
+            low, low_exclusive = self._stream_bound(min, low=True)
+            stop = bisect_left(ids, high) if high_exclusive else bisect_right(ids, high)
+            start = bisect_right(ids, low) if low_exclusive else bisect_left(ids, low)
+            result = []
+            for i in range(stop - 1, start - 1, -1):
+                if count is not None and len(result) >= count:
+                    break
+                result.append((f"{ids[i][0]}-{ids[i][1]}", dict(values[i])))
+            return result
+
+    def xrange(self, name, min="-", max="+", count=None):
+        return list(reversed(self.xrevrange(name, max=max, min=min)))[:count]
+
+    def xlen(self, name):
+        with self._lock:
+            entry = self._lookup(name, "stream")
+            return len(entry.value[0]) if entry else 0
+
+    # ===================== PUB/SUB =====================
+
+    def publish(self, channel, message):
+        with self._lock:
+            return self._deliver(channel, _encode(message))
+
+    def _deliver(self, channel, data):
+        """Hands a message to channel subscribers and matching pattern subscribers; returns how many got it."""
+        receivers = 0
+        for subscriber in self._channels.get(channel, ()):
+            subscriber.put({"type": "message", "pattern": None, "channel": channel, "data": data})
+            receivers += 1
+        for pattern, subscribers in self._patterns.items():
+            if fnmatch.fnmatchcase(channel, pattern):
+                for subscriber in subscribers:
+                    subscriber.put({"type": "pmessage", "pattern": pattern, "channel": channel, "data": data})
+                    receivers += 1
+        return receivers
+
+    def pubsub(self, ignore_subscribe_messages=False, **kwargs):
+        return EmbeddedPubSub(self, ignore_subscribe_messages)
+
+    # ===================== PIPELINES =====================
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return EmbeddedPipeline(self)
+
+class EmbeddedPubSub:
+    """Minimal redis-py PubSub lookalike backed by in-process queues."""
+
+    def __init__(self, store, ignore_subscribe_messages=False):
+        self._store = store
+        self._queue = queue.Queue()
+        self._channels = set()
+        self._patterns = set()
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+
+    def subscribe(self, *channels):
+        with self._store._lock:
+            for channel in channels:
+                self._store._channels.setdefault(channel, set()).add(self._queue)
+                self._channels.add(channel)
+                if not self.ignore_subscribe_messages:
+                    self._queue.put({"type": "subscribe", "pattern": None, "channel": channel,
+                                     "data": len(self._channels)})
+
+    def unsubscribe(self, *channels):
+        with self._store._lock:
+            for channel in channels or list(self._channels):
+                self._store._channels.get(channel, set()).discard(self._queue)
+                self._channels.discard(channel)
+
+    def psubscribe(self, *patterns):
+        with self._store._lock:
+            for pattern in patterns:
+                self._store._patterns.setdefault(pattern, set()).add(self._queue)
+                self._patterns.add(pattern)
+                if not self.ignore_subscribe_messages:
+                    self._queue.put({"type": "psubscribe", "pattern": None, "channel": pattern,
+                                     "data": len(self._channels) + len(self._patterns)})
+
+    def punsubscribe(self, *patterns):
+        with self._store._lock:
+            for pattern in patterns or list(self._patterns):
+                subscribers = self._store._patterns.get(pattern, set())
+                subscribers.discard(self._queue)
+                if not subscribers:
+                    self._store._patterns.pop(pattern, None)
+                self._patterns.discard(pattern)
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def listen(self):
+        while True:
+            yield self._queue.get()
+
+    def close(self):
+        self.unsubscribe()
+        self.punsubscribe()
+
+class EmbeddedPipeline:
+    """Queues calls and runs them under the store lock, so a pipeline is always atomic."""
+
+    def __init__(self, store):
+        self._store = store
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._store, name)
+
+        def queue_call(*args, **kwargs):
+            self._calls.append((method, args, kwargs))
+            return self
+        return queue_call
+
+    def execute(self, raise_on_error=True):
+        results = []
+        with self._store._lock:
+            for method, args, kwargs in self._calls:
+                try:
+                    results.append(method(*args, **kwargs))
+                except redis.exceptions.RedisError as e:
+                    results.append(e)
+        self._calls = []
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+class AsyncEmbeddedStore:
+    """redis.asyncio-style facade over an EmbeddedStore (used by asgi_app)."""
+
+    def __init__(self, store):
+        self._store = store
+        self.connection_pool = None
+
+    def __getattr__(self, name):
+        method = getattr(self._store, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    async def scan_iter(self, match=None, count=None, _type=None):
+        for key in self._store.scan_iter(match=match, count=count, _type=_type):
+            yield key
+
+    # Blocking pops wait in a thread so the event loop keeps running
+    async def blpop(self, keys, timeout=0):
+        return await asyncio.to_thread(self._store.blpop, keys, timeout)
+
+    async def blmove(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        return await asyncio.to_thread(self._store.blmove, first_list, second_list, timeout, src, dest)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncEmbeddedPipeline(self._store)
+
+    async def aclose(self):
+        self._store.close()
+
+class AsyncEmbeddedPipeline(EmbeddedPipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._calls = []
+
+    async def execute(self, raise_on_error=True):
+        return EmbeddedPipeline.execute(self, raise_on_error)
+
+def create_embedded_store():
+    """Builds the embedded store from the environment."""
+    aof_path = os.environ.get('EMBEDDED_AOF_PATH', 'appendonly.aof')
+    store = EmbeddedStore(
+        aof_path=aof_path or None,
+        aof_fsync=os.environ.get('EMBEDDED_AOF_FSYNC', FSYNC_EVERYSEC),
+        aof_rewrite_min_size=int(os.environ.get('EMBEDDED_AOF_REWRITE_MIN_SIZE', 64 * 1024 * 1024)),
+        aof_rewrite_percentage=int(os.environ.get('EMBEDDED_AOF_REWRITE_PERCENTAGE', 100))
+    )
+    logger.info(f"Using embedded storage engine (AOF: {aof_path or 'disabled'})")
+    return store
@@ -0,0 +1,212 @@
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from keyspace import enable_keyspace_events, key_from_channel, poll_messages
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUE_EVENTS_CHANNEL = "events:queue"  # {"queue", "values", "count"} published by /enqueue
+KEYSPACE_EVENTS = "Kg$lhxe"           # Generic, string, list, hash, expired and evicted events
+MAX_EVENT_VALUES = 100                # Queue items carried per event; "count" has the full number
+
+POLICY_COALESCE = "coalesce"
+POLICY_DROP = "drop"
+
+class Subscriber:
+    """One SSE client: its filters and a bounded buffer of pending events.
+
+    coalesce keeps only the latest change per key, merging queue pushes, so a
+    slow client skips intermediate states. drop keeps events in order and
+    discards new ones while the buffer is full. Either way the client is told
+    how many events it lost so it can re-read.
+    """
+
+    def __init__(self, patterns, types, policy, max_pending, notify):
+        self.patterns = patterns
+        self.types = types
+        self.policy = policy
+        self.max_pending = max_pending
+        self._notify = notify  # Called (from the listener thread) when events are ready
+        self._lock = threading.Lock()
+        self._pending = OrderedDict() if policy == POLICY_COALESCE else deque()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def matches(self, event):
+        if event["type"] not in self.types:
+            return False
+        key = event["key"] if event["type"] == "key" else event["queue"]
+        return any(fnmatch.fnmatchcase(key, pattern) for pattern in self.patterns)
+
+    def offer(self, event):
+        with self._lock:
+            if self.policy == POLICY_COALESCE:
+                slot = (event["type"], event.get("key") or event.get("queue"))
+                previous = self._pending.pop(slot, None)
+                if previous is not None:
+                    self.coalesced += 1
+                    if event["type"] == "queue":
+                        event = dict(event, values=(previous["values"] + event["values"])[-MAX_EVENT_VALUES:],
+                                     count=previous["count"] + event["count"])
+                elif len(self._pending) >= self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[slot] = event
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    return
+                self._pending.append(event)
+        self._notify()
+
+    def drain(self):
+        """Returns (pending events, events lost since the last drain)."""
+        with self._lock:
+            events = list(self._pending.values()) if self.policy == POLICY_COALESCE else list(self._pending)
+            self._pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        return events, dropped
+
+class EventHub:
+    """Fans keyspace notifications and queue pushes out to SSE subscribers.
+
+    Each worker holds a single pub/sub connection, however many clients are
+    connected. It is opened on the first subscription.
+    """
+
+    def __init__(self, client, max_subscribers=64, max_pending=1000, heartbeat=15.0):
+        self.client = client
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    # ===================== PUBLISHING =====================
+
+    @staticmethod
+    def queue_event_message(queue, values):
+        """Payload for QUEUE_EVENTS_CHANNEL announcing values pushed onto queue."""
+        return json.dumps({"queue": queue, "values": values[:MAX_EVENT_VALUES], "count": len(values)})
+
+    # ===================== SUBSCRIPTIONS =====================
+
+    def subscribe(self, patterns, types, policy, notify):
+        """Registers a subscriber, or returns None when this worker is at max_subscribers."""
+        self._ensure_listener()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscriber = Subscriber(patterns, types, policy, self.max_pending, notify)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.dropped += subscriber.dropped
+            self.coalesced += subscriber.coalesced
+
+    def _dispatch(self, event):
+        self.received += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.matches(event):
+                subscriber.offer(event)
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name="event-hub", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(QUEUE_EVENTS_CHANNEL)
+                enable_keyspace_events(self.client, pubsub, KEYSPACE_EVENTS)
+                for message in poll_messages(pubsub):
+                    if message.get("type") == "pmessage":
+                        self._dispatch({"type": "key", "key": key_from_channel(message["channel"]),
+                                        "event": message["data"], "time": time.time()})
+                    elif message.get("type") == "message":
+                        self._dispatch(dict(json.loads(message["data"]), type="queue", time=time.time()))
+            except Exception as e:
+                logger.warning(f"Event hub listener error: {str(e)}")
+                time.sleep(1)
+
+    # ===================== SSE =====================
+
+    def frames(self, subscriber):
+        """Drains subscriber into SSE frames (an empty list when nothing is pending)."""
+        events, dropped = subscriber.drain()
+        frames = [f"event: dropped\ndata: {json.dumps({'count': dropped})}\n\n"] if dropped else []
+        frames.extend(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events)
+        self.delivered += len(events)
+        return frames
+
+    def stream(self, subscriber, wait):
+        """Yields SSE frames for subscriber until the client goes away.
+
+        wait(timeout) blocks until the subscriber is notified or timeout passes.
+        """
+        try:
+            yield ": connected\n\n"
+            while True:
+                frames = self.frames(subscriber)
+                yield from frames
+                if not frames and not wait(self.heartbeat):
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'max_subscribers': self.max_subscribers,
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.dropped + sum(s.dropped for s in subscribers),
+            'coalesced': self.coalesced + sum(s.coalesced for s in subscribers),
+            'rejected': self.rejected
+        }
+
+def parse_event_args(args):
+    """Parses /events query params into (patterns, types, policy); raises ValueError if invalid."""
+    patterns = args.getlist("pattern") or ["*"]
+    types = set(args.get("types", "key,queue").split(","))
+    policy = args.get("policy", POLICY_COALESCE)
+    if not types <= {"key", "queue"}:
+        raise ValueError("types must be a comma-separated subset of key,queue")
+    if policy not in (POLICY_COALESCE, POLICY_DROP):
+        raise ValueError("policy must be 'coalesce' or 'drop'")
+    return patterns, types, policy
+
+def create_event_hub(client):
+    """Builds the EventHub from EVENTS_* environment variables."""
+    return EventHub(
+        client,
+        max_subscribers=int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 64)),
+        max_pending=int(os.environ.get('EVENTS_MAX_PENDING', 1000)),
+        heartbeat=float(os.environ.get('EVENTS_HEARTBEAT', 15.0))
+    )
@@ -0,0 +1,29 @@
+import os
+import shutil
+import tempfile
+
+# Picked up automatically by `gunicorn app:app` from the working directory.
+
+# Workers write Prometheus samples here so /metrics can merge every worker (see metrics.py).
+# Set before the app is imported in the workers.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'redis-clone-metrics'))
+
+# Threaded workers, so a long-polling /dequeue holds one thread rather than a whole worker.
+# Each worker lets at most half its threads long-poll (see queues.py) and a quarter
+# stream /events (see events.py); the rest keep serving.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+os.environ.setdefault('QUEUE_MAX_BLOCKING', str(threads // 2 if worker_class == 'gthread' else 0))
+# Each /events stream also holds a thread for as long as the client stays connected
+os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', str(threads // 4 if worker_class == 'gthread' else 0))
+
+def on_starting(server):
+    """Clears metric files left over from a previous run."""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def child_exit(server, worker):
+    """Drops a dead worker's live gauges from the aggregate."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -2,7 +2,10 @@ import redis
 import logging
 import os
 from flask import Blueprint, jsonify
-from config import redis_client
+from config import mask_url, redis_client, near_cache, queue_service, event_hub, value_compressor, usage_analytics, keyspace_transfer, readiness
+from auth import get_api_key_cache_stats, get_api_log_stats
+from circuit_breaker import redis_breaker
+from scripts import scripts
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -10,6 +13,20 @@ logger = logging.getLogger(__name__)
 
 health_bp = Blueprint('health', __name__)
 
+@health_bp.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness: the worker is up and serving; never touches Redis."""
+    return jsonify({'status': 'alive'})
+
+@health_bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once Redis has answered and while the circuit breaker is closed, else 503."""
+    stats = readiness.stats()
+    if not stats['ready']:
+        retry_after = max(1, int(readiness.retry_after() + 0.5))
+        return jsonify(stats), 503, {'Retry-After': str(retry_after)}
+    return jsonify(stats)
+
 @health_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify application and Redis status"""
@@ -25,15 +42,51 @@ def health_check():
         status['environment'] = 'railway'
         status['railway_service_id'] = os.environ.get('RAILWAY_SERVICE_ID', 'unknown')
     
-    # Add Redis connection information
+    # Add Redis connection information (/health is public, so never with passwords)
     status['redis_connection_info'] = {
-        'redis_url': os.environ.get('REDIS_URL', 'Not set'),
-        'database_url': os.environ.get('DATABASE_URL', 'Not set'),
+        'redis_url': mask_url(os.environ.get('REDIS_URL', 'Not set')),
+        'database_url': mask_url(os.environ.get('DATABASE_URL', 'Not set')),
         'redis_host': os.environ.get('REDIS_HOST', 'localhost'),
         'redis_port': os.environ.get('REDIS_PORT', '6379')
     }
+
+    # Per-worker API key cache counters
+    status['api_key_cache'] = get_api_key_cache_stats()
+    # Per-worker request log buffer counters
+    status['api_log_buffer'] = get_api_log_stats()
+    # Circuit breaker state and trip counts for this worker
+    status['circuit_breaker'] = redis_breaker.stats()
+    # Lua script calls and (re)loads for this worker
+    status['scripts'] = scripts.stats()
+    # Stored-value compression savings for this worker
+    status['value_compression'] = value_compressor.stats()
+    # Near-cache hit ratio, memory use and invalidation lag (when enabled)
+    if near_cache is not None:
+        status['near_cache'] = near_cache.stats()
+    # Long-poll slots and requeued items for this worker
+    status['queues'] = queue_service.stats()
+    # SSE subscribers and delivered/dropped/coalesced events for this worker
+    status['events'] = event_hub.stats()
+    # Usage analytics counters waiting for / written by the background flush (when enabled)
+    if usage_analytics is not None:
+        status['analytics'] = usage_analytics.stats()
+    # Keys streamed out by /export and restored by /import in this worker
+    status['transfer'] = keyspace_transfer.stats()
+    # Reads routed per replica, their lag and ejections (with REDIS_REPLICA_URLS)
+    if hasattr(redis_client, 'replica_stats'):
+        status['replicas'] = redis_client.replica_stats()
+    # Shard layout and commands routed per node (sharded backends only)
+    if hasattr(redis_client, 'shard_stats'):
+        status['shards'] = redis_client.shard_stats()
     
-    # Check Redis connection
+    # Startup timings and whether Redis has answered yet
+    status['startup'] = readiness.stats()
+
+    # Check Redis connection (not before the startup check has reached it, so /health never waits)
+    if not readiness.ready:
+        status['status'] = 'starting'
+        status['redis_error'] = readiness.last_error
+        return jsonify(status)
     try:
         redis_info = redis_client.info()
         status['redis_connected'] = True
@@ -47,10 +100,10 @@ def health_check():
         # Add detailed environment information for troubleshooting
         if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_SERVICE_ID'):
             status['railway_debug_info'] = {
-                'REDIS_URL': os.environ.get('REDIS_URL', 'Not set'),
-                'DATABASE_URL': os.environ.get('DATABASE_URL', 'Not set'),
-                'REDISHOST': os.environ.get('REDISHOST', 'Not set'),
-                'REDIS_URI': os.environ.get('REDIS_URI', 'Not set'),
+                'REDIS_URL': mask_url(os.environ.get('REDIS_URL', 'Not set')),
+                'DATABASE_URL': mask_url(os.environ.get('DATABASE_URL', 'Not set')),
+                'REDISHOST': mask_url(os.environ.get('REDISHOST', 'Not set')),
+                'REDIS_URI': mask_url(os.environ.get('REDIS_URI', 'Not set')),
                 'REDIS_HOST': os.environ.get('REDIS_HOST', 'Not set'),
                 'REDIS_PORT': os.environ.get('REDIS_PORT', 'Not set')
             }
@@ -0,0 +1,38 @@
+import logging
+import redis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KEYSPACE_PATTERN = "__keyspace@*__:*"  # Every key in every database
+
+def enable_keyspace_events(client, pubsub, flags):
+    """Makes sure notify-keyspace-events includes flags, then psubscribes pubsub to all keyspace channels.
+
+    Returns False (and leaves the server config alone) if the server refuses, e.g. CONFIG is disabled.
+    """
+    try:
+        current = client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        if "A" not in current and not set(flags) <= set(current):
+            client.config_set("notify-keyspace-events", "".join(sorted(set(current) | set(flags))))
+        pubsub.psubscribe(KEYSPACE_PATTERN)
+        return True
+    except (redis.exceptions.RedisError, AttributeError) as e:
+        logger.warning(f"Keyspace notifications unavailable: {str(e)}")
+        return False
+
+def poll_messages(pubsub, timeout=1.0):
+    """Yields the messages of a subscribed pubsub forever.
+
+    Polls get_message() instead of using listen(): on an idle channel, a blocking
+    read would hit the client's socket_timeout and tear the subscription down.
+    """
+    while True:
+        message = pubsub.get_message(timeout=timeout)
+        if message is not None:
+            yield message
+
+def key_from_channel(channel):
+    """Returns the key a keyspace channel refers to, e.g. "user:1" for "__keyspace@0__:user:1"."""
+    return channel.split(":", 1)[1]
@@ -0,0 +1,379 @@
+"""Incremental memory analysis of the keyspace: SCAN plus MEMORY USAGE, TYPE and length per key.
+
+An admin starts a walk with POST /memory_report. It runs in the background of
+the worker that received the request, one SCAN page at a time, and sleeps
+between pages so it keeps to a small share of Redis' time
+(MEMORY_ANALYZER_DUTY_CYCLE). The report aggregates keys by prefix and type,
+keeps the biggest keys and a TTL histogram, and is saved to Redis with its
+progress as it grows. Every worker therefore answers GET /memory_report with
+the same report, and a lock key allows only one walk at a time.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import redis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEMORY_REPORT_KEY = "memory_report"
+MEMORY_REPORT_LOCK = "memory_report:lock"
+
+# Command giving a key's length (elements, or bytes for strings), by type
+LENGTH_COMMANDS = {"string": "strlen", "hash": "hlen", "list": "llen", "set": "scard", "zset": "zcard", "stream": "xlen"}
+
+# Upper bounds (ms) of the TTL histogram buckets; keys without a TTL are counted under "none"
+TTL_BUCKETS = [("<1m", 60000), ("<1h", 3600000), ("<1d", 86400000), ("<7d", 604800000), (">=7d", None)]
+
+# Prefixes past the cap are pooled here, so a keyspace of unprefixed keys stays bounded
+OTHER_PREFIX = "(other)"
+
+def key_prefix(key, delimiters=":"):
+    """`apikey:` for `apikey:abc`, `{jobs}:` for `{jobs}:processing:w1`.
+
+    A key without a delimiter is its own prefix (queue names, `api_logs`).
+    """
+    for i, char in enumerate(key):
+        if char in delimiters:
+            return key[:i + 1]
+    return key
+
+class MemoryReport:
+    """Running aggregates of one walk; to_dict() is what GET /memory_report returns."""
+
+    def __init__(self, run_id, match=None, top=20, samples=5, max_prefixes=1000, delimiters=":", total=None):
+        self.run_id = run_id
+        self.match = match
+        self.top = top
+        self.samples = samples
+        self.max_prefixes = max_prefixes
+        self.delimiters = delimiters
+        self.total = total  # DBSIZE when the walk started, for the progress estimate
+        self.state = "running"
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.scanned = 0
+        self.pages = 0
+        self.busy_seconds = 0.0
+        self.keys = 0
+        self.bytes = 0
+        self.unmeasured = 0  # Keys whose MEMORY USAGE failed (e.g. the command is renamed away)
+        self.prefixes = {}  # prefix -> [keys, bytes, elements]
+        self.types = {}     # type -> [keys, bytes]
+        self.ttl = {"none": 0, **{label: 0 for label, _ in TTL_BUCKETS}}
+        self._top = []      # min-heap of (bytes, key, type, length, pttl)
+
+    def add(self, key, key_type, size, length, pttl):
+        """Counts one key; size is MEMORY USAGE in bytes (None if it failed), pttl as returned by PTTL."""
+        if size is None:
+            self.unmeasured += 1
+            size = 0
+        self.keys += 1
+        self.bytes += size
+        prefix = key_prefix(key, self.delimiters)
+        if prefix not in self.prefixes and len(self.prefixes) >= self.max_prefixes:
+            prefix = OTHER_PREFIX
+        stats = self.prefixes.setdefault(prefix, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += size
+        stats[2] += length or 0
+        by_type = self.types.setdefault(key_type, [0, 0])
+        by_type[0] += 1
+        by_type[1] += size
+        self.ttl[self._ttl_bucket(pttl)] += 1
+        entry = (size, key, key_type, length, pttl)
+        if len(self._top) < self.top:
+            heapq.heappush(self._top, entry)
+        elif entry > self._top[0]:
+            heapq.heapreplace(self._top, entry)
+
+    @staticmethod
+    def _ttl_bucket(pttl):
+        if pttl is None or pttl < 0:
+            return "none"
+        for label, bound in TTL_BUCKETS:
+            if bound is None or pttl < bound:
+                return label
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        percent = None
+        if self.state == "complete":
+            percent = 100.0
+        elif self.total:
+            percent = round(min(self.scanned / self.total, 0.99) * 100, 1)
+        prefixes = sorted(self.prefixes.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'run_id': self.run_id,
+            'state': self.state,
+            'error': self.error,
+            'match': self.match,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': {
+                'scanned': self.scanned,
+                'estimated_total': self.total,
+                'percent': percent,
+                'pages': self.pages,
+                'elapsed_seconds': round(elapsed, 3),
+                'busy_seconds': round(self.busy_seconds, 3)
+            },
+            'totals': {'keys': self.keys, 'bytes': self.bytes, 'unmeasured': self.unmeasured},
+            'prefixes': [
+                {'prefix': prefix, 'keys': keys, 'bytes': size, 'avg_bytes': size // keys if keys else 0,
+                 'elements': elements}
+                for prefix, (keys, size, elements) in prefixes
+            ],
+            'types': {key_type: {'keys': keys, 'bytes': size} for key_type, (keys, size) in sorted(self.types.items())},
+            'ttl': self.ttl,
+            'top_keys': [
+                {'key': key, 'type': key_type, 'bytes': size, 'length': length,
+                 'ttl_ms': pttl if pttl is not None and pttl >= 0 else None}
+                for size, key, key_type, length, pttl in sorted(self._top, reverse=True)
+            ]
+        }
+
+def _lock_owner(client):
+    # The lock is read on the primary when reads go to replicas, which may lag behind it
+    return getattr(client, "primary", client)
+
+def _queue_lengths(pipe, keys, types):
+    """Queues one length command per key whose type has one; returns the keys it queued for."""
+    queued = []
+    for key, key_type in zip(keys, types):
+        command = LENGTH_COMMANDS.get(key_type)
+        if command is not None:
+            getattr(pipe, command)(key)
+            queued.append(key)
+    return queued
+
+class MemoryAnalyzer:
+    """Runs walks in a background thread of this worker; see the module docstring.
+
+    Each page costs two pipelined round trips (TYPE, MEMORY USAGE and PTTL,
+    then the type's length command). After a page the walk sleeps long enough
+    that Redis spends at most `duty_cycle` of the wall time on it.
+    """
+
+    def __init__(self, client, page_size=200, samples=5, top=20, duty_cycle=0.1, max_prefixes=1000,
+                 delimiters=":", save_interval=1.0, lock_ttl=60):
+        self.client = client
+        self.page_size = page_size
+        self.samples = samples
+        self.top = top
+        self.duty_cycle = duty_cycle
+        self.max_prefixes = max_prefixes
+        self.delimiters = delimiters
+        self.save_interval = save_interval
+        self.lock_ttl = lock_ttl
+        self.current = None  # MemoryReport of the walk running in this worker
+
+    # ===================== CONTROL =====================
+
+    def start(self, match=None, top=None):
+        """Starts a walk; returns its report, or None if a walk is already running somewhere."""
+        run_id = uuid.uuid4().hex
+        if not self.client.set(MEMORY_REPORT_LOCK, run_id, nx=True, ex=self.lock_ttl):
+            return None
+        report = MemoryReport(run_id, match=match, top=top or self.top, samples=self.samples,
+                              max_prefixes=self.max_prefixes, delimiters=self.delimiters,
+                              total=self.client.dbsize())
+        self.current = report
+        self._save(report)
+        threading.Thread(target=self._run, args=(report,), name="memory-analyzer", daemon=True).start()
+        logger.info(f"Memory analysis {run_id} started (match={match or '*'}, ~{report.total} keys)")
+        return report
+
+    def cancel(self):
+        """Stops the running walk (in whichever worker runs it) at its next page; True if one was running."""
+        return bool(self.client.delete(MEMORY_REPORT_LOCK))
+
+    def report(self):
+        """The latest report from any worker, or None if no walk has run yet."""
+        raw = self.client.get(MEMORY_REPORT_KEY)
+        if raw is None:
+            return None
+        report = json.loads(raw)
+        if report['state'] == "running" and not self.client.exists(MEMORY_REPORT_LOCK):
+            # The worker running it died (the lock expired) or it was cancelled before its last save
+            report['state'] = "interrupted"
+        return report
+
+    # ===================== WALK =====================
+
+    def _run(self, report):
+        try:
+            self._walk(report)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Memory analysis {report.run_id} failed: {str(e)}")
+            report.finish("failed", str(e))
+        self.current = None
+        try:
+            self._save(report)
+            if report.state != "cancelled" and _lock_owner(self.client).get(MEMORY_REPORT_LOCK) == report.run_id:
+                self.client.delete(MEMORY_REPORT_LOCK)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Could not save memory analysis {report.run_id}: {str(e)}")
+
+    def _walk(self, report):
+        cursor = 0
+        saved = time.monotonic()
+        while True:
+            started = time.perf_counter()
+            cursor, keys = self.client.scan(cursor=cursor, match=report.match, count=self.page_size)
+            self._sample(report, [key for key in keys if key not in (MEMORY_REPORT_KEY, MEMORY_REPORT_LOCK)])
+            busy = time.perf_counter() - started
+            report.busy_seconds += busy
+            report.pages += 1
+            if int(cursor) == 0:
+                report.finish("complete")
+                logger.info(f"Memory analysis {report.run_id} complete: {report.keys} keys, {report.bytes} bytes")
+                return
+            if _lock_owner(self.client).get(MEMORY_REPORT_LOCK) != report.run_id:
+                report.finish("cancelled")
+                logger.info(f"Memory analysis {report.run_id} cancelled after {report.scanned} keys")
+                return
+            self.client.expire(MEMORY_REPORT_LOCK, self.lock_ttl)
+            if time.monotonic() - saved >= self.save_interval:
+                self._save(report)
+                saved = time.monotonic()
+            time.sleep(busy * (1 - self.duty_cycle) / self.duty_cycle)
+
+    def _sample(self, report, keys):
+        report.scanned += len(keys)
+        if not keys:
+            return
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+                pipe.memory_usage(key, samples=report.samples)
+                pipe.pttl(key)
+            replies = pipe.execute(raise_on_error=False)
+        types, sizes, pttls = replies[0::3], replies[1::3], replies[2::3]
+        with self.client.pipeline(transaction=False) as pipe:
+            queued = _queue_lengths(pipe, keys, types)
+            lengths = dict(zip(queued, pipe.execute(raise_on_error=False) if queued else []))
+        _add_page(report, keys, types, sizes, pttls, lengths)
+
+    def _save(self, report):
+        self.client.set(MEMORY_REPORT_KEY, json.dumps(report.to_dict()))
+
+def _add_page(report, keys, types, sizes, pttls, lengths):
+    """Adds one page's replies; keys deleted since SCAN returned them are skipped."""
+    for key, key_type, size, pttl in zip(keys, types, sizes, pttls):
+        if isinstance(key_type, Exception) or key_type == "none":
+            continue
+        length = lengths.get(key)
+        report.add(key, key_type, None if isinstance(size, Exception) else size,
+                   None if isinstance(length, Exception) else length,
+                   None if isinstance(pttl, Exception) else pttl)
+
+class AsyncMemoryAnalyzer(MemoryAnalyzer):
+    """MemoryAnalyzer for a redis.asyncio client (asgi_app); walks run as asyncio tasks."""
+
+    async def start(self, match=None, top=None):
+        run_id = uuid.uuid4().hex
+        if not await self.client.set(MEMORY_REPORT_LOCK, run_id, nx=True, ex=self.lock_ttl):
+            return None
+        report = MemoryReport(run_id, match=match, top=top or self.top, samples=self.samples,
+                              max_prefixes=self.max_prefixes, delimiters=self.delimiters,
+                              total=await self.client.dbsize())
+        self.current = report
+        await self._save(report)
+        self._task = asyncio.create_task(self._run(report))
+        logger.info(f"Memory analysis {run_id} started (match={match or '*'}, ~{report.total} keys)")
+        return report
+
+    async def cancel(self):
+        return bool(await self.client.delete(MEMORY_REPORT_LOCK))
+
+    async def report(self):
+        raw = await self.client.get(MEMORY_REPORT_KEY)
+        if raw is None:
+            return None
+        report = json.loads(raw)
+        if report['state'] == "running" and not await self.client.exists(MEMORY_REPORT_LOCK):
+            report['state'] = "interrupted"
+        return report
+
+    async def _run(self, report):
+        try:
+            await self._walk(report)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Memory analysis {report.run_id} failed: {str(e)}")
+            report.finish("failed", str(e))
+        self.current = None
+        try:
+            await self._save(report)
+            if (report.state != "cancelled"
+                    and await _lock_owner(self.client).get(MEMORY_REPORT_LOCK) == report.run_id):
+                await self.client.delete(MEMORY_REPORT_LOCK)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Could not save memory analysis {report.run_id}: {str(e)}")
+
+    async def _walk(self, report):
+        cursor = 0
+        saved = time.monotonic()
+        while True:
+            started = time.perf_counter()
+            cursor, keys = await self.client.scan(cursor=cursor, match=report.match, count=self.page_size)
+            await self._sample(report, [key for key in keys if key not in (MEMORY_REPORT_KEY, MEMORY_REPORT_LOCK)])
+            busy = time.perf_counter() - started
+            report.busy_seconds += busy
+            report.pages += 1
+            if int(cursor) == 0:
+                report.finish("complete")
+                logger.info(f"Memory analysis {report.run_id} complete: {report.keys} keys, {report.bytes} bytes")
+                return
+            if await _lock_owner(self.client).get(MEMORY_REPORT_LOCK) != report.run_id:
+                report.finish("cancelled")
+                logger.info(f"Memory analysis {report.run_id} cancelled after {report.scanned} keys")
+                return
+            await self.client.expire(MEMORY_REPORT_LOCK, self.lock_ttl)
+            if time.monotonic() - saved >= self.save_interval:
+                await self._save(report)
+                saved = time.monotonic()
+            await asyncio.sleep(busy * (1 - self.duty_cycle) / self.duty_cycle)
+
+    async def _sample(self, report, keys):
+        report.scanned += len(keys)
+        if not keys:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+                pipe.memory_usage(key, samples=report.samples)
+                pipe.pttl(key)
+            replies = await pipe.execute(raise_on_error=False)
+        types, sizes, pttls = replies[0::3], replies[1::3], replies[2::3]
+        async with self.client.pipeline(transaction=False) as pipe:
+            queued = _queue_lengths(pipe, keys, types)
+            lengths = dict(zip(queued, await pipe.execute(raise_on_error=False) if queued else []))
+        _add_page(report, keys, types, sizes, pttls, lengths)
+
+    async def _save(self, report):
+        await self.client.set(MEMORY_REPORT_KEY, json.dumps(report.to_dict()))
+
+def create_memory_analyzer(client, analyzer_class=MemoryAnalyzer):
+    """Builds the analyzer from MEMORY_ANALYZER_* environment variables."""
+    duty_cycle = float(os.environ.get('MEMORY_ANALYZER_DUTY_CYCLE', 0.1))
+    return analyzer_class(
+        client,
+        page_size=int(os.environ.get('MEMORY_ANALYZER_PAGE_SIZE', 200)),
+        samples=int(os.environ.get('MEMORY_ANALYZER_SAMPLES', 5)),
+        top=int(os.environ.get('MEMORY_ANALYZER_TOP', 20)),
+        duty_cycle=min(max(duty_cycle, 0.01), 1.0),
+        max_prefixes=int(os.environ.get('MEMORY_ANALYZER_MAX_PREFIXES', 1000))
+    )
@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+import redis
+from flask import Blueprint, Response
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+from circuit_breaker import GuardedRedis, GuardedPipeline, GuardedRedisCluster
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Under gunicorn each worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+# (see gunicorn.conf.py) and /metrics merges them, so any worker can answer a scrape.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+# Latency buckets in seconds, weighted towards the sub-millisecond range Redis lives in
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# ===================== METRICS =====================
+
+# The histogram's _count series is the request count per endpoint and status
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by Flask endpoint and status',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+AUTH_CHECK_DURATION = Histogram(
+    'api_key_auth_duration_seconds', 'Time spent validating the X-API-Key header',
+    buckets=LATENCY_BUCKETS
+)
+REDIS_COMMANDS = Counter(
+    'redis_commands', 'Redis commands issued, pipelined ones included', ['command']
+)
+REDIS_COMMAND_DURATION = Histogram(
+    'redis_command_duration_seconds', 'Redis round-trip latency per command (PIPELINE for a whole pipeline)',
+    ['command'], buckets=LATENCY_BUCKETS
+)
+REDIS_COMMAND_ERRORS = Counter(
+    'redis_command_errors', 'Redis commands that raised', ['command']
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    'redis_pool_connections', 'Connection pool usage summed over live workers',
+    ['state'], multiprocess_mode='livesum'
+)
+
+# ===================== REDIS CLIENT =====================
+
+class InstrumentedPipeline(GuardedPipeline):
+    """GuardedPipeline that counts its queued commands and times the round trip."""
+
+    def execute(self, raise_on_error=True):
+        for args, _ in self.command_stack:
+            REDIS_COMMANDS.labels(str(args[0]).upper()).inc()
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        except Exception:
+            REDIS_COMMAND_ERRORS.labels('PIPELINE').inc()
+            raise
+        finally:
+            REDIS_COMMAND_DURATION.labels('PIPELINE').observe(time.perf_counter() - started)
+
+def observe_command(execute, *args, **options):
+    """Runs execute(*args, **options), counting and timing it as command args[0]."""
+    command = str(args[0]).upper()
+    REDIS_COMMANDS.labels(command).inc()
+    started = time.perf_counter()
+    try:
+        return execute(*args, **options)
+    except Exception:
+        REDIS_COMMAND_ERRORS.labels(command).inc()
+        raise
+    finally:
+        REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - started)
+
+class InstrumentedRedis(GuardedRedis):
+    """GuardedRedis that records a count and latency sample for every command."""
+
+    def execute_command(self, *args, **options):
+        return observe_command(super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class InstrumentedReplicaRedis(redis.Redis):
+    """Read-replica client, counted and timed like InstrumentedRedis but outside the circuit breaker.
+
+    A failing replica is ejected by the router (see replicas.py); it must not
+    open the breaker that guards the primary.
+    """
+
+    def execute_command(self, *args, **options):
+        return observe_command(super().execute_command, *args, **options)
+
+class InstrumentedRedisCluster(GuardedRedisCluster):
+    """GuardedRedisCluster that records a count and latency sample for every command."""
+
+    def execute_command(self, *args, **kwargs):
+        return observe_command(super().execute_command, *args, **kwargs)
+
+def update_pool_metrics(client):
+    """Publishes this worker's connection pool usage (cheap: two len() calls)."""
+    pool = getattr(client, 'connection_pool', None)
+    if pool is None or not hasattr(pool, '_in_use_connections'):
+        return
+    REDIS_POOL_CONNECTIONS.labels('in_use').set(len(pool._in_use_connections))
+    REDIS_POOL_CONNECTIONS.labels('idle').set(len(pool._available_connections))
+
+# ===================== FLASK HOOKS =====================
+
+def observe_request(endpoint, method, status, seconds):
+    HTTP_REQUEST_DURATION.labels(endpoint or 'unmatched', method, str(status)).observe(seconds)
+
+def observe_auth_check(seconds):
+    AUTH_CHECK_DURATION.observe(seconds)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this worker, or of all workers in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,214 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import redis
+from latency import LatencyWindow
+from keyspace import enable_keyspace_events, key_from_channel, poll_messages
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NEAR_CACHE_CHANNEL = "nearcache:invalidate"  # "<sent unix ms>|<pid>|<key>" published on every API write
+KEYSPACE_EVENTS = "Kg$hxe"                    # Generic, string, hash, expired and evicted events
+
+def invalidation_message(key):
+    """Payload for NEAR_CACHE_CHANNEL telling other workers that key was written."""
+    return f"{int(time.time() * 1000)}|{os.getpid()}|{key}"
+
+async def publish_invalidations_async(client, keys):
+    """Tells every worker's near-cache that keys were written, over a redis.asyncio client (used by asgi_app)."""
+    if not keys:
+        return
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.publish(NEAR_CACHE_CHANNEL, invalidation_message(key))
+            await pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Failed to publish near-cache invalidation: {str(e)}")
+
+class NearCache:
+    """Per-worker read-through cache for hot string keys and hash fields.
+
+    Bounded by entry count and approximate bytes (LRU eviction). Each entry
+    expires no later than the key's own TTL, so expired keys are never
+    served. Coherence comes from the invalidation channel (API writes from
+    any worker, with lag measurement) and keyspace notifications (writes from
+    anywhere else, when the server has them enabled).
+    """
+
+    def __init__(self, client, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=5.0):
+        self.client = client
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (key, field) -> (expires_at, value, size)
+        self._fields = {}              # key -> set of cached fields, for whole-key invalidation
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._generation = 0           # bumped on every invalidation; fills that raced one are discarded
+        self._listener_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.invalidation_lag = LatencyWindow()
+
+    # ===================== READS =====================
+
+    def get(self, key):
+        """GET through the cache."""
+        return self._read(key, None)
+
+    def hget(self, key, field):
+        """HGET through the cache."""
+        return self._read(key, field)
+
+    def _read(self, key, field):
+        self._ensure_listener()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((key, field))
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end((key, field))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        # Value and remaining TTL in one round trip
+        pipe = self.client.pipeline(transaction=False)
+        if field is None:
+            pipe.get(key)
+        else:
+            pipe.hget(key, field)
+        pipe.pttl(key)
+        value, pttl = pipe.execute()
+
+        ttl = self.ttl
+        if pttl is not None and pttl >= 0:
+            ttl = min(ttl, pttl / 1000)
+        if ttl > 0:
+            self._store(key, field, value, ttl, generation)
+        return value
+
+    def _store(self, key, field, value, ttl, generation):
+        size = sys.getsizeof(key) + sys.getsizeof(field) + sys.getsizeof(value)
+        with self._lock:
+            if generation != self._generation:
+                return  # An invalidation landed while we were reading
+            old = self._entries.pop((key, field), None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[(key, field)] = (time.monotonic() + ttl, value, size)
+            self._fields.setdefault(key, set()).add(field)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                (old_key, old_field), (_, _, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self._discard_field(old_key, old_field)
+                self.evictions += 1
+
+    def _discard_field(self, key, field):
+        fields = self._fields.get(key)
+        if fields is not None:
+            fields.discard(field)
+            if not fields:
+                del self._fields[key]
+
+    # ===================== INVALIDATION =====================
+
+    def invalidate(self, key):
+        """Drops every cached entry for key (the string value and all hash fields)."""
+        with self._lock:
+            self._generation += 1
+            for field in self._fields.pop(key, ()):
+                entry = self._entries.pop((key, field), None)
+                if entry is not None:
+                    self._bytes -= entry[2]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._fields.clear()
+            self._bytes = 0
+
+    def invalidate_written(self, *keys):
+        """Invalidates keys locally right away, then tells the other workers."""
+        for key in keys:
+            self.invalidate(key)
+        if not keys:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.publish(NEAR_CACHE_CHANNEL, invalidation_message(key))
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Failed to publish near-cache invalidation: {str(e)}")
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name="near-cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(NEAR_CACHE_CHANNEL)
+                # Catches writes made outside the API; without it only API writes invalidate
+                enable_keyspace_events(self.client, pubsub, KEYSPACE_EVENTS)
+                # Writes while we were not subscribed were missed
+                self.clear()
+                for message in poll_messages(pubsub):
+                    if message.get("type") == "message":
+                        sent, pid, key = message["data"].split("|", 2)
+                        # Our own writes were already invalidated before publishing
+                        if int(pid) != os.getpid():
+                            self.invalidate(key)
+                        self.invalidation_lag.observe(max(time.time() - int(sent) / 1000, 0.0))
+                    elif message.get("type") == "pmessage":
+                        self.invalidate(key_from_channel(message["channel"]))
+            except Exception as e:
+                logger.warning(f"Near-cache invalidation listener error: {str(e)}")
+                self.clear()
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'invalidation_lag': self.invalidation_lag.summary()
+            }
+
+def create_near_cache(client):
+    """Returns a NearCache when NEAR_CACHE_ENABLED is set, else None."""
+    if os.environ.get('NEAR_CACHE_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return NearCache(
+        client,
+        max_entries=int(os.environ.get('NEAR_CACHE_MAX_ENTRIES', 10000)),
+        max_bytes=int(os.environ.get('NEAR_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+        ttl=float(os.environ.get('NEAR_CACHE_TTL', 5.0))
+    )
@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import time
+import redis
+from events import QUEUE_EVENTS_CHANNEL, EventHub
+from scripts import scripts
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keys kept next to each queue list for reliable consumption. The queue name is their
+# {hash tag}, so on a sharded backend they live on the queue's node and the LMOVEs and
+# requeue script stay single-node.
+CONSUMERS_KEY = "{{{queue}}}:consumers"               # set of consumers that have taken items
+PROCESSING_KEY = "{{{queue}}}:processing:{consumer}"  # items a consumer has taken but not acked
+ALIVE_KEY = "{{{queue}}}:alive:{consumer}"            # holds the consumer's visibility timeout and expires after it
+REQUEUE_LOCK_KEY = "{{{queue}}}:requeue_lock"         # one requeue sweep per queue per interval, across workers
+RELIABLE_QUEUES_KEY = "queues:reliable"               # queues that have had consumers, for the background sweep
+
+# BLPOP/BLMOVE are issued in slices shorter than the client's 5s socket_timeout
+POLL_SLICE = 2.0
+
+class QueueService:
+    """Batch, long-poll and reliable (ack-based) consumption of the Redis-list queues.
+
+    Reliable mode moves each item atomically (LMOVE) into a per-consumer
+    processing list. Dequeues and acks refresh the consumer's alive key, which
+    expires after its visibility timeout. When it is gone, the consumer's
+    unacked items are moved back to the head of the queue in their original
+    order.
+
+    The visibility timeout is a lease on the consumer, not on each item: every
+    dequeue or ack is a heartbeat that renews it for the visibility the
+    consumer last dequeued with. While a consumer keeps heartbeating, all its
+    unacked items stay with it, including one it is stuck on; they are
+    requeued once it has been silent for a whole visibility timeout. Sweeps
+    run on reliable dequeues and from a background thread in each worker, so a
+    queue whose consumers have all died is swept too.
+
+    Long polls hold a worker thread, so each process admits at most
+    `max_blocking` at once. Past that, a dequeue with `wait` returns right away
+    instead of tying up the worker.
+    """
+
+    def __init__(self, client, compressor=None, max_wait=20.0, max_blocking=4, visibility_timeout=30, requeue_interval=1.0):
+        self.client = client
+        self.compressor = compressor  # serialization.ValueCompressor applied to stored items
+        self.max_wait = max_wait
+        self.max_blocking = max_blocking
+        self.visibility_timeout = visibility_timeout
+        self.requeue_interval = requeue_interval
+        self._blocking_slots = threading.BoundedSemaphore(max_blocking) if max_blocking > 0 else None
+        self._last_requeue = {}  # queue -> monotonic time of this worker's last sweep
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+        self.active_long_polls = 0
+        self.long_polls = 0
+        self.long_polls_rejected = 0
+        self.requeued = 0
+
+    # ===================== PRODUCERS =====================
+
+    def enqueue(self, queue, values):
+        """Appends values to the queue and announces them to /events subscribers; returns the new length."""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(queue, *self._pack(values))
+        pipe.publish(QUEUE_EVENTS_CHANNEL, EventHub.queue_event_message(queue, values))
+        return pipe.execute()[0]
+
+    # ===================== CONSUMERS =====================
+
+    def dequeue(self, queue, count=1, wait=0, consumer=None, visibility_timeout=None):
+        """Pops up to count items, long-polling up to wait seconds when the queue is empty.
+
+        With a consumer, items are moved to its processing list until acked.
+        """
+        processing = None
+        if consumer:
+            visibility_timeout = visibility_timeout or self.visibility_timeout
+            processing = PROCESSING_KEY.format(queue=queue, consumer=consumer)
+            self._touch(queue, consumer, visibility_timeout)
+            self._maybe_requeue(queue)
+
+        items = self._pop(queue, count, processing)
+        if items or wait <= 0:
+            return self._unpack(items)
+        if self._blocking_slots is None or not self._blocking_slots.acquire(blocking=False):
+            self.long_polls_rejected += 1
+            return items
+
+        self.active_long_polls += 1
+        self.long_polls += 1
+        try:
+            deadline = time.monotonic() + min(wait, self.max_wait)
+            while not items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                first = self._block(queue, min(remaining, POLL_SLICE), processing)
+                if first is not None:
+                    items = [first] + (self._pop(queue, count - 1, processing) if count > 1 else [])
+        finally:
+            self.active_long_polls -= 1
+            self._blocking_slots.release()
+
+        if items and consumer:
+            # The visibility timeout counts from delivery, not from when the poll started
+            self._touch(queue, consumer, visibility_timeout)
+        return self._unpack(items)
+
+    def _pop(self, queue, count, processing):
+        if processing is None:
+            if count == 1:
+                item = self.client.lpop(queue)
+                return [item] if item is not None else []
+            return self.client.lpop(queue, count) or []
+        pipe = self.client.pipeline(transaction=False)
+        for _ in range(count):
+            pipe.lmove(queue, processing, "LEFT", "RIGHT")
+        return [item for item in pipe.execute() if item is not None]
+
+    def _block(self, queue, timeout, processing):
+        if processing is None:
+            popped = self.client.blpop([queue], timeout=timeout)
+            return popped[1] if popped else None
+        return self.client.blmove(queue, processing, timeout, "LEFT", "RIGHT")
+
+    def ack(self, queue, consumer, values):
+        """Removes processed items from the consumer's processing list; returns how many were found."""
+        processing = PROCESSING_KEY.format(queue=queue, consumer=consumer)
+        pipe = self.client.pipeline(transaction=False)
+        # Packing is deterministic, so a re-packed item matches the stored one
+        for value in self._pack(values):
+            pipe.lrem(processing, 1, value)
+        pipe.get(ALIVE_KEY.format(queue=queue, consumer=consumer))
+        *removed, visibility_timeout = pipe.execute()
+        # Renew the lease for the visibility the consumer dequeued with, not the default
+        self._touch(queue, consumer, int(visibility_timeout or self.visibility_timeout))
+        return sum(removed)
+
+    def _pack(self, values):
+        return [self.compressor.pack(value) for value in values] if self.compressor else values
+
+    def _unpack(self, items):
+        return [self.compressor.unpack(item) for item in items] if self.compressor else items
+
+    def _touch(self, queue, consumer, visibility_timeout):
+        self._ensure_sweeper()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.sadd(CONSUMERS_KEY.format(queue=queue), consumer)
+        pipe.set(ALIVE_KEY.format(queue=queue, consumer=consumer), int(visibility_timeout), ex=int(visibility_timeout))
+        pipe.sadd(RELIABLE_QUEUES_KEY, queue)
+        pipe.execute()
+
+    # ===================== REQUEUE =====================
+
+    def _maybe_requeue(self, queue):
+        now = time.monotonic()
+        if now - self._last_requeue.get(queue, 0.0) < self.requeue_interval:
+            return
+        self._last_requeue[queue] = now
+        try:
+            lock = REQUEUE_LOCK_KEY.format(queue=queue)
+            if self.client.set(lock, os.getpid(), nx=True, px=int(self.requeue_interval * 1000)):
+                self.requeue_expired(queue)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Requeue sweep for '{queue}' failed: {str(e)}")
+
+    def start(self):
+        """Starts the background sweep of every reliable queue, once per worker process."""
+        self._ensure_sweeper()
+
+    def _ensure_sweeper(self):
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep, name="queue-requeue", daemon=True).start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(max(self.requeue_interval, 0.1))
+            try:
+                queues = self.client.smembers(RELIABLE_QUEUES_KEY)
+            except redis.exceptions.RedisError as e:
+                logger.debug(f"Requeue sweep skipped: {str(e)}")
+                continue
+            for queue in sorted(queues):
+                self._maybe_requeue(queue)
+
+    def requeue_expired(self, queue):
+        """Moves every unacked item of consumers whose visibility timeout ran out back to the queue head."""
+        consumers_key = CONSUMERS_KEY.format(queue=queue)
+        consumers = sorted(self.client.smembers(consumers_key))
+        if not consumers:
+            self.client.srem(RELIABLE_QUEUES_KEY, queue)  # A later consumer adds it back
+            return 0
+        pipe = self.client.pipeline(transaction=False)
+        for consumer in consumers:
+            pipe.exists(ALIVE_KEY.format(queue=queue, consumer=consumer))
+        alive = pipe.execute()
+
+        moved = 0
+        for consumer, is_alive in zip(consumers, alive):
+            if is_alive:
+                continue
+            # The script re-checks the alive key, so a consumer that came back since the EXISTS above keeps its items
+            keys = [PROCESSING_KEY.format(queue=queue, consumer=consumer), queue,
+                    ALIVE_KEY.format(queue=queue, consumer=consumer), consumers_key]
+            moved += max(scripts.call(self.client, "requeue_consumer", keys, [consumer]), 0)
+        if moved:
+            self.requeued += moved
+            logger.info(f"Requeued {moved} expired items on '{queue}'")
+        return moved
+
+    # ===================== STATS =====================
+
+    def queue_stats(self, queue):
+        """Depth, in-flight count and per-consumer state for one queue."""
+        consumers = sorted(self.client.smembers(CONSUMERS_KEY.format(queue=queue)))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(queue)
+        for consumer in consumers:
+            pipe.llen(PROCESSING_KEY.format(queue=queue, consumer=consumer))
+            pipe.ttl(ALIVE_KEY.format(queue=queue, consumer=consumer))
+        depth, *replies = pipe.execute()
+        per_consumer = {
+            consumer: {'in_flight': in_flight, 'visibility_remaining': ttl if ttl >= 0 else None}
+            for consumer, in_flight, ttl in zip(consumers, replies[0::2], replies[1::2])
+        }
+        return {
+            'queue': queue,
+            'depth': depth,
+            'in_flight': sum(c['in_flight'] for c in per_consumer.values()),
+            'consumers': per_consumer
+        }
+
+    def stats(self):
+        """Per-worker long-poll and requeue counters."""
+        return {
+            'max_wait': self.max_wait,
+            'max_blocking': self.max_blocking,
+            'active_long_polls': self.active_long_polls,
+            'long_polls': self.long_polls,
+            'long_polls_rejected': self.long_polls_rejected,
+            'requeued': self.requeued
+        }
+
+def create_queue_service(client, compressor=None):
+    """Builds the QueueService from QUEUE_* environment variables and starts its requeue sweep."""
+    service = QueueService(
+        client,
+        compressor,
+        max_wait=float(os.environ.get('QUEUE_MAX_WAIT', 20.0)),
+        max_blocking=int(os.environ.get('QUEUE_MAX_BLOCKING', 4)),
+        visibility_timeout=int(os.environ.get('QUEUE_VISIBILITY_TIMEOUT', 30)),
+        requeue_interval=float(os.environ.get('QUEUE_REQUEUE_INTERVAL', 1.0))
+    )
+    service.start()
+    return service
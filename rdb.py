@@ -0,0 +1,510 @@
+"""Redis RDB encoding: DUMP payloads for the embedded store and an offline RDB file reader.
+
+A DUMP payload is one value in RDB encoding (a type byte, then the value)
+followed by the 2-byte RDB version and a CRC64 of everything before it.
+RdbReader walks that encoding. The offline converter uses it to find where each
+value in a snapshot ends, and copies those bytes into a payload without
+decoding them:
+
+    python rdb.py dump.rdb -o seed.ndjson
+    curl -X POST -H "X-API-Key: $ADMIN_KEY" --data-binary @seed.ndjson http://localhost:5000/import
+
+The embedded store decodes payloads for the types it holds (strings, lists,
+hashes, sets) and encodes its own values the same way, so /export and /import work
+against either backend.
+"""
+import argparse
+import fnmatch
+import io
+import logging
+import struct
+import sys
+from transfer import FORMATS, EXPORT_PAGE_SIZE
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# RDB version written into payloads the embedded store dumps (Redis 5.0+ restores it)
+DUMP_RDB_VERSION = 9
+
+# Value types (rdb.h)
+TYPE_STRING = 0
+TYPE_LIST = 1
+TYPE_SET = 2
+TYPE_ZSET = 3
+TYPE_HASH = 4
+TYPE_ZSET_2 = 5
+TYPE_HASH_ZIPMAP = 9
+TYPE_LIST_ZIPLIST = 10
+TYPE_SET_INTSET = 11
+TYPE_ZSET_ZIPLIST = 12
+TYPE_HASH_ZIPLIST = 13
+TYPE_LIST_QUICKLIST = 14
+TYPE_STREAM_LISTPACKS = 15
+TYPE_HASH_LISTPACK = 16
+TYPE_ZSET_LISTPACK = 17
+TYPE_LIST_QUICKLIST_2 = 18
+TYPE_STREAM_LISTPACKS_2 = 19
+TYPE_SET_LISTPACK = 20
+TYPE_STREAM_LISTPACKS_3 = 21
+
+# Opcodes between keys in an RDB file
+OPCODE_SLOT_INFO = 0xF4
+OPCODE_FUNCTION2 = 0xF5
+OPCODE_FUNCTION_PRE_GA = 0xF6
+OPCODE_MODULE_AUX = 0xF7
+OPCODE_IDLE = 0xF8
+OPCODE_FREQ = 0xF9
+OPCODE_AUX = 0xFA
+OPCODE_RESIZEDB = 0xFB
+OPCODE_EXPIRETIME_MS = 0xFC
+OPCODE_EXPIRETIME = 0xFD
+OPCODE_SELECTDB = 0xFE
+OPCODE_EOF = 0xFF
+
+_ENCODING_INT8, _ENCODING_INT16, _ENCODING_INT32, _ENCODING_LZF = range(4)
+_QUICKLIST_NODE_PLAIN = 1
+
+# ===================== CHECKSUM & COMPRESSION =====================
+
+def _crc64_table():
+    # Jones polynomial, reflected (the variant Redis uses in crc64.c)
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x95AC9329AC4BC9B5 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC64_TABLE = _crc64_table()
+
+def crc64(data, crc=0):
+    """CRC64 of data as Redis computes it for DUMP payloads and RDB files."""
+    table = _CRC64_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc
+
+def lzf_decompress(data, length):
+    """Expands an LZF-compressed RDB string to its original `length` bytes."""
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:  # Literal run of ctrl + 1 bytes
+            out += data[i:i + ctrl + 1]
+            i += ctrl + 1
+            continue
+        run = ctrl >> 5
+        if run == 7:
+            run += data[i]
+            i += 1
+        ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+        i += 1
+        for _ in range(run + 2):  # Byte by byte: the match may overlap what it copies
+            out.append(out[ref])
+            ref += 1
+    if len(out) != length:
+        raise ValueError(f"LZF string expanded to {len(out)} bytes, expected {length}")
+    return bytes(out)
+
+# ===================== READING =====================
+
+class RdbReader:
+    """Reads RDB-encoded data from a binary file object.
+
+    While `capture` is a bytearray every byte read is appended to it, which is
+    how the converter copies a value verbatim.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.capture = None
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise ValueError("Truncated RDB data")
+        if self.capture is not None:
+            self.capture += data
+        return data
+
+    def read_byte(self):
+        return self.read(1)[0]
+
+    def read_length_with_encoding(self):
+        """Returns (length, is_encoded); an encoded "length" is a special string encoding."""
+        first = self.read_byte()
+        kind = first >> 6
+        if kind == 0:
+            return first & 0x3F, False
+        if kind == 1:
+            return ((first & 0x3F) << 8) | self.read_byte(), False
+        if kind == 3:
+            return first & 0x3F, True
+        if first == 0x80:
+            return struct.unpack(">I", self.read(4))[0], False
+        if first == 0x81:
+            return struct.unpack(">Q", self.read(8))[0], False
+        raise ValueError(f"Unknown RDB length encoding 0x{first:02x}")
+
+    def read_length(self):
+        length, encoded = self.read_length_with_encoding()
+        if encoded:
+            raise ValueError("Expected a length, found an encoded string")
+        return length
+
+    def read_string(self):
+        length, encoded = self.read_length_with_encoding()
+        if not encoded:
+            return self.read(length)
+        if length == _ENCODING_INT8:
+            return str(struct.unpack("<b", self.read(1))[0]).encode()
+        if length == _ENCODING_INT16:
+            return str(struct.unpack("<h", self.read(2))[0]).encode()
+        if length == _ENCODING_INT32:
+            return str(struct.unpack("<i", self.read(4))[0]).encode()
+        if length == _ENCODING_LZF:
+            compressed_length = self.read_length()
+            original_length = self.read_length()
+            return lzf_decompress(self.read(compressed_length), original_length)
+        raise ValueError(f"Unknown RDB string encoding {length}")
+
+    def skip_string(self):
+        length, encoded = self.read_length_with_encoding()
+        if not encoded:
+            self.read(length)
+        elif length == _ENCODING_LZF:
+            compressed_length = self.read_length()
+            self.read_length()  # Original length
+            self.read(compressed_length)
+        else:
+            self.read(1 << length)  # int8 / int16 / int32
+
+    def skip_double(self):
+        """Skips a ZSET (v1) score: a length byte then ASCII, or 253-255 for nan/inf."""
+        length = self.read_byte()
+        if length < 253:
+            self.read(length)
+
+    # 🔹 Decoding (the types the embedded store holds)
+
+    def read_value(self, value_type):
+        """Decodes one value into ("string", bytes), ("list", [bytes]), ("hash", {bytes: bytes}) or ("set", {bytes})."""
+        if value_type == TYPE_STRING:
+            return "string", self.read_string()
+        if value_type == TYPE_LIST:
+            return "list", [self.read_string() for _ in range(self.read_length())]
+        if value_type == TYPE_LIST_ZIPLIST:
+            return "list", parse_ziplist(self.read_string())
+        if value_type == TYPE_LIST_QUICKLIST:
+            return "list", [item for _ in range(self.read_length()) for item in parse_ziplist(self.read_string())]
+        if value_type == TYPE_LIST_QUICKLIST_2:
+            items = []
+            for _ in range(self.read_length()):
+                container = self.read_length()
+                node = self.read_string()
+                items.extend([node] if container == _QUICKLIST_NODE_PLAIN else parse_listpack(node))
+            return "list", items
+        if value_type == TYPE_HASH:
+            return "hash", {self.read_string(): self.read_string() for _ in range(self.read_length())}
+        if value_type in (TYPE_HASH_ZIPLIST, TYPE_HASH_LISTPACK):
+            parse = parse_ziplist if value_type == TYPE_HASH_ZIPLIST else parse_listpack
+            items = parse(self.read_string())
+            return "hash", dict(zip(items[::2], items[1::2]))
+        if value_type == TYPE_HASH_ZIPMAP:
+            return "hash", parse_zipmap(self.read_string())
+        if value_type == TYPE_SET:
+            return "set", {self.read_string() for _ in range(self.read_length())}
+        if value_type == TYPE_SET_INTSET:
+            return "set", set(parse_intset(self.read_string()))
+        if value_type == TYPE_SET_LISTPACK:
+            return "set", set(parse_listpack(self.read_string()))
+        raise ValueError(f"RDB type {value_type} is not supported here")
+
+    # 🔹 Skipping (every type an RDB file may hold, without decoding it)
+
+    def skip_value(self, value_type):
+        if value_type in (TYPE_STRING, TYPE_HASH_ZIPMAP, TYPE_LIST_ZIPLIST, TYPE_SET_INTSET, TYPE_ZSET_ZIPLIST,
+                          TYPE_HASH_ZIPLIST, TYPE_HASH_LISTPACK, TYPE_ZSET_LISTPACK, TYPE_SET_LISTPACK):
+            self.skip_string()  # One blob
+        elif value_type in (TYPE_LIST, TYPE_SET, TYPE_LIST_QUICKLIST):
+            for _ in range(self.read_length()):
+                self.skip_string()
+        elif value_type == TYPE_LIST_QUICKLIST_2:
+            for _ in range(self.read_length()):
+                self.read_length()
+                self.skip_string()
+        elif value_type == TYPE_HASH:
+            for _ in range(self.read_length() * 2):
+                self.skip_string()
+        elif value_type in (TYPE_ZSET, TYPE_ZSET_2):
+            for _ in range(self.read_length()):
+                self.skip_string()
+                if value_type == TYPE_ZSET:
+                    self.skip_double()
+                else:
+                    self.read(8)
+        elif value_type in (TYPE_STREAM_LISTPACKS, TYPE_STREAM_LISTPACKS_2, TYPE_STREAM_LISTPACKS_3):
+            self._skip_stream(value_type)
+        else:
+            raise ValueError(f"RDB type {value_type} (module or hash field expiry data) is not supported")
+
+    def _skip_stream(self, value_type):
+        for _ in range(self.read_length()):
+            self.skip_string()  # Master entry ID
+            self.skip_string()  # Listpack of entries
+        for _ in range(3):  # Length, last ID (ms, seq)
+            self.read_length()
+        if value_type >= TYPE_STREAM_LISTPACKS_2:
+            for _ in range(5):  # First ID, max deleted ID, entries added
+                self.read_length()
+        for _ in range(self.read_length()):  # Consumer groups
+            self.skip_string()
+            self.read_length()
+            self.read_length()
+            if value_type >= TYPE_STREAM_LISTPACKS_2:
+                self.read_length()  # Entries read
+            for _ in range(self.read_length()):  # Group PEL: ID, delivery time, delivery count
+                self.read(16 + 8)
+                self.read_length()
+            for _ in range(self.read_length()):  # Consumers
+                self.skip_string()
+                self.read(8)  # Seen time
+                if value_type >= TYPE_STREAM_LISTPACKS_3:
+                    self.read(8)  # Active time
+                for _ in range(self.read_length()):
+                    self.read(16)
+
+# ===================== COMPACT ENCODINGS =====================
+
+def parse_ziplist(data):
+    """Entries of a ziplist blob as bytes (integers as their decimal text)."""
+    items = []
+    i = 10  # zlbytes, zltail, zllen
+    while data[i] != 0xFF:
+        i += 5 if data[i] == 0xFE else 1  # prevlen
+        encoding = data[i]
+        kind = encoding >> 6
+        if kind == 0:
+            length, i = encoding & 0x3F, i + 1
+        elif kind == 1:
+            length, i = ((encoding & 0x3F) << 8) | data[i + 1], i + 2
+        elif kind == 2:
+            length, i = struct.unpack(">I", data[i + 1:i + 5])[0], i + 5
+        else:
+            i += 1
+            if encoding == 0xC0:
+                value, i = struct.unpack("<h", data[i:i + 2])[0], i + 2
+            elif encoding == 0xD0:
+                value, i = struct.unpack("<i", data[i:i + 4])[0], i + 4
+            elif encoding == 0xE0:
+                value, i = struct.unpack("<q", data[i:i + 8])[0], i + 8
+            elif encoding == 0xF0:
+                value, i = int.from_bytes(data[i:i + 3], "little", signed=True), i + 3
+            elif encoding == 0xFE:
+                value, i = struct.unpack("<b", data[i:i + 1])[0], i + 1
+            else:
+                value = (encoding & 0x0F) - 1  # Immediate 0-12
+            items.append(str(value).encode())
+            continue
+        items.append(bytes(data[i:i + length]))
+        i += length
+    return items
+
+def parse_listpack(data):
+    """Entries of a listpack blob as bytes (integers as their decimal text)."""
+    items = []
+    i = 6  # Total bytes, number of elements
+    while data[i] != 0xFF:
+        start = i
+        encoding = data[i]
+        value = None
+        if encoding < 0x80:
+            value, i = encoding, i + 1
+        elif encoding < 0xC0:
+            length = encoding & 0x3F
+            items.append(bytes(data[i + 1:i + 1 + length]))
+            i += 1 + length
+        elif encoding < 0xE0:
+            value = ((encoding & 0x1F) << 8) | data[i + 1]
+            value, i = value - (1 << 13) if value >= 1 << 12 else value, i + 2
+        elif encoding < 0xF0:
+            length = ((encoding & 0x0F) << 8) | data[i + 1]
+            items.append(bytes(data[i + 2:i + 2 + length]))
+            i += 2 + length
+        elif encoding == 0xF0:
+            length = struct.unpack("<I", data[i + 1:i + 5])[0]
+            items.append(bytes(data[i + 5:i + 5 + length]))
+            i += 5 + length
+        else:
+            size = {0xF1: 2, 0xF2: 3, 0xF3: 4, 0xF4: 8}[encoding]
+            value, i = int.from_bytes(data[i + 1:i + 1 + size], "little", signed=True), i + 1 + size
+        if value is not None:
+            items.append(str(value).encode())
+        entry_length = i - start
+        # Back-length: 7 bits per byte (thresholds as in lpEncodeBacklen)
+        i += 1 if entry_length <= 127 else 2 if entry_length < 16383 else 3 if entry_length < 2097151 else \
+            4 if entry_length < 268435455 else 5
+    return items
+
+def parse_intset(data):
+    """Members of an intset blob as their decimal text."""
+    width, count = struct.unpack_from("<II", data)
+    code = {2: "h", 4: "i", 8: "q"}[width]
+    return [str(value).encode() for value in struct.unpack_from(f"<{count}{code}", data, 8)]
+
+def parse_zipmap(data):
+    """Field/value pairs of a (pre-2.6) zipmap blob."""
+    mapping = {}
+    i = 1  # zmlen
+    pending = None
+    while data[i] != 0xFF:
+        if data[i] < 254:
+            length, i = data[i], i + 1
+        else:
+            length, i = struct.unpack("<I", data[i + 1:i + 5])[0], i + 5
+        if pending is None:
+            pending = bytes(data[i:i + length])
+            i += length
+        else:
+            free = data[i]
+            mapping[pending] = bytes(data[i + 1:i + 1 + length])
+            i += 1 + length + free
+            pending = None
+    return mapping
+
+# ===================== DUMP PAYLOADS =====================
+
+def _encode_length(length):
+    if length < 1 << 6:
+        return bytes([length])
+    if length < 1 << 14:
+        return bytes([0x40 | (length >> 8), length & 0xFF])
+    if length < 1 << 32:
+        return b"\x80" + struct.pack(">I", length)
+    return b"\x81" + struct.pack(">Q", length)
+
+def _encode_string(value):
+    return _encode_length(len(value)) + value
+
+def encode_payload(value_type, value):
+    """DUMP payload for a "string" (bytes), "list" ([bytes]), "hash" ({bytes: bytes}) or "set" ({bytes}) value."""
+    if value_type == "string":
+        body = bytes([TYPE_STRING]) + _encode_string(value)
+    elif value_type == "list":
+        body = bytes([TYPE_LIST]) + _encode_length(len(value)) + b"".join(_encode_string(item) for item in value)
+    elif value_type == "hash":
+        body = bytes([TYPE_HASH]) + _encode_length(len(value)) + b"".join(
+            _encode_string(field) + _encode_string(item) for field, item in value.items())
+    elif value_type == "set":
+        body = bytes([TYPE_SET]) + _encode_length(len(value)) + b"".join(_encode_string(item) for item in value)
+    else:
+        raise ValueError(f"Cannot DUMP a {value_type}")
+    body += struct.pack("<H", DUMP_RDB_VERSION)
+    return body + struct.pack("<Q", crc64(body))
+
+def decode_payload(payload):
+    """Checks a DUMP payload's CRC and decodes it with RdbReader.read_value."""
+    body, footer = payload[:-8], payload[-8:]
+    if len(payload) < 11 or struct.pack("<Q", crc64(body)) != footer:
+        raise ValueError("DUMP payload version or checksum are wrong")
+    reader = RdbReader(io.BytesIO(body[1:-2]))
+    return reader.read_value(body[0])
+
+# ===================== RDB FILES =====================
+
+def read_rdb(f, db=0):
+    """Yields (key, expire_at ms or 0, DUMP payload) for every key of one database in an RDB file.
+
+    Values are copied byte for byte (no decoding or re-encoding), with the
+    file's own RDB version in each payload. Memory use is one value at a time.
+    """
+    reader = RdbReader(f)
+    header = reader.read(9)
+    if header[:5] != b"REDIS" or not header[5:].isdigit():
+        raise ValueError("Not an RDB file")
+    version = int(header[5:])
+    current_db = 0
+    expire_at = 0
+    while True:
+        opcode = reader.read_byte()
+        if opcode == OPCODE_EOF:
+            return
+        if opcode == OPCODE_SELECTDB:
+            current_db = reader.read_length()
+        elif opcode == OPCODE_RESIZEDB:
+            reader.read_length()
+            reader.read_length()
+        elif opcode == OPCODE_AUX:
+            reader.skip_string()
+            reader.skip_string()
+        elif opcode == OPCODE_EXPIRETIME_MS:
+            expire_at = struct.unpack("<Q", reader.read(8))[0]
+        elif opcode == OPCODE_EXPIRETIME:
+            expire_at = struct.unpack("<I", reader.read(4))[0] * 1000
+        elif opcode == OPCODE_IDLE:
+            reader.read_length()
+        elif opcode == OPCODE_FREQ:
+            reader.read(1)
+        elif opcode == OPCODE_SLOT_INFO:
+            for _ in range(3):
+                reader.read_length()
+        elif opcode == OPCODE_FUNCTION2:
+            reader.skip_string()  # Function library code; not part of the keyspace
+        elif opcode in (OPCODE_MODULE_AUX, OPCODE_FUNCTION_PRE_GA):
+            raise ValueError(f"RDB opcode 0x{opcode:02x} (module data or pre-GA functions) is not supported")
+        else:
+            key = reader.read_string()
+            reader.capture = bytearray([opcode])
+            reader.skip_value(opcode)
+            body = bytes(reader.capture) + struct.pack("<H", version)
+            reader.capture = None
+            if current_db == db:
+                yield key, expire_at, body + struct.pack("<Q", crc64(body))
+            expire_at = 0
+
+def convert(source, output, fmt, db=0, match=None):
+    """Writes every key of `db` in the RDB file `source` to `output` as an /import stream; returns the key count."""
+    fmt = FORMATS[fmt]
+    keys = 0
+    output.write(fmt.header())
+    for key, expire_at, payload in read_rdb(source, db):
+        key = key.decode("utf-8", "surrogateescape")
+        if match and not fnmatch.fnmatchcase(key, match):
+            continue
+        output.write(fmt.record(key, expire_at, payload))
+        keys += 1
+        if keys % EXPORT_PAGE_SIZE == 0:
+            # Position checkpoints, so an interrupted /import can be resent with ?after=
+            output.write(fmt.checkpoint(f"rdb:{keys}"))
+    output.write(fmt.end(keys))
+    return keys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an RDB snapshot into an /import stream (no Redis needed)")
+    parser.add_argument("rdb", help="RDB file, e.g. dump.rdb")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--db", type=int, default=0, help="Database to convert (default 0)")
+    parser.add_argument("--match", help="Only keys matching this glob")
+    args = parser.parse_args(argv)
+
+    with open(args.rdb, "rb") as source:
+        try:
+            if args.output:
+                with open(args.output, "wb") as output:
+                    keys = convert(source, output, args.format, args.db, args.match)
+            else:
+                keys = convert(source, sys.stdout.buffer, args.format, args.db, args.match)
+        except ValueError as e:
+            logger.error(f"Could not read {args.rdb}: {str(e)}")
+            return 1
+    logger.info(f"Converted {keys} keys from {args.rdb}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Non-blocking startup: Redis is validated in the background instead of at import time.
+
+config.py builds its client without connecting (redis-py pools connect on first
+use) and StartupReadiness pings it from a daemon thread, backing off between
+attempts, until it answers. Workers therefore bind as soon as the app is
+imported. Until the first successful PING the apps answer 503 with Retry-After
+straight away (health, metrics and the UI excepted) instead of letting each
+request wait out a connect timeout.
+
+/health/live only says the process is up. /health/ready says Redis has
+answered and the circuit breaker is not open. The startup timings (process
+start to import, to Redis ready, to first request) are logged and reported
+under `startup` on /health.
+"""
+import logging
+import os
+import threading
+import time
+import redis
+from circuit_breaker import GuardedRedis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def process_start_time():
+    """Unix time this process started (fork time for a gunicorn worker); now if unknown."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22 overall
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+class StartupReadiness:
+    """Background Redis validation and startup timings for this worker process."""
+
+    def __init__(self, client, breaker=None, max_backoff=2.0, on_unreachable=None, unreachable_after=5):
+        self.client = client
+        self.breaker = breaker
+        self.max_backoff = max_backoff
+        self.on_unreachable = on_unreachable  # Called once after `unreachable_after` failed attempts
+        self.unreachable_after = unreachable_after
+        self.started_at = process_start_time()
+        self.imported_at = None
+        self.ready_at = None
+        self.first_request_at = None
+        self.first_ready_request_at = None
+        self.ready = False  # Redis has answered at least once; outages after that are the breaker's job
+        self.attempts = 0
+        self.last_error = None
+        self._next_attempt = 0.0
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    # ===================== VALIDATION =====================
+
+    def start(self):
+        """Starts the background check once per worker process (again after a fork)."""
+        if self.ready or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="redis-readiness", daemon=True).start()
+
+    def _run(self):
+        backoff = 0.1
+        while True:
+            self.attempts += 1
+            try:
+                self._ping()
+            except redis.exceptions.RedisError as e:
+                self.last_error = str(e)
+                if self.attempts == self.unreachable_after:
+                    logger.error(f"Redis still unreachable after {self.attempts} attempts: {str(e)}")
+                    if self.on_unreachable is not None:
+                        self.on_unreachable()
+                else:
+                    logger.warning(f"Redis not reachable yet (attempt {self.attempts}): {str(e)}")
+                self._next_attempt = time.monotonic() + backoff
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            if self.breaker is not None:
+                # Background flushers may have tripped it while Redis was down
+                self.breaker.record_success()
+            self.ready_at = time.time()
+            self.ready = True
+            self.last_error = None
+            logger.info(f"Redis reachable after {self.attempts} attempt(s), "
+                        f"{self.ready_at - self.started_at:.2f}s after process start")
+            return
+
+    def _ping(self):
+        # A single server is pinged around the breaker: failed startup attempts must not stretch
+        # its backoff past the moment Redis comes up
+        target = getattr(self.client, "primary", self.client)
+        if isinstance(target, GuardedRedis):
+            return redis.Redis.execute_command(target, "PING")
+        return self.client.ping()
+
+    def is_ready(self):
+        """Ready to serve Redis-backed requests: Redis has answered and the breaker is not open."""
+        return self.ready and (self.breaker is None or self.breaker.retry_after() == 0.0)
+
+    def retry_after(self):
+        """Seconds a client should wait before retrying a 503."""
+        if not self.ready:
+            return max(self._next_attempt - time.monotonic(), 0.0)
+        return self.breaker.retry_after() if self.breaker is not None else 0.0
+
+    # ===================== TIMINGS =====================
+
+    def mark_imported(self):
+        """Called at the end of the app module's import."""
+        self.imported_at = time.time()
+        logger.info(f"App imported {self.imported_at - self.started_at:.2f}s after process start")
+
+    def mark_request(self):
+        """Called as each request finishes; records the first one and the first one after Redis was ready."""
+        if self.first_ready_request_at is not None:
+            return
+        now = time.time()
+        if self.first_request_at is None:
+            self.first_request_at = now
+            logger.info(f"First request served {now - self.started_at:.2f}s after process start")
+        if self.ready:
+            self.first_ready_request_at = now
+            if now != self.first_request_at:
+                logger.info(f"First request with Redis ready served {now - self.started_at:.2f}s after process start")
+
+    def stats(self):
+        def since_start(moment):
+            return round(moment - self.started_at, 3) if moment is not None else None
+
+        return {
+            'ready': self.is_ready(),
+            'redis_validated': self.ready,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'import_seconds': since_start(self.imported_at),
+            'ready_seconds': since_start(self.ready_at),
+            'first_request_seconds': since_start(self.first_request_at),
+            'first_ready_request_seconds': since_start(self.first_ready_request_at)
+        }
+
+def create_startup_readiness(client, breaker=None, on_unreachable=None):
+    """Builds the readiness check and starts it; REDIS_STARTUP_MAX_BACKOFF caps the wait between PINGs."""
+    readiness = StartupReadiness(
+        client,
+        breaker=breaker,
+        max_backoff=float(os.environ.get('REDIS_STARTUP_MAX_BACKOFF', 2.0)),
+        on_unreachable=on_unreachable
+    )
+    readiness.start()
+    return readiness
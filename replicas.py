@@ -0,0 +1,468 @@
+"""Read-replica routing: read-only commands go to replicas, everything else to the primary.
+
+REDIS_REPLICA_URLS lists the replicas of the primary in REDIS_URL. Reads are
+spread round-robin or to the replica with the lowest observed latency
+(REPLICA_STRATEGY). A background check compares each replica's replication
+offset with the primary's and ejects replicas lagging by more than
+REPLICA_MAX_LAG_BYTES (or unreachable, or with the master link down) until they
+catch up. With READ_YOUR_WRITES_SECONDS set, an API key that just wrote reads
+from the primary for that long, so it always sees its own writes.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import redis
+import redis.asyncio as aioredis
+from sharding import parse_shard_urls
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Commands that never write; only these may be served by a replica
+READ_COMMANDS = {
+    "GET", "MGET", "STRLEN", "GETRANGE", "EXISTS", "TYPE", "TTL", "PTTL", "DUMP", "SCAN", "KEYS", "RANDOMKEY",
+    "HGET", "HMGET", "HGETALL", "HEXISTS", "HLEN", "HKEYS", "HVALS", "HSCAN",
+    "LLEN", "LRANGE", "LINDEX", "SMEMBERS", "SISMEMBER", "SCARD", "SSCAN",
+    "ZRANGE", "ZSCORE", "ZCARD", "ZRANK", "ZSCAN", "XRANGE", "XREVRANGE", "XLEN", "MEMORY", "OBJECT"
+}
+# Failures that eject a replica; the read is then retried on the primary
+REPLICA_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+ROUND_ROBIN = "round_robin"
+LEAST_LATENCY = "least_latency"
+
+# API key of the request being served (set per request by app/asgi_app), for read-your-writes
+_caller = contextvars.ContextVar("replica_caller", default=None)
+
+def bind_caller(api_key):
+    """Attributes this request's (thread's / task's) commands to api_key."""
+    _caller.set(api_key)
+
+class ReplicaNode:
+    """One replica's client, health and routing counters."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.healthy = True
+        self.reason = None
+        self.lag = None        # Replication offset lag in bytes, from the last check
+        self.latency = None    # Moving average of read round trips, seconds
+        self.routed = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def observe(self, seconds):
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+
+class ReplicaSet:
+    """Replica selection, ejection and read-your-writes windows shared by the sync and async routers."""
+
+    def __init__(self, replicas, strategy=ROUND_ROBIN, max_lag=1048576, sticky_seconds=0.0,
+                 check_interval=1.0, max_sticky_callers=10000):
+        self.nodes = [ReplicaNode(name, client) for name, client in replicas.items()]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.sticky_seconds = sticky_seconds
+        self.check_interval = check_interval
+        self.max_sticky_callers = max_sticky_callers
+        self._next = itertools.count()
+        self._writes = OrderedDict()  # api key -> monotonic time of its last write
+        self._lock = threading.Lock()
+        self.primary_routed = 0
+        self.sticky_reads = 0
+
+    # ===================== ROUTING =====================
+
+    def record_write(self):
+        """Starts the calling API key's read-your-writes window."""
+        self.primary_routed += 1
+        caller = _caller.get()
+        if not self.sticky_seconds or caller is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._writes[caller] = now
+            self._writes.move_to_end(caller)
+            while self._writes and (len(self._writes) > self.max_sticky_callers
+                                    or next(iter(self._writes.values())) < now - self.sticky_seconds):
+                self._writes.popitem(last=False)
+
+    def _sticky(self):
+        caller = _caller.get()
+        if not self.sticky_seconds or caller is None:
+            return False
+        written = self._writes.get(caller)
+        return written is not None and time.monotonic() - written < self.sticky_seconds
+
+    def choose(self):
+        """The replica for the next read, or None when it must go to the primary."""
+        if self._sticky():
+            self.sticky_reads += 1
+            self.primary_routed += 1
+            return None
+        healthy = [node for node in self.nodes if node.healthy]
+        if not healthy:
+            self.primary_routed += 1
+            return None
+        if self.strategy == LEAST_LATENCY:
+            # Replicas not measured yet count as fastest, so each gets tried
+            node = min(healthy, key=lambda n: n.latency or 0.0)
+        else:
+            node = healthy[next(self._next) % len(healthy)]
+        node.routed += 1
+        return node
+
+    def node_at(self, slot):
+        """Node for a packed SCAN cursor slot (0 is the primary)."""
+        return self.nodes[slot - 1] if slot else None
+
+    def slot_of(self, node):
+        return self.nodes.index(node) + 1 if node is not None else 0
+
+    # ===================== HEALTH =====================
+
+    def eject(self, node, reason):
+        node.errors += 1
+        if node.healthy:
+            node.healthy = False
+            node.ejections += 1
+            logger.warning(f"Ejected replica {node.name}: {reason}")
+        node.reason = reason
+
+    def update(self, node, primary_offset, info):
+        """Applies one replica's INFO replication (taken after the primary's offset)."""
+        offset = int(info.get("slave_repl_offset", info.get("master_repl_offset", 0)))
+        node.lag = max(primary_offset - offset, 0)
+        if info.get("master_link_status", "up") != "up":
+            self.eject(node, "master link down")
+        elif node.lag > self.max_lag:
+            self.eject(node, f"lagging {node.lag} bytes behind the primary")
+        elif not node.healthy:
+            node.healthy = True
+            node.reason = None
+            logger.info(f"Replica {node.name} back in rotation (lag {node.lag} bytes)")
+
+    def stats(self):
+        return {
+            'strategy': self.strategy,
+            'max_lag_bytes': self.max_lag,
+            'read_your_writes_seconds': self.sticky_seconds,
+            'primary': {'routed': self.primary_routed, 'sticky_reads': self.sticky_reads},
+            'replicas': {
+                node.name: {
+                    'healthy': node.healthy,
+                    'reason': node.reason,
+                    'lag_bytes': node.lag,
+                    'latency_ms': round(node.latency * 1000, 3) if node.latency is not None else None,
+                    'routed': node.routed,
+                    'errors': node.errors,
+                    'ejections': node.ejections
+                } for node in self.nodes
+            }
+        }
+
+def _cursor_parts(cursor, nodes):
+    """Splits a packed SCAN cursor into (node slot, that node's cursor)."""
+    return int(cursor) % (nodes + 1), int(cursor) // (nodes + 1)
+
+def _pack_cursor(node_cursor, slot, nodes):
+    return int(node_cursor) * (nodes + 1) + slot if int(node_cursor) else 0
+
+# ===================== SYNC ROUTER =====================
+
+class ReplicatedRedis(redis.Redis):
+    """redis.Redis that sends reads to replicas and everything else to the primary.
+
+    Pipelines go to a replica only when every queued command is a read and no
+    transaction is requested. SCAN stays on the node that served its first page
+    (the cursor records which). Pub/sub and scripts use the primary.
+    """
+
+    def __init__(self, primary, replicas, **options):
+        # Not redis.Redis.__init__: the primary and each replica bring their own pools
+        self.primary = primary
+        self.replicas = ReplicaSet(replicas, **options)
+        self.connection_pool = primary.connection_pool
+        self.response_callbacks = {}
+        self._checker_pid = None
+        self._checker_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{type(self).__name__}<primary, {', '.join(node.name for node in self.replicas.nodes)}>"
+
+    def close(self):
+        self.primary.close()
+        for node in self.replicas.nodes:
+            node.client.close()
+
+    def execute_command(self, *args, **options):
+        if str(args[0]).upper() not in READ_COMMANDS:
+            self.replicas.record_write()
+            return self.primary.execute_command(*args, **options)
+        return self._read(self.replicas.choose(), lambda client: client.execute_command(*args, **options))
+
+    def _read(self, node, call):
+        """Runs call(client) on node, falling back to the primary if node is None or fails."""
+        self._ensure_checker()
+        if node is None:
+            return call(self.primary)
+        started = time.perf_counter()
+        try:
+            reply = call(node.client)
+        except REPLICA_ERRORS as e:
+            self.replicas.eject(node, str(e))
+            self.replicas.primary_routed += 1
+            return call(self.primary)
+        node.observe(time.perf_counter() - started)
+        return reply
+
+    def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        """One SCAN page; the packed cursor pins the rest of the walk to the first page's node."""
+        nodes = len(self.replicas.nodes)
+        if int(cursor) == 0:
+            node = self.replicas.choose()
+            node_cursor = 0
+        else:
+            slot, node_cursor = _cursor_parts(cursor, nodes)
+            node = self.replicas.node_at(slot)
+        client = node.client if node is not None else self.primary
+        next_cursor, keys = client.scan(cursor=node_cursor, match=match, count=count, _type=_type, **kwargs)
+        return _pack_cursor(next_cursor, self.replicas.slot_of(node), nodes), keys
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ReplicaPipeline(self, transaction)
+
+    def pubsub(self, **kwargs):
+        return self.primary.pubsub(**kwargs)
+
+    def replica_stats(self):
+        return self.replicas.stats()
+
+    # ===================== LAG CHECKS =====================
+
+    def _ensure_checker(self):
+        if self._checker_pid == os.getpid():
+            return
+        with self._checker_lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+        threading.Thread(target=self._check_loop, name="replica-check", daemon=True).start()
+
+    def _check_loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Replica check failed: {str(e)}")
+            time.sleep(self.replicas.check_interval)
+
+    def check(self):
+        """Measures every replica's lag against the primary; ejects or restores them."""
+        primary_offset = int(self.primary.info("replication").get("master_repl_offset", 0))
+        for node in self.replicas.nodes:
+            started = time.perf_counter()
+            try:
+                info = node.client.info("replication")
+            except redis.exceptions.RedisError as e:
+                self.replicas.eject(node, str(e))
+                continue
+            node.observe(time.perf_counter() - started)
+            self.replicas.update(node, primary_offset, info)
+
+class ReplicaPipeline(redis.Redis):
+    """Queues commands, then runs them on a replica if they are all reads, else on the primary."""
+
+    def __init__(self, router, transaction=True):
+        self.router = router
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __repr__(self):
+        return f"{type(self).__name__}<{len(self.command_stack)} commands>"
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def close(self):
+        self.reset()
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def _replay(self, client, raise_on_error):
+        pipe = client.pipeline(transaction=self.transaction)
+        for args, options in self.command_stack:
+            pipe.execute_command(*args, **options)
+        return pipe.execute(raise_on_error=raise_on_error)
+
+    def execute(self, raise_on_error=True):
+        try:
+            if self.transaction or any(str(args[0]).upper() not in READ_COMMANDS for args, _ in self.command_stack):
+                self.router.replicas.record_write()
+                return self._replay(self.router.primary, raise_on_error)
+            return self.router._read(self.router.replicas.choose(),
+                                     lambda client: self._replay(client, raise_on_error))
+        finally:
+            self.reset()
+
+# ===================== ASYNC ROUTER =====================
+
+class AsyncReplicatedRedis(aioredis.Redis):
+    """redis.asyncio counterpart of ReplicatedRedis (used by asgi_app); lag checks run as a task."""
+
+    def __init__(self, primary, replicas, **options):
+        self.primary = primary
+        self.replicas = ReplicaSet(replicas, **options)
+        self.connection_pool = primary.connection_pool
+        self.response_callbacks = {}
+        self._checker = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}<primary, {', '.join(node.name for node in self.replicas.nodes)}>"
+
+    async def aclose(self):
+        if self._checker is not None:
+            self._checker.cancel()
+        await self.primary.aclose()
+        for node in self.replicas.nodes:
+            await node.client.aclose()
+
+    async def execute_command(self, *args, **options):
+        if str(args[0]).upper() not in READ_COMMANDS:
+            self.replicas.record_write()
+            return await self.primary.execute_command(*args, **options)
+        return await self._read(self.replicas.choose(), lambda client: client.execute_command(*args, **options))
+
+    async def _read(self, node, call):
+        if self._checker is None or self._checker.done():
+            self._checker = asyncio.create_task(self._check_loop())
+        if node is None:
+            return await call(self.primary)
+        started = time.perf_counter()
+        try:
+            reply = await call(node.client)
+        except REPLICA_ERRORS as e:
+            self.replicas.eject(node, str(e))
+            self.replicas.primary_routed += 1
+            return await call(self.primary)
+        node.observe(time.perf_counter() - started)
+        return reply
+
+    async def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        nodes = len(self.replicas.nodes)
+        if int(cursor) == 0:
+            node = self.replicas.choose()
+            node_cursor = 0
+        else:
+            slot, node_cursor = _cursor_parts(cursor, nodes)
+            node = self.replicas.node_at(slot)
+        client = node.client if node is not None else self.primary
+        next_cursor, keys = await client.scan(cursor=node_cursor, match=match, count=count, _type=_type, **kwargs)
+        return _pack_cursor(next_cursor, self.replicas.slot_of(node), nodes), keys
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncReplicaPipeline(self, transaction)
+
+    def replica_stats(self):
+        return self.replicas.stats()
+
+    async def _check_loop(self):
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Replica check failed: {str(e)}")
+            await asyncio.sleep(self.replicas.check_interval)
+
+    async def check(self):
+        """Async counterpart of ReplicatedRedis.check."""
+        primary_offset = int((await self.primary.info("replication")).get("master_repl_offset", 0))
+        for node in self.replicas.nodes:
+            started = time.perf_counter()
+            try:
+                info = await node.client.info("replication")
+            except redis.exceptions.RedisError as e:
+                self.replicas.eject(node, str(e))
+                continue
+            node.observe(time.perf_counter() - started)
+            self.replicas.update(node, primary_offset, info)
+
+class AsyncReplicaPipeline(aioredis.Redis):
+    """Async ReplicaPipeline."""
+
+    def __init__(self, router, transaction=True):
+        self.router = router
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __repr__(self):
+        return f"{type(self).__name__}<{len(self.command_stack)} commands>"
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    async def _replay(self, client, raise_on_error):
+        pipe = client.pipeline(transaction=self.transaction)
+        for args, options in self.command_stack:
+            pipe.execute_command(*args, **options)
+        return await pipe.execute(raise_on_error=raise_on_error)
+
+    async def execute(self, raise_on_error=True):
+        try:
+            if self.transaction or any(str(args[0]).upper() not in READ_COMMANDS for args, _ in self.command_stack):
+                self.router.replicas.record_write()
+                return await self._replay(self.router.primary, raise_on_error)
+            return await self.router._read(self.router.replicas.choose(),
+                                           lambda client: self._replay(client, raise_on_error))
+        finally:
+            self.command_stack = []
+
+# ===================== CONFIGURATION =====================
+
+def create_replicated_client(primary, replica_factory, client_class=ReplicatedRedis):
+    """Wraps primary with the replicas in REDIS_REPLICA_URLS; replica_factory(url) makes each client."""
+    urls = parse_shard_urls(os.environ['REDIS_REPLICA_URLS'])
+    strategy = os.environ.get('REPLICA_STRATEGY', ROUND_ROBIN).lower()
+    if strategy not in (ROUND_ROBIN, LEAST_LATENCY):
+        logger.warning(f"Unknown REPLICA_STRATEGY '{strategy}'; using {ROUND_ROBIN}")
+        strategy = ROUND_ROBIN
+    client = client_class(
+        primary,
+        {name: replica_factory(url) for name, url in urls.items()},
+        strategy=strategy,
+        max_lag=int(os.environ.get('REPLICA_MAX_LAG_BYTES', 1048576)),
+        sticky_seconds=float(os.environ.get('READ_YOUR_WRITES_SECONDS', 0)),
+        check_interval=float(os.environ.get('REPLICA_CHECK_INTERVAL', 1.0))
+    )
+    logger.info(f"Routing reads to {len(urls)} replicas ({strategy}): {', '.join(urls)}")
+    return client
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import redis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RequestLogBuffer:
+    """In-process buffer that flushes API request logs to a capped Redis stream in pipelined batches."""
+
+    def __init__(self, client, stream_key, batch_size=100, flush_interval=1.0, max_queue=10000, maxlen=100000):
+        self.client = client
+        self.stream_key = stream_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxlen = maxlen
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._flusher_pid = None
+        self._batch_ready = threading.Event()
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def enqueue(self, entry):
+        """Queues a log entry without touching Redis; drops it if the buffer is full."""
+        self._ensure_flusher()
+        try:
+            self._queue.put_nowait(entry)
+            self.enqueued += 1
+            if self._queue.qsize() >= self.batch_size:
+                self._batch_ready.set()
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_flusher(self):
+        """Starts the background flusher once per worker process."""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="api-log-flusher", daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            # Flush when a full batch is waiting or flush_interval has passed, whichever is first;
+            # entries stay queued meanwhile so drain() still sees them at shutdown
+            self._batch_ready.wait(self.flush_interval)
+            self._batch_ready.clear()
+            while self.flush() == self.batch_size:
+                pass
+
+    def flush(self):
+        """Writes up to batch_size queued entries through a single pipeline."""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return 0
+
+        with self._flush_lock:
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for entry in batch:
+                    fields = {k: ("" if v is None else v) for k, v in entry.items()}
+                    pipe.xadd(self.stream_key, fields, maxlen=self.maxlen, approximate=True)
+                pipe.execute()
+                self.flushed += len(batch)
+            except redis.exceptions.RedisError as e:
+                # Logging is non-critical; count the loss rather than blocking requests
+                self.flush_errors += 1
+                self.dropped += len(batch)
+                logger.error(f"Failed to flush {len(batch)} API log entries: {str(e)}")
+        return len(batch)
+
+    def drain(self):
+        """Flushes everything still queued (used at shutdown)."""
+        while self.flush():
+            pass
+
+    def stats(self):
+        """Returns queue depth and throughput counters."""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self._queue.maxsize,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'flush_errors': self.flush_errors
+        }
+
+def create_request_log_buffer(client, stream_key):
+    """Builds a buffer configured from the environment and flushes it on interpreter exit."""
+    buffer = RequestLogBuffer(
+        client,
+        stream_key,
+        batch_size=int(os.environ.get('API_LOG_BATCH_SIZE', 100)),
+        flush_interval=float(os.environ.get('API_LOG_FLUSH_INTERVAL', 1.0)),
+        max_queue=int(os.environ.get('API_LOG_QUEUE_SIZE', 10000)),
+        maxlen=int(os.environ.get('API_LOG_MAXLEN', 100000))
+    )
+    atexit.register(buffer.drain)
+    return buffer
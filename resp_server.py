@@ -0,0 +1,466 @@
+"""Native RESP2/RESP3 listener exposing the HTTP API's commands to Redis clients.
+
+redis-cli and redis-py connect directly (`redis-cli -p 6380`, then `AUTH <api key>`),
+skipping Flask routing and JSON encoding. Commands are validated and
+role-checked through commands.py, then forwarded to the backing store
+(config.create_async_redis_client, so an external Redis or the embedded engine).
+
+Run standalone with `python resp_server.py`, or set RESP_PORT to start it inside
+asgi_app alongside the HTTP API.
+"""
+import asyncio
+import logging
+import os
+import time
+import redis
+from config import create_async_redis_client, value_compressor, near_cache
+from auth import get_api_key_metadata_async, log_api_request_async
+from commands import CommandError, build_command
+from events import QUEUE_EVENTS_CHANNEL, EventHub
+from latency import LatencyWindow
+from near_cache import NEAR_CACHE_CHANNEL, invalidation_message
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESP_HOST = os.environ.get('RESP_HOST', '0.0.0.0')
+RESP_PORT = int(os.environ.get('RESP_PORT', 6380))
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+# Until AUTH succeeds a connection may only send small commands, so it cannot make us buffer much
+UNAUTHENTICATED_MAX_BULK_LENGTH = 16 * 1024
+UNAUTHENTICATED_MAX_ARGS = 10
+MAX_ARGS = 1024 * 1024
+# Longest inline command or RESP header line ("*<count>", "$<length>")
+MAX_INLINE_LENGTH = 64 * 1024
+
+# RESP command -> (commands.py name, argument names); validated and role-checked like the HTTP routes
+TABLE_COMMANDS = {
+    "GET": ("get", ("key",)),
+    "DEL": ("delete", ("key",)),
+    "EXPIRE": ("expire", ("key", "ttl")),
+    "TTL": ("ttl", ("key",)),
+    "INCR": ("incr", ("key",)),
+    "DECR": ("decr", ("key",)),
+    "HSET": ("hset", ("hash", "field", "value")),
+    "HGET": ("hget", ("hash", "field")),
+    "RPUSH": ("enqueue", ("queue", "value")),
+    "LPOP": ("dequeue", ("queue",)),
+}
+READ_ONLY = {"GET", "TTL", "HGET", "MGET", "HMGET", "SCAN"}
+# Commands whose True reply from redis-py must go back on the wire as +OK
+OK_REPLIES = {"SET", "MSET"}
+# Backing-store writes other workers' near-caches must hear about (the HTTP API announces the same ones)
+KEY_WRITES = {"set", "setex", "delete", "expire", "incr", "decr", "incrby", "decrby", "hset", "mset"}
+
+class ProtocolError(Exception):
+    pass
+
+# ===================== ENCODING =====================
+
+def encode(value, protocol=2):
+    """Serializes a Python reply as RESP2 or RESP3."""
+    if value is None:
+        return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+    if isinstance(value, bool):
+        if protocol == 3:
+            return b"#t\r\n" if value else b"#f\r\n"
+        return b":1\r\n" if value else b":0\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, SimpleString):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Exception):
+        message = str(value).replace("\r", " ").replace("\n", " ")
+        if not message.split(" ", 1)[0].isupper():
+            message = "ERR " + message
+        return b"-" + message.encode() + b"\r\n"
+    if isinstance(value, (str, bytes)):
+        # Bulk strings were decoded with surrogateescape; encode the same way so binary values round-trip
+        data = value.encode("utf-8", "surrogateescape") if isinstance(value, str) else value
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+    if isinstance(value, float):
+        return encode(repr(value), protocol)
+    if isinstance(value, dict):
+        if protocol == 3:
+            return b"%%%d\r\n" % len(value) + b"".join(encode(k, 3) + encode(v, 3) for k, v in value.items())
+        return encode([item for pair in value.items() for item in pair], protocol)
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item, protocol) for item in value)
+    return encode(str(value), protocol)
+
+class SimpleString(str):
+    """Marks a reply to be sent as a +simple string (e.g. OK, PONG)."""
+
+OK = SimpleString("OK")
+
+def _integer(value):
+    """Parses an integer argument the way Redis does, raising CommandError otherwise."""
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError("value is not an integer or out of range")
+
+# ===================== PARSING =====================
+
+def _find_line_end(buffer, start, terminator=b"\r\n"):
+    """Index of the line terminator after start, -1 if not arrived yet; raises if the line is too long."""
+    end = buffer.find(terminator, start, start + MAX_INLINE_LENGTH + len(terminator))
+    if end < 0 and len(buffer) - start > MAX_INLINE_LENGTH:
+        raise ProtocolError("Protocol error: too big inline request")
+    return end
+
+def parse_commands(buffer, max_bulk_length=MAX_BULK_LENGTH, max_args=MAX_ARGS):
+    """Parses every complete command in buffer; returns (commands, bytes consumed)."""
+    commands = []
+    pos = 0
+    while pos < len(buffer):
+        if buffer[pos:pos + 1] == b"*":
+            end = _find_line_end(buffer, pos)
+            if end < 0:
+                break
+            count = int(buffer[pos + 1:end])
+            if count > max_args:
+                raise ProtocolError("Protocol error: invalid multibulk length")
+            cursor = end + 2
+            args = []
+            for _ in range(count):
+                if buffer[cursor:cursor + 1] != b"$":
+                    if cursor >= len(buffer):
+                        break
+                    raise ProtocolError("Protocol error: expected '$'")
+                line_end = _find_line_end(buffer, cursor)
+                if line_end < 0:
+                    break
+                length = int(buffer[cursor + 1:line_end])
+                if length > max_bulk_length:
+                    raise ProtocolError("Protocol error: invalid bulk length")
+                start = line_end + 2
+                if len(buffer) < start + length + 2:
+                    break
+                args.append(buffer[start:start + length].decode("utf-8", "surrogateescape"))
+                cursor = start + length + 2
+            if len(args) < count:
+                break
+            commands.append(args)
+            pos = cursor
+        else:
+            # Inline command (e.g. typed into telnet)
+            end = _find_line_end(buffer, pos, b"\n")
+            if end < 0:
+                break
+            line = buffer[pos:end].strip().decode("utf-8", "surrogateescape")
+            if line:
+                commands.append(line.split())
+            pos = end + 1
+    return commands, pos
+
+# ===================== COALESCING =====================
+
+class Coalescer:
+    """Merges commands submitted in the same event-loop tick, from every connection, into one backend pipeline.
+
+    Identical read-only commands in the same window share a single reply. A
+    write closes the dedup window so later reads observe it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._pending = []
+        self._reads = {}
+        self._scheduled = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.round_trips = 0
+
+    def submit(self, call, read_only):
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        if read_only:
+            shared = self._reads.get(call)
+            if shared is not None:
+                self.coalesced += 1
+                return shared
+        else:
+            self._reads = {}
+        future = loop.create_future()
+        self._pending.append((call, future))
+        if read_only:
+            self._reads[call] = future
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(lambda: asyncio.ensure_future(self._flush()))
+        return future
+
+    async def _flush(self):
+        batch, self._pending, self._reads, self._scheduled = self._pending, [], {}, False
+        self.round_trips += 1
+        queued = []
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for (method, *params), future in batch:
+                    # A call the client rejects while queueing (bad argument types) fails only itself
+                    try:
+                        getattr(pipe, method)(*params)
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    queued.append(future)
+                replies = await pipe.execute(raise_on_error=False) if queued else []
+        except Exception as e:
+            for future in queued:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, reply in zip(queued, replies):
+            if not future.done():
+                future.set_result(reply)
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'backend_round_trips': self.round_trips
+        }
+
+# ===================== SERVER =====================
+
+class RespServer:
+    """asyncio TCP server speaking RESP2/RESP3 with AUTH mapped to API key roles."""
+
+    def __init__(self, client=None):
+        self.client = client or create_async_redis_client()
+        self.coalescer = Coalescer(self.client)
+        self.latency = {}  # command -> LatencyWindow
+        self.connections = 0
+        self._server = None
+
+    async def start(self, host=RESP_HOST, port=RESP_PORT):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"RESP listener on {host}:{port}")
+        return self._server
+
+    async def _handle(self, reader, writer):
+        session = {"api_key": None, "role": None, "protocol": 2}
+        self.connections += 1
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                try:
+                    if session["role"] is None:
+                        commands, consumed = parse_commands(buffer, UNAUTHENTICATED_MAX_BULK_LENGTH,
+                                                            UNAUTHENTICATED_MAX_ARGS)
+                    else:
+                        commands, consumed = parse_commands(buffer)
+                except (ProtocolError, ValueError) as e:
+                    writer.write(encode(ProtocolError(str(e))))
+                    break
+                buffer = buffer[consumed:]
+                if not commands:
+                    continue
+
+                # Submit the whole pipelined batch before awaiting so it shares a backend round trip
+                started = time.perf_counter()
+                pending = [self._dispatch(session, args) for args in commands]
+                out = []
+                for args, reply in zip(commands, pending):
+                    if asyncio.isfuture(reply):
+                        try:
+                            reply = value_compressor.unpack_reply(args[0].lower(), await reply)
+                        except redis.exceptions.RedisError as e:
+                            reply = e
+                        except Exception as e:
+                            # Anything else is still this command's failure, not the connection's
+                            logger.warning(f"RESP {args[0].upper()} failed: {str(e)}")
+                            reply = redis.exceptions.ResponseError(str(e))
+                    if reply is True and args[0].upper() in OK_REPLIES:
+                        reply = OK
+                    out.append(encode(reply, session["protocol"]))
+                    self._record(args[0].upper(), time.perf_counter() - started)
+                writer.write(b"".join(out))
+                await writer.drain()
+                if session.get("quit"):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _record(self, command, seconds):
+        window = self.latency.get(command)
+        if window is None:
+            window = self.latency[command] = LatencyWindow()
+        window.observe(seconds)
+
+    def _dispatch(self, session, args):
+        """Returns a reply value, or a future for commands forwarded to the backing store."""
+        name = args[0].upper()
+        params = args[1:]
+
+        if name == "PING":
+            return params[0] if params else SimpleString("PONG")
+        if name == "QUIT":
+            session["quit"] = True
+            return OK
+        if name == "HELLO":
+            return self._hello(session, params)
+        if name == "AUTH":
+            return self._auth(session, params[-1] if params else "")
+        if name in ("SELECT", "CLIENT", "COMMAND", "READONLY"):
+            # Accepted for client compatibility (redis-py sends CLIENT SETINFO on connect)
+            return [] if name == "COMMAND" else OK
+        if session["role"] is None:
+            if isinstance(session.get("auth"), asyncio.Future):
+                return self._after_auth(session, args)
+            return redis.exceptions.AuthenticationError("NOAUTH Authentication required.")
+        if name == "INFO":
+            return self.info()
+
+        try:
+            call = self._build(name, params, session["role"])
+        except CommandError as e:
+            if e.status == 403:
+                return redis.exceptions.ResponseError("NOPERM " + e.message)
+            return redis.exceptions.ResponseError(e.message)
+
+        asyncio.ensure_future(log_api_request_async(self.client, session["api_key"], f"resp:{name}"))
+        reply = self.coalescer.submit(value_compressor.pack_call(call), name in READ_ONLY)
+        if name not in READ_ONLY:
+            self._announce(call)
+        return reply
+
+    def _announce(self, call):
+        """Publishes a write the way the HTTP API does, in the same pipeline right behind it.
+
+        RPUSH reaches /events subscribers as a queue push, and written keys are
+        evicted from this worker's near-cache and every other worker's.
+        """
+        method, *params = call
+        messages = []
+        if method == "rpush":
+            messages.append((QUEUE_EVENTS_CHANNEL, EventHub.queue_event_message(params[0], list(params[1:]))))
+        elif method in KEY_WRITES and near_cache is not None:
+            for key in (params[0] if method == "mset" else [params[0]]):
+                near_cache.invalidate(key)
+                messages.append((NEAR_CACHE_CHANNEL, invalidation_message(key)))
+        for channel, message in messages:
+            published = self.coalescer.submit(("publish", channel, message), False)
+            # Nobody awaits these; a failed pipeline already fails the write's own reply
+            published.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    def _build(self, name, params, role):
+        """Validates RESP arguments and returns the backing-store call."""
+        if name in TABLE_COMMANDS:
+            command, arg_names = TABLE_COMMANDS[name]
+            if len(params) != len(arg_names):
+                raise CommandError(f"wrong number of arguments for '{name.lower()}' command")
+            return tuple(build_command({"command": command, **dict(zip(arg_names, params))}, role))
+        if name == "SET":
+            if len(params) not in (2, 4) or (len(params) == 4 and params[2].upper() != "EX"):
+                raise CommandError("syntax error (supported: SET key value [EX seconds])")
+            spec = {"command": "set", "key": params[0], "value": params[1]}
+            if len(params) == 4:
+                spec["ttl"] = _integer(params[3])
+            return tuple(build_command(spec, role))
+        if name in ("INCRBY", "DECRBY") and len(params) == 2:
+            # redis-py sends INCR/DECR as INCRBY/DECRBY key 1
+            return (name.lower(), params[0], _integer(params[1]))
+        if name == "MGET" and params:
+            return ("mget", tuple(params))
+        if name == "MSET" and params and len(params) % 2 == 0:
+            return ("mset", dict(zip(params[::2], params[1::2])))
+        if name == "HMGET" and len(params) >= 2:
+            return ("hmget", params[0], tuple(params[1:]))
+        if name == "SCAN" and params:
+            options = {k.upper(): v for k, v in zip(params[1::2], params[2::2])}
+            count = _integer(options["COUNT"]) if "COUNT" in options else None
+            return ("scan", _integer(params[0]), options.get("MATCH"), count, options.get("TYPE"))
+        raise CommandError(f"unknown command '{name}'")
+
+    def _hello(self, session, params):
+        try:
+            protocol = int(params[0]) if params else session["protocol"]
+        except ValueError:
+            return redis.exceptions.ResponseError("Protocol version is not an integer or out of range")
+        if protocol not in (2, 3):
+            return redis.exceptions.ResponseError("NOPROTO unsupported protocol version")
+        if len(params) >= 4 and params[1].upper() == "AUTH":
+            result = self._auth(session, params[3])
+            return self._after_auth(session, params, on_success=lambda: self._hello_reply(session, protocol)) \
+                if asyncio.isfuture(result) else result
+        return self._hello_reply(session, protocol)
+
+    def _hello_reply(self, session, protocol):
+        session["protocol"] = protocol
+        return {"server": "redis-clone", "version": "1.0.0", "proto": protocol, "mode": "standalone", "role": "master"}
+
+    def _auth(self, session, api_key):
+        """Resolves the API key's role asynchronously; the connection's later commands wait on it."""
+        async def check():
+            try:
+                metadata = await get_api_key_metadata_async(self.client, api_key)
+            except redis.exceptions.RedisError as e:
+                metadata, error = None, e
+            else:
+                error = redis.exceptions.AuthenticationError("WRONGPASS invalid API key")
+            finally:
+                session["auth"] = None
+            if not metadata:
+                session["role"] = None
+                return error
+            session["api_key"] = api_key
+            session["role"] = metadata.get("role", "user")
+            return OK
+
+        future = asyncio.ensure_future(check())
+        session["auth"] = future
+        return future
+
+    def _after_auth(self, session, args, on_success=None):
+        """Chains a command behind a pending AUTH so pipelined AUTH + commands keep their order."""
+        auth_future = session["auth"]
+
+        async def run():
+            result = await auth_future
+            if isinstance(result, Exception):
+                return result
+            if on_success is not None:
+                return on_success()
+            reply = self._dispatch(session, args)
+            return await reply if asyncio.isfuture(reply) else reply
+
+        return asyncio.ensure_future(run())
+
+    def info(self):
+        """Per-command latency and coalescing counters, formatted like INFO commandstats."""
+        lines = ["# Commandstats"]
+        for command, window in sorted(self.latency.items()):
+            s = window.summary()
+            lines.append(
+                f"cmdstat_{command.lower()}:calls={s['count']},usec_per_call={s['mean_ms'] * 1000:.2f},"
+                f"p50_usec={s['p50_ms'] * 1000:.0f},p99_usec={s['p99_ms'] * 1000:.0f}"
+            )
+        lines.append("# Coalescing")
+        lines.extend(f"{k}:{v}" for k, v in self.coalescer.stats().items())
+        lines.append(f"connected_clients:{self.connections}")
+        return "\r\n".join(lines) + "\r\n"
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'coalescing': self.coalescer.stats(),
+            'latency': {command: window.summary() for command, window in self.latency.items()}
+        }
+
+async def main():
+    server = await RespServer().start()
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
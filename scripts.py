@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import redis
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A script whose keys hash to different shards (sharding.CrossShardError, or redis-py's
+# client-side check in cluster mode)
+CROSS_SHARD_ERRORS = (redis.exceptions.ResponseError, redis.exceptions.RedisClusterException)
+
+class LuaScript:
+    """A Lua source, its SHA1 and the Python equivalent run by the embedded engine.
+
+    async_fallback, when given, is the same for a redis.asyncio client whose keys
+    span shards.
+    """
+
+    def __init__(self, name, source, fallback, async_fallback=None):
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        self.fallback = fallback
+        self.async_fallback = async_fallback
+
+class ScriptRegistry:
+    """Runs named Lua scripts by EVALSHA, loading them with SCRIPT LOAD on NOSCRIPT.
+
+    The script cache is server-wide, so a script is loaded once per server (and
+    again only after SCRIPT FLUSH, a restart or a failover), not per worker.
+    Works with both the sync and the redis.asyncio clients. The embedded engine
+    has no Lua; it runs the Python fallback under its keyspace lock instead.
+    """
+
+    def __init__(self):
+        self._scripts = {}
+        self.calls = 0
+        self.loads = 0
+        self.fallback_calls = 0
+        self.cross_shard_calls = 0
+
+    def register(self, name, source, fallback, async_fallback=None):
+        self._scripts[name] = LuaScript(name, source, fallback, async_fallback)
+
+    def call(self, client, name, keys=(), args=()):
+        script = self._scripts[name]
+        if not hasattr(client, "evalsha"):
+            self.fallback_calls += 1
+            return client.run_atomic(script.fallback, list(keys), list(args))
+        self.calls += 1
+        try:
+            try:
+                return client.evalsha(script.sha, len(keys), *keys, *args)
+            except redis.exceptions.NoScriptError:
+                self._loaded(client.script_load(script.source), script)
+                return client.evalsha(script.sha, len(keys), *keys, *args)
+        except CROSS_SHARD_ERRORS as e:
+            self._check_cross_shard(e, script)
+            return script.fallback(client, list(keys), list(args))
+
+    async def call_async(self, client, name, keys=(), args=()):
+        script = self._scripts[name]
+        if not hasattr(client, "evalsha"):
+            self.fallback_calls += 1
+            return await client.run_atomic(script.fallback, list(keys), list(args))
+        self.calls += 1
+        try:
+            try:
+                return await client.evalsha(script.sha, len(keys), *keys, *args)
+            except redis.exceptions.NoScriptError:
+                self._loaded(await client.script_load(script.source), script)
+                return await client.evalsha(script.sha, len(keys), *keys, *args)
+        except CROSS_SHARD_ERRORS as e:
+            if script.async_fallback is None:
+                raise
+            self._check_cross_shard(e, script)
+            return await script.async_fallback(client, list(keys), list(args))
+
+    def _check_cross_shard(self, error, script):
+        """Re-raises error unless the script's keys live on different shards.
+
+        Those calls run the Python fallback instead: same result, but as
+        separate commands, so not atomic.
+        """
+        if isinstance(error, redis.exceptions.ResponseError) and not str(error).startswith("CROSSSLOT"):
+            raise error
+        self.cross_shard_calls += 1
+        logger.debug(f"Script {script.name} spans shards; running it command by command")
+
+    def _loaded(self, sha, script):
+        self.loads += 1
+        if sha != script.sha:
+            logger.warning(f"Script {script.name} loaded as {sha}, expected {script.sha}")
+        logger.info(f"Loaded Lua script {script.name} ({script.sha[:8]})")
+
+    def stats(self):
+        return {
+            'scripts': sorted(self._scripts),
+            'calls': self.calls,
+            'loads': self.loads,
+            'fallback_calls': self.fallback_calls,
+            'cross_shard_calls': self.cross_shard_calls
+        }
+
+scripts = ScriptRegistry()
+
+# ===================== API KEYS =====================
+
+# KEYS: apikey hash, log stream. ARGV: stream maxlen, api key, endpoint, unix seconds.
+# Returns the key's hash as a flat list (empty if unknown) and, for a valid key,
+# appends the request log entry in the same atomic call.
+AUTHENTICATE = """
+local fields = redis.call('HGETALL', KEYS[1])
+if #fields == 0 then
+    return fields
+end
+local user_id = ''
+for i = 1, #fields, 2 do
+    if fields[i] == 'user_id' then
+        user_id = fields[i + 1]
+    end
+end
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*',
+           'user_id', user_id, 'api_key', ARGV[2], 'endpoint', ARGV[3], 'timestamp', ARGV[4])
+return fields
+"""
+
+def _authenticate_fallback(client, keys, args):
+    fields = client.hgetall(keys[0])
+    if fields:
+        client.xadd(keys[1], {"user_id": fields.get("user_id", ""), "api_key": args[1],
+                              "endpoint": args[2], "timestamp": args[3]},
+                    maxlen=int(args[0]), approximate=True)
+    return [item for pair in fields.items() for item in pair]
+
+async def _authenticate_async_fallback(client, keys, args):
+    fields = await client.hgetall(keys[0])
+    if fields:
+        await client.xadd(keys[1], {"user_id": fields.get("user_id", ""), "api_key": args[1],
+                                    "endpoint": args[2], "timestamp": args[3]},
+                          maxlen=int(args[0]), approximate=True)
+    return [item for pair in fields.items() for item in pair]
+
+# KEYS: apikey hash. ARGV: user id, role, invalidation channel, api key.
+CREATE_API_KEY = """
+redis.call('HSET', KEYS[1], 'user_id', ARGV[1], 'role', ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return 1
+"""
+
+def _create_api_key_fallback(client, keys, args):
+    client.hset(keys[0], mapping={"user_id": args[0], "role": args[1]})
+    client.publish(args[2], args[3])
+    return 1
+
+# KEYS: apikey hash. ARGV: invalidation channel, api key. Returns 1 if the key existed.
+REVOKE_API_KEY = """
+local deleted = redis.call('DEL', KEYS[1])
+redis.call('PUBLISH', ARGV[1], ARGV[2])
+return deleted
+"""
+
+def _revoke_api_key_fallback(client, keys, args):
+    deleted = client.delete(keys[0])
+    client.publish(args[0], args[1])
+    return deleted
+
+scripts.register("authenticate", AUTHENTICATE, _authenticate_fallback, _authenticate_async_fallback)
+scripts.register("create_api_key", CREATE_API_KEY, _create_api_key_fallback)
+scripts.register("revoke_api_key", REVOKE_API_KEY, _revoke_api_key_fallback)
+
+# ===================== QUEUES =====================
+
+# KEYS: processing list, queue, consumer's alive key, consumers set. ARGV: consumer.
+# Returns -1 if the consumer is alive after all, else how many items went back to the
+# queue head (in their original order). Checking liveness inside the script closes the
+# race with a consumer that comes back mid-sweep.
+REQUEUE_CONSUMER = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return -1
+end
+local moved = 0
+while redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT') do
+    moved = moved + 1
+end
+redis.call('SREM', KEYS[4], ARGV[1])
+return moved
+"""
+
+def _requeue_consumer_fallback(client, keys, args):
+    if client.exists(keys[2]):
+        return -1
+    moved = 0
+    while client.lmove(keys[0], keys[1], "RIGHT", "LEFT") is not None:
+        moved += 1
+    client.srem(keys[3], args[0])
+    return moved
+
+scripts.register("requeue_consumer", REQUEUE_CONSUMER, _requeue_consumer_fallback)
@@ -0,0 +1,257 @@
+"""Wire codecs (JSON via orjson, msgpack) and transparent compression of stored values.
+
+Responses follow the Accept header: `application/msgpack` (or `application/x-msgpack`)
+gets msgpack, anything else JSON. Request bodies are decoded by Content-Type the same way.
+orjson, msgpack and lz4 are optional; without them the app falls back to the stdlib
+json encoder, JSON only and zlib respectively.
+"""
+import logging
+import os
+import zlib
+from flask import Request, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import UnsupportedMediaType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+# ===================== CONTENT NEGOTIATION =====================
+
+def preferred_mimetype(accept):
+    """Picks the response codec for a werkzeug Accept header; JSON unless msgpack is explicitly preferred."""
+    if msgpack is None:
+        return JSON_MIMETYPE
+    return accept.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+
+def _text(obj):
+    """Turns msgpack bin values into str the way the Redis client decodes them (surrogateescape)."""
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", "surrogateescape")
+    if isinstance(obj, dict):
+        return {_text(k): _text(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_text(item) for item in obj]
+    return obj
+
+def decode_msgpack(data):
+    """Decodes a msgpack request body; raises ValueError if it is malformed."""
+    if msgpack is None:
+        raise UnsupportedMediaType("msgpack is not installed on this server")
+    try:
+        return _text(msgpack.unpackb(data, raw=False, unicode_errors="surrogateescape"))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid msgpack body: {str(e)}")
+
+def encode_msgpack(obj, default=None):
+    # Values read back from Redis may be binary (surrogate-escaped); pack them byte-for-byte
+    return msgpack.packb(obj, default=default, unicode_errors="surrogateescape")
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """jsonify() through orjson when it is installed, answering in msgpack when the client prefers it.
+
+    Install with `app.json = NegotiatingJSONProvider(app)`; every jsonify() call
+    in the app then negotiates without changes to the views.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
+        except TypeError:
+            # orjson refuses surrogate-escaped (binary) strings; the stdlib encoder escapes them
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+
+    def _orjson_options(self):
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def response_mimetype(self):
+        """The negotiated response mimetype for the current request."""
+        if not has_request_context():
+            return JSON_MIMETYPE
+        return preferred_mimetype(request.accept_mimetypes)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = self.response_mimetype()
+        if mimetype != JSON_MIMETYPE:
+            response = self._app.response_class(encode_msgpack(obj, self.default), mimetype=mimetype)
+        elif orjson is None or self._app.debug:
+            response = super().response(obj)
+        else:
+            try:
+                body = orjson.dumps(obj, default=self.default,
+                                    option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+            except TypeError:
+                body = f"{super().dumps(obj, separators=(',', ':'))}\n"
+            response = self._app.response_class(body, mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add("Accept")
+        return response
+
+class NegotiatingRequest(Request):
+    """Flask request whose get_json() also accepts msgpack bodies."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if self.mimetype not in MSGPACK_MIMETYPES:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return decode_msgpack(self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            return self.on_json_loading_failed(e)
+
+# ===================== VALUE COMPRESSION =====================
+
+# Compressed values start with HEADER and one algorithm byte. Values are kept as str
+# with the compressed bytes surrogate-escaped, which the Redis clients round-trip
+# exactly (encoding_errors="surrogateescape" in config.py).
+HEADER = "\x00"
+RAW_TAG = "r"  # An uncompressed value that happens to start with HEADER
+# algorithm -> (tag byte, compress(data, level), decompress(data))
+ALGORITHMS = {
+    "zlib": ("z", lambda data, level: zlib.compress(data, level), zlib.decompress),
+    "lz4": ("4", lambda data, level: lz4_frame.compress(data, compression_level=max(level, 0)),
+            lambda data: lz4_frame.decompress(data)),
+}
+DECOMPRESSORS = {tag: decompress for tag, _, decompress in ALGORITHMS.values()}
+
+# redis-py method -> position of its first value argument in a (method, *args) call;
+# every argument from there on is a value
+VALUE_ARGS = {"set": 2, "setex": 3, "hset": 3, "rpush": 2, "lpush": 2}
+# redis-py methods whose reply is a value, or a list of values
+VALUE_REPLIES = {"get", "hget", "lpop", "rpop", "mget", "hmget"}
+
+class ValueCompressor:
+    """Compresses stored values of at least `min_size` bytes; reads decompress whatever they find.
+
+    Reads recognise compressed values regardless of the current setting, so
+    compression can be switched on, off or to another algorithm without
+    rewriting existing data. A value is only stored compressed when that
+    makes it smaller. Values that start with HEADER are escaped with RAW_TAG
+    even while compression is off, so a read can always tell them apart.
+    """
+
+    def __init__(self, algorithm=None, min_size=1024, level=-1):
+        self.algorithm = algorithm
+        self.min_size = min_size
+        self.level = level
+        self._tag, self._compress, _ = ALGORITHMS[algorithm] if algorithm else (None, None, None)
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decompressed = 0
+
+    def pack(self, value):
+        """Returns value as it should be stored."""
+        if not isinstance(value, str):
+            return value
+        if value.startswith(HEADER):
+            return HEADER + RAW_TAG + value
+        if self._tag is None or len(value) * 4 < self.min_size:  # At most 4 bytes per character; skips the encode for small values
+            return value
+        data = value.encode("utf-8", "surrogateescape")
+        if len(data) < self.min_size:
+            return value
+        compressed = self._compress(data, self.level)
+        if len(compressed) + 2 >= len(data):
+            self.skipped += 1
+            return value
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed) + 2
+        return HEADER + self._tag + compressed.decode("utf-8", "surrogateescape")
+
+    def unpack(self, value):
+        """Returns a stored value as written by the client."""
+        if not isinstance(value, str) or not value.startswith(HEADER):
+            return value
+        tag = value[1:2]
+        if tag == RAW_TAG:
+            return value[2:]
+        decompress = DECOMPRESSORS.get(tag)
+        if decompress is None:
+            return value
+        try:
+            data = decompress(value[2:].encode("utf-8", "surrogateescape"))
+        except Exception:
+            # Written by something else (or while compression was off) and merely starts with HEADER
+            return value
+        self.decompressed += 1
+        return data.decode("utf-8", "surrogateescape")
+
+    def pack_mapping(self, mapping):
+        return {name: self.pack(value) for name, value in mapping.items()}
+
+    def pack_call(self, call):
+        """Packs the value arguments of a (method, *args) call."""
+        start = VALUE_ARGS.get(call[0])
+        if start is not None:
+            return (*call[:start], *(self.pack(value) for value in call[start:]))
+        if call[0] == "mset":
+            return (call[0], self.pack_mapping(call[1]), *call[2:])
+        return call
+
+    def unpack_reply(self, method, reply):
+        """Unpacks the reply of a redis-py method (single values and lists of values)."""
+        if method not in VALUE_REPLIES or reply is None or isinstance(reply, Exception):
+            return reply
+        if isinstance(reply, list):
+            return [self.unpack(value) for value in reply]
+        return self.unpack(reply)
+
+    def stats(self):
+        return {
+            'algorithm': self.algorithm,
+            'min_size': self.min_size,
+            'compressed': self.compressed,
+            'skipped': self.skipped,
+            'decompressed': self.decompressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None
+        }
+
+def create_value_compressor():
+    """Builds the ValueCompressor from VALUE_COMPRESSION* environment variables (off unless set)."""
+    algorithm = os.environ.get('VALUE_COMPRESSION', '').lower() or None
+    if algorithm == "lz4" and lz4_frame is None:
+        logger.warning("VALUE_COMPRESSION=lz4 but the lz4 package is not installed; using zlib")
+        algorithm = "zlib"
+    if algorithm not in (None, *ALGORITHMS):
+        logger.warning(f"Unknown VALUE_COMPRESSION '{algorithm}'; compression disabled")
+        algorithm = None
+    compressor = ValueCompressor(
+        algorithm,
+        min_size=int(os.environ.get('VALUE_COMPRESSION_MIN_BYTES', 1024)),
+        level=int(os.environ.get('VALUE_COMPRESSION_LEVEL', -1))
+    )
+    if algorithm:
+        logger.info(f"Compressing stored values of {compressor.min_size}+ bytes with {algorithm}")
+    return compressor
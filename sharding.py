@@ -0,0 +1,829 @@
+"""Sharded Redis backends: consistent hashing over independent servers, or Redis Cluster.
+
+REDIS_SHARD_URLS spreads keys over several servers on a hash ring with virtual
+nodes; REDIS_CLUSTER_URL talks to a Redis Cluster. Either way the client is a
+drop-in for redis.Redis: single-key commands go to the key's node, MGET/MSET/
+DEL/EXISTS fan out in parallel and merge, SCAN walks every node and pipelines
+are split per node. Keys sharing a {hash tag} always land on the same node (the
+Redis Cluster rule), and key prefixes can be pinned to one node of the ring.
+
+After adding or removing ring nodes, move the keys whose owner changed:
+
+    python sharding.py rebalance --from "a=redis://h1:6379,b=redis://h2:6379" \\
+                                 --to "a=redis://h1:6379,b=redis://h2:6379,c=redis://h3:6379"
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import redis
+import redis.asyncio as aioredis
+from circuit_breaker import GuardedAsyncRedisCluster
+from metrics import InstrumentedRedisCluster
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ===================== KEY ROUTING =====================
+
+# Commands without keys; they run on the default (pin) node
+KEYLESS_COMMANDS = {"PING", "ECHO", "INFO", "CONFIG", "PUBLISH", "SCRIPT", "FLUSHDB", "FLUSHALL",
+                    "DBSIZE", "TIME", "CLIENT", "COMMAND", "SLOWLOG", "LASTSAVE", "RANDOMKEY"}
+# Commands every node must see; the reply is the default node's (DBSIZE is summed)
+BROADCAST_COMMANDS = {"PING", "FLUSHDB", "FLUSHALL", "DBSIZE", "SCRIPT LOAD", "SCRIPT FLUSH", "CONFIG SET"}
+# Key layouts other than "the first argument is the key"
+ALL_KEYS_COMMANDS = {"MGET", "DEL", "UNLINK", "EXISTS", "TOUCH", "SDIFF", "SINTER", "SUNION", "PFCOUNT"}
+KEY_VALUE_COMMANDS = {"MSET", "MSETNX"}
+TIMEOUT_LAST_COMMANDS = {"BLPOP", "BRPOP", "BZPOPMIN", "BZPOPMAX"}
+TWO_KEY_COMMANDS = {"RPOPLPUSH", "BRPOPLPUSH", "LMOVE", "BLMOVE", "SMOVE", "RENAME", "RENAMENX", "COPY"}
+SUBCOMMAND_KEY_COMMANDS = {"MEMORY", "OBJECT"}  # e.g. MEMORY USAGE key
+# Multi-key commands split per node when their keys span nodes (not atomic across nodes)
+SPLIT_COMMANDS = {"MGET", "MSET", "DEL", "UNLINK", "EXISTS", "TOUCH"}
+
+class CrossShardError(redis.exceptions.ResponseError):
+    """A command (or transaction) whose keys live on different nodes."""
+
+    def __init__(self, nodes):
+        super().__init__(f"CROSSSLOT Keys in request don't hash to the same node ({', '.join(sorted(nodes))})")
+
+def command_name(args):
+    """"SCRIPT LOAD"-style name for container commands, else the upper-cased command."""
+    name = str(args[0]).upper()
+    if len(args) > 1 and f"{name} {str(args[1]).upper()}" in BROADCAST_COMMANDS:
+        return f"{name} {str(args[1]).upper()}"
+    return name
+
+def command_keys(args):
+    """The keys of a (command, *args) call, in order; empty for keyless commands."""
+    command = str(args[0]).upper()
+    if command in KEYLESS_COMMANDS or len(args) < 2:
+        return []
+    if command in ALL_KEYS_COMMANDS:
+        return list(args[1:])
+    if command in KEY_VALUE_COMMANDS:
+        return list(args[1::2])
+    if command in TIMEOUT_LAST_COMMANDS:
+        return list(args[1:-1])
+    if command in TWO_KEY_COMMANDS:
+        return list(args[1:3])
+    if command in ("EVAL", "EVALSHA"):
+        return list(args[3:3 + int(args[2])])
+    if command in SUBCOMMAND_KEY_COMMANDS:
+        return list(args[2:3])
+    if command in ("XREAD", "XREADGROUP"):
+        streams = [str(arg).upper() for arg in args].index("STREAMS")
+        rest = args[streams + 1:]
+        return list(rest[:len(rest) // 2])
+    return [args[1]]
+
+def _key_text(key):
+    return key.decode("utf-8", "surrogateescape") if isinstance(key, bytes) else str(key)
+
+def hash_tag(key):
+    """The part of key that is hashed: the first non-empty {...} section, else the whole key."""
+    key = _key_text(key)
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+def _hash(text):
+    return int.from_bytes(hashlib.md5(text.encode("utf-8", "surrogateescape")).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hash ring; each node owns `vnodes` points, so adding a node moves ~1/N of the keys."""
+
+    def __init__(self, nodes, vnodes=160):
+        points = sorted((_hash(f"{name}#{i}"), name) for name in nodes for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._nodes = [name for _, name in points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self._points, _hash(hash_tag(key)))
+        return self._nodes[index % len(self._nodes)]
+
+# ===================== SHARED MACHINERY =====================
+
+def split_work(args, keys, groups):
+    """Per-node arguments for a SPLIT_COMMANDS call whose keys span nodes."""
+    if str(args[0]).upper() == "MSET":
+        values = args[2::2]
+        return {node: [arg for i in indexes for arg in (keys[i], values[i])] for node, indexes in groups.items()}
+    return {node: [keys[i] for i in indexes] for node, indexes in groups.items()}
+
+def merge_split(args, keys, groups, replies):
+    """Merges the per-node replies of a split call into the single-node reply."""
+    command = str(args[0]).upper()
+    if command == "MGET":
+        merged = [None] * len(keys)
+        for node, indexes in groups.items():
+            for index, value in zip(indexes, replies[node]):
+                merged[index] = value
+        return merged
+    if command == "MSET":
+        return all(replies.values())
+    return sum(replies.values())
+
+class KeyRouter:
+    """Maps calls to nodes. Subclasses provide node_for_key(key) and default_node()."""
+
+    def route(self, args):
+        """The one node a call runs on; raises CrossShardError if its keys span nodes."""
+        keys = command_keys(args)
+        if not keys:
+            return self.default_node()
+        nodes = {self.node_for_key(key) for key in keys}
+        if len(nodes) > 1:
+            raise CrossShardError(nodes)
+        return nodes.pop()
+
+    def group_keys(self, keys):
+        """{node: [indexes into keys]} for the nodes owning keys."""
+        groups = {}
+        for index, key in enumerate(keys):
+            groups.setdefault(self.node_for_key(key), []).append(index)
+        return groups
+
+class HashRingRouter(KeyRouter):
+    """Node table of the consistent-hash clients.
+
+    `nodes` maps a stable node name to its client; positions on the ring come
+    from the names, so a node keeps its keys when its address changes. Keys
+    starting with one of `pinned_prefixes` always live on `pin_node` (the
+    default node, which also takes keyless commands, pub/sub and PUBLISH).
+    """
+
+    def __init__(self, nodes, vnodes=160, pinned_prefixes=(), pin_node=None):
+        # Not redis.Redis.__init__: every node brings its own client and pool
+        self.nodes = dict(nodes)
+        if not self.nodes:
+            raise ValueError("At least one shard node is required")
+        self.vnodes = vnodes
+        self.ring = HashRing(self.nodes, vnodes)
+        self.pinned_prefixes = tuple(pinned_prefixes)
+        self.pin_node = pin_node or next(iter(self.nodes))
+        if self.pin_node not in self.nodes:
+            raise ValueError(f"Pin node '{self.pin_node}' is not one of {sorted(self.nodes)}")
+        self.connection_pool = None
+        self.response_callbacks = {}
+        self.routed = Counter()
+
+    def __repr__(self):
+        return f"{type(self).__name__}<{', '.join(self.nodes)}>"
+
+    def node_names(self):
+        return list(self.nodes)
+
+    def node_client(self, name):
+        return self.nodes[name]
+
+    def default_node(self):
+        return self.pin_node
+
+    def node_for_key(self, key):
+        if self.pinned_prefixes and _key_text(key).startswith(self.pinned_prefixes):
+            return self.pin_node
+        return self.ring.node_for(key)
+
+    def shard_stats(self):
+        return {
+            'mode': 'ring',
+            'vnodes': self.vnodes,
+            'pin_node': self.pin_node,
+            'pinned_prefixes': list(self.pinned_prefixes),
+            'routed': {name: self.routed[name] for name in self.nodes}
+        }
+
+class _Done:
+    """End-of-node marker for the parallel SCAN walkers."""
+
+    def __init__(self, error=None):
+        self.error = error
+
+class ShardRouting(KeyRouter):
+    """Parallel fan-out, SCAN, pipelines and pub/sub shared by the sync sharded clients.
+
+    Subclasses provide node_names(), node_client(name), node_for_key(key),
+    default_node(), _scan_node(name, cursor, match, count, _type) and a
+    `routed` Counter.
+    """
+
+    scan_buffer = 4  # SCAN pages buffered per node while streaming
+    _executor = None
+    _executor_pid = None
+    _executor_lock = threading.Lock()
+
+    def _fanout_executor(self):
+        # Threads don't survive a fork, so each gunicorn worker builds its own pool
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=min(32, 4 * len(self.node_names())),
+                                                    thread_name_prefix="shard-fanout")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def fan_out(self, func, work):
+        """Runs func(node, payload) for every item of work ({node: payload}) in parallel; returns {node: result}."""
+        for node in work:
+            self.routed[node] += 1
+        if len(work) == 1:
+            node, payload = next(iter(work.items()))
+            return {node: func(node, payload)}
+        executor = self._fanout_executor()
+        futures = {node: executor.submit(func, node, payload) for node, payload in work.items()}
+        return {node: future.result() for node, future in futures.items()}
+
+    # ===================== SCAN =====================
+
+    def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        """One SCAN page; nodes are walked one after another.
+
+        The cursor packs the node index and that node's own cursor
+        (node_cursor * nodes + index), so it stays a single integer.
+        """
+        names = self.node_names()
+        index, node_cursor = int(cursor) % len(names), int(cursor) // len(names)
+        next_cursor, keys = self._scan_node(names[index], node_cursor, match, count, _type)
+        return pack_cursor(int(next_cursor), index, len(names)), keys
+
+    def scan_iter(self, match=None, count=None, _type=None, **kwargs):
+        """Yields every key, walking all nodes in parallel; keys from different nodes interleave."""
+        names = self.node_names()
+        pages = queue.Queue(maxsize=self.scan_buffer * len(names))
+        stop = threading.Event()
+
+        def offer(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def walk(name):
+            try:
+                cursor = None
+                while cursor != 0 and not stop.is_set():
+                    cursor, keys = self._scan_node(name, cursor or 0, match, count, _type)
+                    cursor = int(cursor)
+                    if keys:
+                        offer(keys)
+                offer(_Done())
+            except Exception as e:
+                offer(_Done(e))
+
+        for name in names:
+            threading.Thread(target=walk, args=(name,), name=f"shard-scan-{name}", daemon=True).start()
+        remaining = len(names)
+        try:
+            while remaining:
+                page = pages.get()
+                if isinstance(page, _Done):
+                    remaining -= 1
+                    if page.error is not None:
+                        raise page.error
+                    continue
+                yield from page
+        finally:
+            stop.set()
+
+    # ===================== PIPELINES AND PUB/SUB =====================
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ShardedPipeline(self, transaction)
+
+    def pubsub(self, **kwargs):
+        """Channels are subscribed on the default node, patterns on every node (keyspace events are per node)."""
+        return ShardedPubSub(self.node_client(self.default_node()),
+                             [self.node_client(name) for name in self.node_names()], **kwargs)
+
+    def refresh(self):
+        """Re-reads the topology after a MOVED reply (nothing to do on a hash ring)."""
+
+def pack_cursor(node_cursor, index, nodes):
+    """The SCAN cursor after a page from node `index` returned node_cursor (0 once every node is done)."""
+    if node_cursor == 0:
+        return index + 1 if index + 1 < nodes else 0
+    return node_cursor * nodes + index
+
+class ShardedPipeline(redis.Redis):
+    """Pipeline split into one pipeline per node, sent in parallel; replies come back in call order.
+
+    A non-transactional pipeline may span nodes: a call whose own keys span
+    nodes gets a CROSSSLOT error in its slot. A transaction must stay on one
+    node, as with Redis Cluster.
+    """
+
+    def __init__(self, router, transaction=True):
+        # No connection of its own; calls are queued and handed to the node clients
+        self.router = router
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __repr__(self):
+        return f"{type(self).__name__}<{len(self.command_stack)} commands>"
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def close(self):
+        self.reset()
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute(self, raise_on_error=True):
+        stack, self.command_stack = self.command_stack, []
+        results = [None] * len(stack)
+        groups = group_calls(self.router, stack, results)
+        if self.transaction and len(groups) > 1:
+            raise CrossShardError(groups)
+        self._run(stack, groups, results)
+        if not self.transaction:
+            # MOVED means the command never ran: re-read the slot map and retry those once
+            moved = [i for i, result in enumerate(results) if isinstance(result, redis.exceptions.MovedError)]
+            if moved:
+                self.router.refresh()
+                self._run(stack, group_calls(self.router, stack, results, moved), results)
+        return finish_pipeline(results, raise_on_error)
+
+    def _run(self, stack, groups, results):
+        def run(node, indexes):
+            pipe = self.router.node_client(node).pipeline(transaction=self.transaction)
+            for index in indexes:
+                args, options = stack[index]
+                pipe.execute_command(*args, **options)
+            return pipe.execute(raise_on_error=False)
+
+        for node, replies in self.router.fan_out(run, groups).items():
+            for index, reply in zip(groups[node], replies):
+                results[index] = reply
+
+def group_calls(router, stack, results, indexes=None):
+    """{node: [stack indexes]}; calls that can't be routed get their error in results instead."""
+    groups = {}
+    for index in range(len(stack)) if indexes is None else indexes:
+        try:
+            groups.setdefault(router.route(stack[index][0]), []).append(index)
+        except redis.exceptions.ResponseError as e:
+            results[index] = e
+    return groups
+
+def finish_pipeline(results, raise_on_error):
+    if raise_on_error:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
+
+class ShardedPubSub:
+    """One pub/sub connection per node behind a single get_message().
+
+    Reader threads start with the first get_message() and feed a shared queue;
+    a connection error on any node is raised from get_message() after closing
+    the rest, so the caller's reconnect loop starts over cleanly.
+    """
+
+    def __init__(self, channel_client, pattern_clients, **kwargs):
+        self._channels = channel_client.pubsub(**kwargs)
+        self._patterns = [client.pubsub(**kwargs) for client in pattern_clients]
+        self._messages = queue.Queue()
+        self._stop = threading.Event()
+        self._readers = None
+
+    def subscribe(self, *args, **kwargs):
+        return self._channels.subscribe(*args, **kwargs)
+
+    def psubscribe(self, *args, **kwargs):
+        for pubsub in self._patterns:
+            pubsub.psubscribe(*args, **kwargs)
+
+    def _read(self, pubsub):
+        try:
+            while not self._stop.is_set():
+                if pubsub.connection is None:  # Nothing subscribed on this node
+                    self._stop.wait(1.0)
+                    continue
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    self._messages.put(message)
+        except Exception as e:
+            self._messages.put(e)
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if self._readers is None:
+            self._readers = [threading.Thread(target=self._read, args=(pubsub,), name="shard-pubsub", daemon=True)
+                             for pubsub in [self._channels, *self._patterns]]
+            for reader in self._readers:
+                reader.start()
+        try:
+            message = self._messages.get(timeout=timeout) if timeout else self._messages.get_nowait()
+        except queue.Empty:
+            return None
+        if isinstance(message, Exception):
+            self.close()
+            raise message
+        if ignore_subscribe_messages and message.get("type") in ("subscribe", "psubscribe"):
+            return None
+        return message
+
+    def close(self):
+        self._stop.set()
+        for pubsub in [self._channels, *self._patterns]:
+            pubsub.close()
+
+# ===================== CONSISTENT HASHING =====================
+
+class ShardedRedis(ShardRouting, HashRingRouter, redis.Redis):
+    """redis.Redis over several independent servers placed on a consistent hash ring."""
+
+    def close(self):
+        for client in self.nodes.values():
+            client.close()
+
+    def _scan_node(self, name, cursor, match, count, _type):
+        return self.nodes[name].scan(cursor=cursor, match=match, count=count, _type=_type)
+
+    def execute_command(self, *args, **options):
+        name = command_name(args)
+        if name in BROADCAST_COMMANDS:
+            replies = self.fan_out(lambda node, _: self.nodes[node].execute_command(*args, **options),
+                                   dict.fromkeys(self.nodes))
+            return sum(replies.values()) if name == "DBSIZE" else replies[self.pin_node]
+        keys = command_keys(args)
+        groups = self.group_keys(keys) if keys else {self.pin_node: []}
+        if len(groups) == 1:
+            node = next(iter(groups))
+            self.routed[node] += 1
+            return self.nodes[node].execute_command(*args, **options)
+        if name not in SPLIT_COMMANDS:
+            raise CrossShardError(groups)
+        replies = self.fan_out(lambda node, node_args: self.nodes[node].execute_command(args[0], *node_args, **options),
+                               split_work(args, keys, groups))
+        return merge_split(args, keys, groups, replies)
+
+class AsyncShardedPipeline(aioredis.Redis):
+    """Async ShardedPipeline: one pipeline per node, awaited concurrently."""
+
+    def __init__(self, router, transaction=True):
+        self.router = router
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __repr__(self):
+        return f"{type(self).__name__}<{len(self.command_stack)} commands>"
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    async def execute(self, raise_on_error=True):
+        stack, self.command_stack = self.command_stack, []
+        results = [None] * len(stack)
+        groups = group_calls(self.router, stack, results)
+        if self.transaction and len(groups) > 1:
+            raise CrossShardError(groups)
+
+        async def run(node, indexes):
+            pipe = self.router.node_client(node).pipeline(transaction=self.transaction)
+            for index in indexes:
+                args, options = stack[index]
+                pipe.execute_command(*args, **options)
+            return await pipe.execute(raise_on_error=False)
+
+        for node, replies in (await self.router.gather(run, groups)).items():
+            for index, reply in zip(groups[node], replies):
+                results[index] = reply
+        return finish_pipeline(results, raise_on_error)
+
+class AsyncShardedRedis(HashRingRouter, aioredis.Redis):
+    """redis.asyncio counterpart of ShardedRedis (used by asgi_app); fan-outs are gathered, not threaded."""
+
+    scan_buffer = ShardRouting.scan_buffer
+
+    async def aclose(self):
+        for client in self.nodes.values():
+            await client.aclose()
+
+    async def gather(self, func, work):
+        """Awaits func(node, payload) for every item of work concurrently; returns {node: result}."""
+        for node in work:
+            self.routed[node] += 1
+        nodes = list(work)
+        return dict(zip(nodes, await asyncio.gather(*(func(node, work[node]) for node in nodes))))
+
+    async def execute_command(self, *args, **options):
+        name = command_name(args)
+        if name in BROADCAST_COMMANDS:
+            replies = await self.gather(lambda node, _: self.nodes[node].execute_command(*args, **options),
+                                        dict.fromkeys(self.nodes))
+            return sum(replies.values()) if name == "DBSIZE" else replies[self.pin_node]
+        keys = command_keys(args)
+        groups = self.group_keys(keys) if keys else {self.pin_node: []}
+        if len(groups) == 1:
+            node = next(iter(groups))
+            self.routed[node] += 1
+            return await self.nodes[node].execute_command(*args, **options)
+        if name not in SPLIT_COMMANDS:
+            raise CrossShardError(groups)
+        replies = await self.gather(
+            lambda node, node_args: self.nodes[node].execute_command(args[0], *node_args, **options),
+            split_work(args, keys, groups))
+        return merge_split(args, keys, groups, replies)
+
+    async def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        """One SCAN page with the same packed cursor as ShardedRedis.scan."""
+        names = self.node_names()
+        index, node_cursor = int(cursor) % len(names), int(cursor) // len(names)
+        next_cursor, keys = await self.nodes[names[index]].scan(cursor=node_cursor, match=match,
+                                                                count=count, _type=_type)
+        return pack_cursor(int(next_cursor), index, len(names)), keys
+
+    async def scan_iter(self, match=None, count=None, _type=None, **kwargs):
+        """Yields every key, walking all nodes concurrently."""
+        names = self.node_names()
+        pages = asyncio.Queue(maxsize=self.scan_buffer * len(names))
+
+        async def walk(name):
+            try:
+                cursor = None
+                while cursor != 0:
+                    cursor, keys = await self.nodes[name].scan(cursor=cursor or 0, match=match,
+                                                               count=count, _type=_type)
+                    cursor = int(cursor)
+                    if keys:
+                        await pages.put(keys)
+                await pages.put(_Done())
+            except Exception as e:
+                await pages.put(_Done(e))
+
+        walkers = [asyncio.create_task(walk(name)) for name in names]
+        remaining = len(names)
+        try:
+            while remaining:
+                page = await pages.get()
+                if isinstance(page, _Done):
+                    remaining -= 1
+                    if page.error is not None:
+                        raise page.error
+                    continue
+                for key in page:
+                    yield key
+        finally:
+            for walker in walkers:
+                walker.cancel()
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncShardedPipeline(self, transaction)
+
+# ===================== REDIS CLUSTER =====================
+
+class ClusterRedis(ShardRouting, InstrumentedRedisCluster):
+    """RedisCluster with the ring client's parallel SCAN, per-node pipelines and per-node pub/sub.
+
+    Pipelines are split per primary like ShardedPipeline rather than using
+    redis-py's ClusterPipeline, which refuses PUBLISH and transactions.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.routed = Counter()
+
+    def node_names(self):
+        return sorted(node.name for node in self.get_primaries())
+
+    def node_client(self, name):
+        return self.get_redis_connection(self.get_node(node_name=name))
+
+    def default_node(self):
+        return self.get_default_node().name
+
+    def node_for_key(self, key):
+        return self.get_node_from_key(key).name
+
+    def refresh(self):
+        self.nodes_manager.initialize()
+
+    def _scan_node(self, name, cursor, match, count, _type):
+        cursors, keys = InstrumentedRedisCluster.scan(self, cursor=cursor, match=match, count=count, _type=_type,
+                                                      target_nodes=self.get_node(node_name=name))
+        return cursors[name], keys
+
+    def mget(self, keys, *args):
+        return self.mget_nonatomic(keys, *args)
+
+    def mset(self, mapping):
+        return all(self.mset_nonatomic(mapping))
+
+    def shard_stats(self):
+        return {'mode': 'cluster', 'primaries': self.node_names(), 'routed': dict(self.routed)}
+
+class LazyClusterRedis:
+    """Builds its ClusterRedis on first use; RedisCluster fetches the slot map in its constructor.
+
+    While the cluster is unreachable every call raises ConnectionError (the
+    apps answer 503) and the next call tries again, so nothing blocks at import.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        self._client = self._factory()
+                    except redis.exceptions.RedisClusterException as e:
+                        raise redis.exceptions.ConnectionError(f"Redis Cluster unreachable: {str(e)}")
+        return self._client
+
+    def __getattr__(self, name):
+        if not hasattr(ClusterRedis, name):
+            # hasattr()/getattr() probes (connection_pool, primary, ...) must not connect
+            raise AttributeError(name)
+        return getattr(self._connect(), name)
+
+    def shard_stats(self):
+        if self._client is None:
+            return {'mode': 'cluster', 'primaries': [], 'connected': False}
+        return self._client.shard_stats()
+
+class AsyncClusterRedis(GuardedAsyncRedisCluster):
+    """Async RedisCluster with the packed SCAN cursor and nonatomic MGET/MSET of ClusterRedis.
+
+    Pipelines are redis-py's ClusterPipeline, so /batch transactions are refused.
+    """
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        if transaction:
+            raise redis.exceptions.ResponseError("Transactions are not supported by the async cluster client")
+        return super().pipeline()
+
+    def _primaries(self):
+        return sorted(self.get_primaries(), key=lambda node: node.name)
+
+    async def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        nodes = self._primaries()
+        index, node_cursor = int(cursor) % len(nodes), int(cursor) // len(nodes)
+        cursors, keys = await super().scan(cursor=node_cursor, match=match, count=count, _type=_type,
+                                           target_nodes=nodes[index])
+        return pack_cursor(int(cursors[nodes[index].name]), index, len(nodes)), keys
+
+    async def mget(self, keys, *args):
+        return await self.mget_nonatomic(keys, *args)
+
+    async def mset(self, mapping):
+        return all(await self.mset_nonatomic(mapping))
+
+    def shard_stats(self):
+        return {'mode': 'cluster', 'primaries': [node.name for node in self._primaries()]}
+
+# ===================== CONFIGURATION =====================
+
+def parse_shard_urls(value):
+    """Parses "name=url,url,..." into {name: url}; unnamed entries are named host:port/db."""
+    nodes = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, url = entry.partition("=")
+        if not sep or "://" in name:
+            url = entry if "://" in entry else f"redis://{entry}"
+            parsed = urlparse(url)
+            name = f"{parsed.hostname}:{parsed.port or 6379}{parsed.path if parsed.path not in ('', '/') else ''}"
+        nodes[name] = url
+    return nodes
+
+def pinned_prefixes():
+    return tuple(filter(None, os.environ.get('SHARD_PINNED_PREFIXES', 'apikey:,api_logs').split(',')))
+
+def create_sharded_client(node_factory, client_class=ShardedRedis):
+    """Builds the ring client from REDIS_SHARD_URLS / SHARD_* env vars; node_factory(url) makes each node."""
+    urls = parse_shard_urls(os.environ['REDIS_SHARD_URLS'])
+    client = client_class(
+        {name: node_factory(url) for name, url in urls.items()},
+        vnodes=int(os.environ.get('SHARD_VNODES', 160)),
+        pinned_prefixes=pinned_prefixes(),
+        pin_node=os.environ.get('SHARD_PIN_NODE') or None
+    )
+    logger.info(f"Sharding keys over {len(urls)} nodes ({', '.join(urls)}); pinned to {client.pin_node}: "
+                f"{', '.join(client.pinned_prefixes) or 'nothing'}")
+    return client
+
+# ===================== REBALANCING =====================
+
+def rebalance(old, new, batch_size=500, dry_run=False):
+    """Moves every key whose owner differs between two ShardedRedis layouts.
+
+    Nodes are matched by name. Keys are copied with DUMP/PTTL + RESTORE (type,
+    value and TTL preserved) and deleted from the old node once restored.
+    Returns {node: {'scanned': n, 'moved': n}}. Point the app at the new layout
+    first: until a key has moved, reads of it miss. A key the app has already
+    written on its new owner is left there (RESTORE without REPLACE answers
+    BUSYKEY) and only the stale source copy is deleted.
+    """
+    report = {}
+    for source in old.node_names():
+        client = old.node_client(source)
+        counts = report.setdefault(source, {'scanned': 0, 'moved': 0})
+        batch = []
+        for key in client.scan_iter(count=batch_size):
+            counts['scanned'] += 1
+            if new.node_for_key(key) != source:
+                batch.append(key)
+            if len(batch) >= batch_size:
+                counts['moved'] += _move_keys(client, new, batch, dry_run)
+                batch = []
+        if batch:
+            counts['moved'] += _move_keys(client, new, batch, dry_run)
+        logger.info(f"Node {source}: scanned {counts['scanned']} keys, "
+                    f"{'would move' if dry_run else 'moved'} {counts['moved']}")
+    return report
+
+def _move_keys(source, new, keys, dry_run):
+    if dry_run:
+        return len(keys)
+    pipe = source.pipeline(transaction=False)
+    for key in keys:
+        pipe.dump(key)
+        pipe.pttl(key)
+    replies = pipe.execute()
+    targets = {}
+    for key, payload, ttl in zip(keys, replies[::2], replies[1::2]):
+        if payload is not None and ttl != -2:  # Gone since the SCAN
+            targets.setdefault(new.node_for_key(key), []).append((key, payload, max(ttl, 0)))
+    moved = []
+    for node, entries in targets.items():
+        pipe = new.node_client(node).pipeline(transaction=False)
+        for key, payload, ttl in entries:
+            pipe.restore(key, ttl, payload)
+        for (key, _, _), reply in zip(entries, pipe.execute(raise_on_error=False)):
+            if isinstance(reply, redis.exceptions.ResponseError) and str(reply).startswith("BUSYKEY"):
+                moved.append(key)  # Written on its new owner since the switch; that copy is newer
+            elif isinstance(reply, Exception):
+                logger.error(f"Could not move {key!r} to {node}: {str(reply)}")
+            else:
+                moved.append(key)
+    if moved:
+        source.delete(*moved)
+    return len(moved)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharding tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("rebalance", help="Move keys to their owners after nodes were added or removed")
+    move.add_argument("--from", dest="old", default=os.environ.get('REDIS_SHARD_URLS'),
+                      help="Current node list (default: REDIS_SHARD_URLS)")
+    move.add_argument("--to", dest="new", required=True, help="New node list, same format")
+    move.add_argument("--vnodes", type=int, default=int(os.environ.get('SHARD_VNODES', 160)))
+    move.add_argument("--pin-node", default=os.environ.get('SHARD_PIN_NODE') or None)
+    move.add_argument("--batch", type=int, default=500)
+    move.add_argument("--dry-run", action="store_true", help="Only count the keys that would move")
+    args = parser.parse_args(argv)
+    if not args.old:
+        parser.error("--from is required when REDIS_SHARD_URLS is not set")
+
+    # Raw bytes: DUMP payloads and binary key names must pass through untouched
+    old_urls, new_urls = parse_shard_urls(args.old), parse_shard_urls(args.new)
+    clients = {name: redis.Redis.from_url(url) for name, url in {**old_urls, **new_urls}.items()}
+    old = ShardedRedis({name: clients[name] for name in old_urls}, args.vnodes, pinned_prefixes(),
+                       args.pin_node if args.pin_node in old_urls else None)
+    new = ShardedRedis({name: clients[name] for name in new_urls}, args.vnodes, pinned_prefixes(),
+                       args.pin_node)
+    report = rebalance(old, new, batch_size=args.batch, dry_run=args.dry_run)
+    total = sum(counts['moved'] for counts in report.values())
+    print(f"{'Would move' if args.dry_run else 'Moved'} {total} of "
+          f"{sum(counts['scanned'] for counts in report.values())} keys")
+
+if __name__ == "__main__":
+    main()
@@ -33,24 +33,40 @@ function getKey() {
     });
 }
 
-function listKeys() {
-    fetch(`${API_BASE_URL}/list_keys`, {
-        method: "GET",
-        headers: { "X-API-Key": getApiKey() }
-    })
-    .then(response => response.json())
-    .then(data => {
-        const searchKey = document.getElementById("searchKey").value.toLowerCase();
-        const keysList = document.getElementById("keysList");
-        keysList.innerHTML = "";
+// Escapes glob metacharacters and turns each letter into a [xX] class so SCAN MATCH ignores case
+function caseInsensitiveGlob(text) {
+    return Array.from(text).map(ch => {
+        if (/[*?[\]\\]/.test(ch)) return `\\${ch}`;
+        const lower = ch.toLowerCase(), upper = ch.toUpperCase();
+        return lower !== upper ? `[${lower}${upper}]` : ch;
+    }).join("");
+}
+
+async function listKeys() {
+    const searchKey = document.getElementById("searchKey").value;
+    const keysList = document.getElementById("keysList");
+    keysList.innerHTML = "";
+
+    // Page through the keyspace with SCAN, rendering each page as it arrives
+    const match = searchKey ? `*${caseInsensitiveGlob(searchKey)}*` : "*";
+    let cursor = 0;
+    do {
+        const response = await fetch(
+            `${API_BASE_URL}/list_keys?cursor=${cursor}&count=200&match=${encodeURIComponent(match)}`,
+            { method: "GET", headers: { "X-API-Key": getApiKey() } }
+        );
+        const data = await response.json();
+        if (!response.ok) {
+            alert(data.error);
+            return;
+        }
         data.keys.forEach(key => {
-            if (key.toLowerCase().includes(searchKey)) {
-                let li = document.createElement("li");
-                li.innerText = key;
-                keysList.appendChild(li);
-            }
+            let li = document.createElement("li");
+            li.innerText = key;
+            keysList.appendChild(li);
         });
-    });
+        cursor = data.cursor;
+    } while (cursor !== 0);
 }
 
 function deleteKey() {
@@ -125,3 +141,102 @@ function dequeue() {
         document.getElementById("queueResult").innerText = `Dequeued: ${data.value || data.error}`;
     });
 }
+
+// 🔹 Live Updates: one SSE stream from /events keeps the key list, lookups and queue view current
+const REMOVED_EVENTS = ["del", "expired", "evicted"];
+const MAX_EVENT_LOG = 50;
+let liveController = null;
+
+function toggleLiveUpdates() {
+    if (liveController) {
+        liveController.abort();
+        liveController = null;
+        document.getElementById("liveButton").innerText = "Go Live";
+        return;
+    }
+    liveController = new AbortController();
+    document.getElementById("liveButton").innerText = "Stop";
+    streamEvents(liveController, 1000);
+}
+
+async function streamEvents(controller, retryDelay) {
+    const pattern = document.getElementById("eventPattern").value || "*";
+    try {
+        // fetch rather than EventSource so the API key can go in a header
+        const response = await fetch(`${API_BASE_URL}/events?pattern=${encodeURIComponent(pattern)}`, {
+            headers: { "X-API-Key": getApiKey() },
+            signal: controller.signal
+        });
+        if (!response.ok) {
+            throw new Error((await response.json()).error);
+        }
+        retryDelay = 1000;
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const frames = buffer.split("\n\n");
+            buffer = frames.pop();
+            frames.forEach(handleEventFrame);
+        }
+    } catch (error) {
+        if (controller.signal.aborted) return;
+        logEvent(`Disconnected: ${error.message}`);
+    }
+    if (!controller.signal.aborted) {
+        // Reconnect with backoff; anything missed meanwhile is picked up by re-listing
+        setTimeout(() => streamEvents(controller, Math.min(retryDelay * 2, 30000)), retryDelay);
+    }
+}
+
+function handleEventFrame(frame) {
+    let type = "message";
+    let data = "";
+    frame.split("\n").forEach(line => {
+        if (line.startsWith("event: ")) type = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+    });
+    if (!data) return;  // Comments and heartbeats
+    const event = JSON.parse(data);
+
+    if (type === "key") {
+        updateKeyList(event.key, !REMOVED_EVENTS.includes(event.event));
+        if (event.key === document.getElementById("getKey").value) getKey();
+        logEvent(`${event.event} ${event.key}`);
+    } else if (type === "queue") {
+        if (event.queue === document.getElementById("queueName").value) {
+            document.getElementById("queueResult").innerText = `New in ${event.queue}: ${event.values.join(", ")}`;
+        }
+        logEvent(`${event.count} item(s) pushed to ${event.queue}`);
+    } else if (type === "dropped") {
+        // We fell behind and lost events; re-read the key list to resync
+        logEvent(`Missed ${event.count} event(s), refreshing`);
+        listKeys();
+    }
+}
+
+function updateKeyList(key, present) {
+    const keysList = document.getElementById("keysList");
+    const existing = Array.from(keysList.children).find(li => li.innerText === key);
+    // Keep honouring the search box the list was loaded with
+    const matchesSearch = key.toLowerCase().includes(document.getElementById("searchKey").value.toLowerCase());
+    if (present && !existing && matchesSearch) {
+        let li = document.createElement("li");
+        li.innerText = key;
+        keysList.appendChild(li);
+    } else if (!present && existing) {
+        existing.remove();
+    }
+}
+
+function logEvent(text) {
+    const eventLog = document.getElementById("eventLog");
+    let li = document.createElement("li");
+    li.innerText = `${new Date().toLocaleTimeString()} ${text}`;
+    eventLog.prepend(li);
+    while (eventLog.children.length > MAX_EVENT_LOG) {
+        eventLog.lastChild.remove();
+    }
+}
@@ -0,0 +1,337 @@
+import threading
+import time
+import pytest
+import redis
+import embedded_store
+from embedded_store import EmbeddedStore
+from keyspace import enable_keyspace_events
+
+def _contents(store):
+    """Every live key as key -> (type, value), for comparing two stores."""
+    with store._lock:
+        return {key: (store.type(key), _value(store, key)) for key in list(store._data) if store.exists(key)}
+
+def _value(store, key):
+    kind = store.type(key)
+    if kind == "string":
+        return store.get(key)
+    if kind == "hash":
+        return store.hgetall(key)
+    if kind == "list":
+        return store.lrange(key, 0, -1)
+    if kind == "set":
+        return store.smembers(key)
+    return store.xrange(key)
+
+def _wait_for_rewrite(store, timeout=5):
+    deadline = time.monotonic() + timeout
+    while store._aof.rewriting:
+        assert time.monotonic() < deadline, "AOF rewrite did not finish"
+        time.sleep(0.01)
+
+@pytest.fixture
+def aof_path(tmp_path):
+    return str(tmp_path / "appendonly.aof")
+
+# ===================== EXPIRY =====================
+
+def test_key_expires_lazily_on_access():
+    store = EmbeddedStore(expiry_interval=60)
+    store.set("k", "v", px=30)
+    assert store.get("k") == "v"
+    assert 0 < store.pttl("k") <= 30
+    time.sleep(0.05)
+    assert store.get("k") is None
+    assert store.ttl("k") == -2
+
+def test_active_expiry_removes_untouched_keys():
+    store = EmbeddedStore(expiry_interval=0.01)
+    store.set("k", "v", px=20)
+    store.set("kept", "v")
+    time.sleep(0.1)
+    assert "k" not in store._data
+    assert store.expired_keys == 1
+    assert store.dbsize() == 1
+
+def test_persist_and_overwrite_clear_the_deadline():
+    store = EmbeddedStore(expiry_interval=60)
+    store.set("a", "v", ex=10)
+    assert store.persist("a") is True
+    assert store.ttl("a") == -1
+    store.set("b", "v", ex=10)
+    store.set("b", "w")
+    assert store.ttl("b") == -1
+
+def test_expire_in_the_past_deletes():
+    store = EmbeddedStore(expiry_interval=60)
+    store.set("k", "v")
+    assert store.pexpireat("k", 1) is True
+    assert store.exists("k") == 0
+
+def test_non_integer_arguments_raise_response_errors():
+    store = EmbeddedStore(expiry_interval=60)
+    store.set("k", "v")
+    store.rpush("l", "a")
+    calls = [(store.expire, "k", "abc"), (store.pexpire, "k", "abc"), (store.set, "k", "v", "abc"),
+             (store.incrby, "n", "x"), (store.hincrby, "h", "f", "x"), (store.lrem, "l", "x", "a"),
+             (store.lpop, "l", "x"), (store.scan, "abc")]
+    for method, *args in calls:
+        with pytest.raises(redis.exceptions.ResponseError):
+            method(*args)
+    assert store.exists("n", "h") == 0 and store.ttl("k") == -1
+
+    # One bad entry fails only itself, not the rest of the pipeline
+    pipe = store.pipeline(transaction=False)
+    pipe.expire("k", "abc").set("k", "w").get("k")
+    first, *rest = pipe.execute(raise_on_error=False)
+    assert isinstance(first, redis.exceptions.ResponseError) and rest == [True, "w"]
+
+# ===================== SCAN =====================
+
+def _scan_all(store, **kwargs):
+    cursor, calls, keys = 0, 0, []
+    while True:
+        cursor, page = store.scan(cursor=cursor, **kwargs)
+        keys.extend(page)
+        calls += 1
+        if cursor == 0:
+            return keys, calls
+
+def test_scan_returns_every_key_once():
+    store = EmbeddedStore(expiry_interval=60)
+    store.mset({f"k{i}": i for i in range(250)})
+    keys, _ = _scan_all(store, count=20)
+    assert sorted(keys) == sorted(f"k{i}" for i in range(250))
+
+def test_scan_count_bounds_slots_examined_not_matches():
+    store = EmbeddedStore(expiry_interval=60)
+    store.mset({f"k{i}": i for i in range(1000)})
+    store.set("needle", "x")
+    cursor, keys = store.scan(cursor=0, match="needle", count=10)
+    assert keys == []
+    assert cursor != 0
+    keys, calls = _scan_all(store, match="needle", count=100)
+    assert keys == ["needle"]
+    assert calls == 11
+
+def test_scan_type_filter():
+    store = EmbeddedStore(expiry_interval=60)
+    store.set("s", "v")
+    store.hset("h", "f", "v")
+    store.rpush("l", "v")
+    keys, _ = _scan_all(store, _type="hash")
+    assert keys == ["h"]
+
+def test_scan_keeps_keys_present_throughout_across_deletes_and_compaction():
+    store = EmbeddedStore(expiry_interval=60)
+    store.mset({f"k{i}": i for i in range(3000)})
+    survivors = {f"k{i}" for i in range(0, 3000, 3)}
+    seen = set()
+    cursor, page = store.scan(cursor=0, count=500)
+    seen.update(page)
+    # Deleting two thirds of the keys compacts the slot table, invalidating the cursor
+    store.delete(*(f"k{i}" for i in range(3000) if f"k{i}" not in survivors))
+    store._maybe_compact()
+    while cursor != 0:
+        cursor, page = store.scan(cursor=cursor, count=500)
+        seen.update(page)
+    assert survivors <= seen
+
+# ===================== LISTS AND SETS =====================
+
+def test_set_commands():
+    store = EmbeddedStore(expiry_interval=60)
+    assert store.sadd("s", "a", "b", "a") == 2
+    assert store.sadd("s", "b", "c") == 1
+    assert store.smembers("s") == {"a", "b", "c"}
+    assert store.scard("s") == 3 and store.sismember("s", "a")
+    assert store.srem("s", "a", "missing") == 1
+    assert store.srem("s", "b", "c") == 2
+    assert store.exists("s") == 0 and store.smembers("s") == set()
+    store.set("str", "v")
+    with pytest.raises(redis.exceptions.ResponseError):
+        store.sadd("str", "x")
+
+def test_lmove_moves_between_ends_and_rotates():
+    store = EmbeddedStore(expiry_interval=60)
+    store.rpush("src", "a", "b", "c")
+    assert store.lmove("src", "dst", "LEFT", "RIGHT") == "a"
+    assert store.lmove("src", "dst", "RIGHT", "LEFT") == "c"
+    assert store.lrange("dst", 0, -1) == ["c", "a"]
+    assert store.lmove("dst", "dst", "LEFT", "RIGHT") == "c"
+    assert store.lrange("dst", 0, -1) == ["a", "c"]
+    assert store.lmove("src", "dst") == "b"
+    assert store.exists("src") == 0 and store.lmove("src", "dst") is None
+
+def test_lmove_checks_the_destination_type_before_popping():
+    store = EmbeddedStore(expiry_interval=60)
+    store.rpush("src", "a")
+    store.set("str", "v")
+    with pytest.raises(redis.exceptions.ResponseError):
+        store.lmove("src", "str")
+    assert store.lrange("src", 0, -1) == ["a"]
+
+def test_lrem_counts_from_either_end():
+    store = EmbeddedStore(expiry_interval=60)
+    store.rpush("l", "x", "a", "x", "b", "x")
+    assert store.lrem("l", 1, "x") == 1
+    assert store.lrange("l", 0, -1) == ["a", "x", "b", "x"]
+    assert store.lrem("l", -1, "x") == 1
+    assert store.lrange("l", 0, -1) == ["a", "x", "b"]
+    assert store.lrem("l", 0, "x") == 1 and store.lrem("l", 0, "x") == 0
+    assert store.lrem("l", 0, "a") + store.lrem("l", 0, "b") == 2
+    assert store.exists("l") == 0
+
+def test_blpop_times_out_and_wakes_on_push():
+    store = EmbeddedStore(expiry_interval=60)
+    started = time.monotonic()
+    assert store.blpop(["q"], timeout=0.05) is None
+    assert time.monotonic() - started >= 0.05
+
+    threading.Timer(0.05, store.rpush, ("q2", "item")).start()
+    assert store.blpop(["q", "q2"], timeout=5) == ("q2", "item")
+    assert store.exists("q2") == 0
+
+def test_blmove_waits_for_the_source():
+    store = EmbeddedStore(expiry_interval=60)
+    assert store.blmove("q", "processing", 0.05) is None
+    threading.Timer(0.05, store.rpush, ("q", "a", "b")).start()
+    assert store.blmove("q", "processing", 5, "LEFT", "RIGHT") == "a"
+    assert store.lrange("processing", 0, -1) == ["a"]
+    assert store.lrange("q", 0, -1) == ["b"]
+
+def test_dump_and_restore_a_set():
+    store = EmbeddedStore(expiry_interval=60)
+    store.sadd("s", "a", "b")
+    store.restore("copy", 0, store.dump("s"))
+    assert store.smembers("copy") == {"a", "b"}
+
+# ===================== KEYSPACE NOTIFICATIONS =====================
+
+def _events(pubsub):
+    events = []
+    while (message := pubsub.get_message()) is not None:
+        events.append((message["channel"].split(":", 1)[1], message["data"]))
+    return events
+
+def test_keyspace_notifications_follow_the_configured_classes():
+    store = EmbeddedStore(expiry_interval=60)
+    pubsub = store.pubsub(ignore_subscribe_messages=True)
+    assert enable_keyspace_events(store, pubsub, "Kg$l") is True
+    assert store.config_get("notify-keyspace-events") == {"notify-keyspace-events": "$Kgl"}
+
+    store.set("s", "v", ex=10)
+    store.rpush("q", "a")
+    store.lmove("q", "p")
+    store.hset("h", "f", "1")   # hash events were not enabled
+    store.delete("s")
+    assert _events(pubsub) == [("s", "set"), ("s", "expire"), ("q", "rpush"), ("q", "lpop"),
+                               ("p", "rpush"), ("q", "del"), ("s", "del")]
+
+def test_keyspace_notifications_report_expiry_and_stop_after_punsubscribe():
+    store = EmbeddedStore(expiry_interval=0.01)
+    pubsub = store.pubsub(ignore_subscribe_messages=True)
+    enable_keyspace_events(store, pubsub, "Kx")
+    store.set("k", "v", px=10)
+    time.sleep(0.1)
+    assert _events(pubsub) == [("k", "expired")]
+    pubsub.punsubscribe()
+    store.set("k", "v")
+    assert store.publish("__keyspace@0__:k", "set") == 0
+    assert _events(pubsub) == []
+
+# ===================== AOF =====================
+
+def _populate(store):
+    store.set("s", "v")
+    store.set("ttl", "v", ex=100)
+    store.mset({"m1": "a", "m2": "b"})
+    store.incr("n", 5)
+    store.decr("n")
+    store.hset("h", mapping={"a": "1", "b": "2"})
+    store.hdel("h", "a")
+    store.hincrby("h", "c", 3)
+    store.rpush("l", "a", "b", "c")
+    store.lpush("l", "z")
+    store.lpop("l")
+    store.rpush("l", "a", "d")
+    store.lrem("l", -1, "a")
+    store.lmove("l", "moved", "LEFT", "RIGHT")
+    store.sadd("set", "a", "b", "c")
+    store.srem("set", "b")
+    store.xadd("x", {"f": "1"})
+    store.xadd("x", {"f": "2"})
+    store.delete("m2")
+
+def test_aof_replay_restores_the_dataset(aof_path):
+    store = EmbeddedStore(aof_path=aof_path, aof_fsync="always", expiry_interval=60)
+    _populate(store)
+    expected = _contents(store)
+    store.close()
+
+    reloaded = EmbeddedStore(aof_path=aof_path, expiry_interval=60)
+    assert _contents(reloaded) == expected
+    assert 0 < reloaded.ttl("ttl") <= 100
+
+def test_aof_replay_ignores_a_torn_final_line(aof_path):
+    store = EmbeddedStore(aof_path=aof_path, aof_fsync="always", expiry_interval=60)
+    store.set("a", "1")
+    store.close()
+    with open(aof_path, "a", encoding="utf-8") as f:
+        f.write('["set","b"')
+    assert _contents(EmbeddedStore(aof_path=aof_path, expiry_interval=60)) == {"a": ("string", "1")}
+
+def test_aof_rewrite_compacts_the_log(aof_path):
+    store = EmbeddedStore(aof_path=aof_path, aof_fsync="always", expiry_interval=60)
+    for i in range(100):
+        store.incr("counter")
+    _populate(store)
+    expected = _contents(store)
+    assert store.bgrewriteaof() is True
+    _wait_for_rewrite(store)
+    store.close()
+
+    with open(aof_path, encoding="utf-8") as f:
+        assert sum(1 for _ in f) < 20
+    assert _contents(EmbeddedStore(aof_path=aof_path, expiry_interval=60)) == expected
+
+def test_aof_rewrite_is_a_point_in_time_image_plus_later_writes(aof_path, monkeypatch):
+    monkeypatch.setattr(embedded_store, "_SNAPSHOT_CHUNK", 2)
+    store = EmbeddedStore(aof_path=aof_path, aof_fsync="always", expiry_interval=60)
+    for i in range(10):
+        store.set(f"n{i}", "0")
+    store.rpush("q", "a")
+    walk = store._aof._snapshot_fn
+    steps = []
+
+    def walk_with_writes(cursor, skip):
+        # Writes land between locked steps of the walk, on keys both behind and ahead of it
+        steps.append(cursor)
+        if len(steps) == 2:
+            store.incr("n0")        # already copied
+            store.incr("n9")        # not reached yet: copied as it was, then replayed
+            store.incr("n9")
+            store.incr("fresh")     # created mid-rewrite
+            store.rpush("q", "b")
+            store.delete("n7")
+        return walk(cursor, skip)
+
+    monkeypatch.setattr(store._aof, "_snapshot_fn", walk_with_writes)
+    store.bgrewriteaof()
+    _wait_for_rewrite(store)
+    expected = _contents(store)
+    store.close()
+
+    assert len(steps) > 2
+    reloaded = EmbeddedStore(aof_path=aof_path, expiry_interval=60)
+    assert _contents(reloaded) == expected
+    assert reloaded.get("n9") == "2" and reloaded.get("fresh") == "1"
+    assert reloaded.lrange("q", 0, -1) == ["a", "b"]
+
+def test_wrongtype_errors_are_not_logged(aof_path):
+    store = EmbeddedStore(aof_path=aof_path, aof_fsync="always", expiry_interval=60)
+    store.set("s", "v")
+    with pytest.raises(redis.exceptions.ResponseError):
+        store.rpush("s", "x")
+    store.close()
+    assert _contents(EmbeddedStore(aof_path=aof_path, expiry_interval=60)) == {"s": ("string", "v")}